@@ -0,0 +1 @@
+"""Benchmarks for the asset lending contracts."""
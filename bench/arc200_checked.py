@@ -0,0 +1,123 @@
+from algopy import (
+    Asset,
+    Global,
+    Txn,
+    UInt64,
+    arc4,
+    gtxn,
+    itxn,
+)
+from contract import AssetLending, LoanFunded, LoanLent
+from utils import (
+    arc200_transfer_from,
+    require_asset_transfer_txn,
+    require_payment_txn,
+)
+
+class ARC200CheckedLending(AssetLending):
+    ##############################################
+    # function: fund
+    # arguments:
+    # - payment, a 0 pay
+    # - lend_amount, the amount to lend
+    # - lend_payback, the amount to pay back
+    # - lend_time, the time to pay back
+    # purpose: fund the contract the way ARC-200
+    #          loans were funded before escrow
+    # post-conditions: lend_status funded
+    # notes:
+    # - benchmark only, reads arc200_balanceOf
+    #   and arc200_allowance and keeps no tokens,
+    #   so AssetLending's escrow can be compared
+    #   with it
+    # - lend_type 3 only
+    ##############################################
+    @arc4.abimethod
+    def fund(
+        self,
+        payment: gtxn.Transaction,
+        lend_amount: arc4.UInt64,
+        lend_payback: arc4.UInt64,
+        lend_time: arc4.UInt64,
+    ) -> None:
+        loan = self.loan.copy()
+        ##########################################
+        assert loan.lend_status == arc4.UInt8(1), "lend_status not setup"
+        assert loan.lend_type == arc4.UInt8(3), "lend_type accurate"
+        ##########################################
+        payment_amount = require_payment_txn(Txn.sender, gtxn.PaymentTransaction(payment.group_index))
+        assert payment_amount == UInt64(0), "payment amount accurate"
+        arc200_balanceOf_call = itxn.ApplicationCall(
+            app_id=loan.lend_payment_asset_id.native,
+            app_args=(
+                arc4.arc4_signature("arc200_balanceOf(address)uint256"),
+                Txn.sender
+            ),
+        ).submit()
+        arc200_balanceOf = arc4.UInt256.from_log(arc200_balanceOf_call.last_log)
+        assert arc200_balanceOf.native >= lend_amount.native, "arc200_balanceOf accurate"
+        arc200_allowance_call = itxn.ApplicationCall(
+            app_id=loan.lend_payment_asset_id.native,
+            app_args=(
+                arc4.arc4_signature("arc200_allowance(address,address)uint256"),
+                Txn.sender,
+                Global.current_application_address
+            ),
+        ).submit()
+        arc200_allowance = arc4.UInt256.from_log(arc200_allowance_call.last_log)
+        assert arc200_allowance.native >= lend_amount.native, "arc200_allowance accurate"
+        assert lend_payback > lend_amount, "lend_payback accurate"
+        assert lend_time > UInt64(0), "lend_time accurate"
+        ##########################################
+        loan.lender = arc4.Address(Txn.sender)
+        loan.lend_amount = lend_amount
+        loan.lend_payback = lend_payback
+        loan.lend_time = lend_time
+        loan.lend_status = arc4.UInt8(2)
+        self.loan = loan.copy()
+        arc4.emit(LoanFunded(
+            loan_id=arc4.UInt64(0),
+            lender=loan.lender,
+            lend_amount=loan.lend_amount,
+            lend_payback=loan.lend_payback,
+            lend_time=loan.lend_time,
+        ))
+
+    ##############################################
+    # function: lend_nft
+    # arguments:
+    # - axfer, the transfer of the nft
+    # purpose: lend the nft, paying the borrower
+    #          from the lender's allowance
+    # post-conditions: lend_status lent
+    # notes:
+    # - benchmark only, see fund
+    ##############################################
+    @arc4.abimethod
+    def lend_nft(
+        self,
+        axfer: gtxn.AssetTransferTransaction,
+    ) -> None:
+        loan = self.loan.copy()
+        ##########################################
+        assert loan.lend_status == arc4.UInt8(2), "lend_status not funded"
+        ##########################################
+        axfer_amount = require_asset_transfer_txn(Txn.sender, axfer, Asset(loan.lend_asset_id.native))
+        assert axfer_amount == UInt64(1), "axfer amount accurate"
+        ##########################################
+        arc200_transfer_from(
+            loan.lend_payment_asset_id.native,
+            loan.lender.native,
+            Txn.sender,
+            loan.lend_amount.native
+        )
+        ##########################################
+        loan.borrower = arc4.Address(Txn.sender)
+        loan.lend_date = arc4.UInt64(Global.latest_timestamp)
+        loan.lend_status = arc4.UInt8(3)
+        self.loan = loan.copy()
+        arc4.emit(LoanLent(
+            loan_id=arc4.UInt64(0),
+            borrower=loan.borrower,
+            lend_date=loan.lend_date,
+        ))
@@ -0,0 +1,117 @@
+from algopy import (
+    ARC4Contract,
+    Account,
+    BoxMap,
+    Bytes,
+    Global,
+    Txn,
+    arc4,
+)
+
+class ARC200Token(ARC4Contract):
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments: None
+    # purpose: construct initial state
+    # pre-conditions: None
+    # post-conditions: initial state set
+    # notes:
+    # - minimal arc200 token used as the payment
+    #   asset of ARC-200 loans in benchmarks
+    ##############################################
+    def __init__(self) -> None:
+        self.balances = BoxMap(Account, arc4.UInt256, key_prefix="b")
+        self.approvals = BoxMap(Bytes, arc4.UInt256, key_prefix="a")
+
+    ##############################################
+    # function: mint
+    # arguments:
+    # - to, the account to mint to
+    # - value, the amount to mint
+    # purpose: mint tokens
+    # pre-conditions: sender is creator
+    # post-conditions: balance increased
+    ##############################################
+    @arc4.abimethod
+    def mint(self, to: arc4.Address, value: arc4.UInt256) -> None:
+        assert Txn.sender == Global.creator_address, "sender accurate"
+        balance = self.balances.get(to.native, default=arc4.UInt256(0))
+        self.balances[to.native] = arc4.UInt256(balance.native + value.native)
+
+    ##############################################
+    # function: arc200_balanceOf
+    # arguments:
+    # - owner, the account to query
+    # returns: balance of owner
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def arc200_balanceOf(self, owner: arc4.Address) -> arc4.UInt256:
+        return self.balances.get(owner.native, default=arc4.UInt256(0))
+
+    ##############################################
+    # function: arc200_allowance
+    # arguments:
+    # - owner, the account holding tokens
+    # - spender, the account allowed to spend
+    # returns: allowance of spender over owner
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def arc200_allowance(self, owner: arc4.Address, spender: arc4.Address) -> arc4.UInt256:
+        return self.approvals.get(owner.bytes + spender.bytes, default=arc4.UInt256(0))
+
+    ##############################################
+    # function: arc200_approve
+    # arguments:
+    # - spender, the account allowed to spend
+    # - value, the allowance
+    # purpose: set allowance of spender
+    # returns: success
+    ##############################################
+    @arc4.abimethod
+    def arc200_approve(self, spender: arc4.Address, value: arc4.UInt256) -> arc4.Bool:
+        self.approvals[Txn.sender.bytes + spender.bytes] = value
+        return arc4.Bool(True)
+
+    ##############################################
+    # function: arc200_transfer
+    # arguments:
+    # - to, the account to transfer to
+    # - value, the amount to transfer
+    # purpose: transfer from the sender
+    # returns: success
+    ##############################################
+    @arc4.abimethod
+    def arc200_transfer(self, to: arc4.Address, value: arc4.UInt256) -> arc4.Bool:
+        from_balance = self.balances.get(Txn.sender, default=arc4.UInt256(0))
+        assert from_balance.native >= value.native, "arc200_balanceOf accurate"
+        self.balances[Txn.sender] = arc4.UInt256(from_balance.native - value.native)
+        to_balance = self.balances.get(to.native, default=arc4.UInt256(0))
+        self.balances[to.native] = arc4.UInt256(to_balance.native + value.native)
+        return arc4.Bool(True)
+
+    ##############################################
+    # function: arc200_transferFrom
+    # arguments:
+    # - from_, the account to transfer from
+    # - to, the account to transfer to
+    # - value, the amount to transfer
+    # purpose: transfer using allowance
+    # returns: success
+    ##############################################
+    @arc4.abimethod
+    def arc200_transferFrom(
+        self,
+        from_: arc4.Address,
+        to: arc4.Address,
+        value: arc4.UInt256,
+    ) -> arc4.Bool:
+        approval_key = from_.bytes + Txn.sender.bytes
+        allowance = self.approvals.get(approval_key, default=arc4.UInt256(0))
+        assert allowance.native >= value.native, "arc200_allowance accurate"
+        from_balance = self.balances.get(from_.native, default=arc4.UInt256(0))
+        assert from_balance.native >= value.native, "arc200_balanceOf accurate"
+        self.approvals[approval_key] = arc4.UInt256(allowance.native - value.native)
+        self.balances[from_.native] = arc4.UInt256(from_balance.native - value.native)
+        to_balance = self.balances.get(to.native, default=arc4.UInt256(0))
+        self.balances[to.native] = arc4.UInt256(to_balance.native + value.native)
+        return arc4.Bool(True)
@@ -0,0 +1,263 @@
+"""Check the client/model.py state machine against the compiled contracts.
+
+Random traces of calls, valid and invalid (boundary amounts, wrong callers,
+short payments and allowances, out of order methods), are run through
+LoanModel and through real AssetLending apps of every lend_type on LocalNet. Every step must succeed or fail in both,
+with the same assert message, and every successful step must leave the same
+loan state.
+
+    algokit localnet start
+    python -m bench.consistency --traces 20 --seed 1
+"""
+import argparse
+import random
+import re
+import sys
+
+from algosdk import transaction
+
+from bench.methods import (
+    LEND_PAYBACK,
+    LOCALNET_ALGOD,
+    LOCALNET_KMD,
+    LOCALNET_TOKEN,
+    App,
+    LendingBench,
+    LocalNet,
+    load_app_spec,
+)
+from client.loan import ZERO_ADDRESS, decode_global_state
+from client.model import LoanModel, ModelError
+
+METHODS = ("fund", "lend_nft", "pay_debt", "pay_installment", "rollover", "claim_nft", "claim_debt", "close")
+NEXT = {
+    1: ("fund",),
+    2: ("lend_nft",),
+    3: ("pay_debt", "pay_installment", "rollover", "claim_nft"),
+    4: ("claim_debt",),
+    5: ("close",),
+}
+FAILURE = re.compile(r"logic eval error: (.*?)\. Details: app=(\d+), pc=(\d+)")
+
+
+class TraceRunner(LendingBench):
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - node, the LocalNet node
+    # - spec, the lending contract
+    # - lend_type, 1 network, 2 asa, 3 arc200
+    # - rng, the random source
+    # purpose: prepare accounts for traces
+    ##############################################
+    def __init__(self, node: LocalNet, spec, lend_type: int, rng: random.Random) -> None:
+        super().__init__(node, spec, lend_type)
+        self.rng = rng
+        self.mismatches: list[str] = []
+        self.steps = 0
+
+    def _top_up(self) -> None:
+        if self.lend_type == 2:
+            self.node.transfer(self.lender, self.borrower.address, self.lend_payment_asset_id, LEND_PAYBACK)
+        if self.lend_type == 3:
+            for holder in (self.lender, self.borrower):
+                self.token.call("mint", self.lender, (holder.address, LEND_PAYBACK))
+
+    def _now(self) -> int:
+        last_round = self.node.algod.status()["last-round"]
+        return self.node.algod.block_info(last_round)["block"]["ts"]
+
+    def _failure(self, error: Exception, apps: dict[int, App]) -> str:
+        matches = FAILURE.findall(str(error))
+        if not matches:
+            return str(error)
+        message, app_id, pc = matches[-1]
+        app = apps.get(int(app_id))
+        if app is not None:
+            return app.spec.approval.pc_messages.get(int(pc), message)
+        return message
+
+    def _caller(self, expected):
+        if self.rng.random() < 0.3:
+            return self.rng.choice((self.lender, self.borrower))
+        return expected
+
+    ##############################################
+    # function: _step
+    # arguments:
+    # - app, the loan app
+    # - model, the loan model
+    # - method, the method to call
+    # - lend_asset_id, the nft
+    # purpose: run one call on both
+    # returns: model and chain outcome, None when
+    #          the call succeeded
+    ##############################################
+    def _step(self, app: App, model: LoanModel, method: str, lend_asset_id: int):
+        apps = {app.app_id: app}
+        if self.lend_type == 3:
+            apps[self.token.app_id] = self.token
+        now = self._now()
+        pre = None
+        pre_sender = None
+        args: tuple = ()
+        on_complete = transaction.OnComplete.NoOpOC
+        if method == "fund":
+            sender = self.lender
+            lend_amount = self.rng.choice((2_000_000, 2_000_001, 3_000_000))
+            lend_payback = lend_amount + self.rng.choice((0, 1, 2_000_000, 2_000_001))
+            lend_time = self.rng.choice((0, 1, 3600))
+            payment_amount = lend_amount - (self.rng.random() < 0.2)
+            allowance = lend_amount - (self.rng.random() < 0.2)
+            args = (lend_amount, lend_payback, lend_time)
+            if self.lend_type == 3:
+                self._approve(app, sender, allowance)
+                payment_amount = 0
+            pre = self._payment(sender, app, payment_amount)
+            run_model = lambda: model.fund(
+                sender.address, lend_amount, lend_payback, lend_time,
+                payment_amount=payment_amount, allowance=allowance,
+            )
+        elif method == "lend_nft":
+            sender = self.borrower
+            pre = lambda sp: transaction.AssetTransferTxn(sender.address, sp, app.address, 1, lend_asset_id)
+            run_model = lambda: model.lend_nft(sender.address, now)
+        elif method == "pay_debt":
+            sender = self._caller(self.borrower)
+            allowance = max(0, model.lend_payback - model.lend_paid - (self.rng.random() < 0.2))
+            payment_amount = allowance
+            if self.lend_type == 3:
+                self._approve(app, sender, allowance)
+                payment_amount = 0
+            pre = self._payment(sender, app, payment_amount)
+            run_model = lambda: model.pay_debt(
+                sender.address, payment_amount=payment_amount, allowance=allowance,
+            )
+        elif method == "pay_installment":
+            sender = self._caller(self.borrower)
+            remaining = model.lend_payback - model.lend_paid
+            amount = self.rng.choice((0, 1, remaining // 2, remaining, remaining + 1))
+            allowance = max(0, amount - (self.rng.random() < 0.2))
+            payment_amount = allowance
+            args = (amount,)
+            if self.lend_type == 3:
+                self._approve(app, sender, allowance)
+                payment_amount = 0
+            pre = self._payment(sender, app, payment_amount)
+            run_model = lambda: model.pay_installment(
+                sender.address, amount, payment_amount=payment_amount, allowance=allowance,
+            )
+        elif method == "rollover":
+            sender = self._caller(self.lender)
+            # the borrower pays, or the lender in its place
+            pre_sender = self._caller(self.borrower)
+            lend_time = self.rng.choice((0, 3600))
+            interest = model.lend_payback - model.lend_amount
+            allowance = max(0, interest - (self.rng.random() < 0.2))
+            payment_amount = allowance
+            args = (lend_time,)
+            if self.lend_type == 3:
+                self._approve(app, self.borrower, allowance)
+                payment_amount = 0
+            pre = self._payment(pre_sender, app, payment_amount)
+            run_model = lambda: model.rollover(
+                sender.address, lend_time,
+                payment_sender=pre_sender.address, payment_amount=payment_amount, allowance=allowance,
+            )
+        elif method == "claim_nft":
+            sender = self._caller(self.lender)
+            run_model = lambda: model.claim_nft(sender.address, now)
+        elif method == "claim_debt":
+            sender = self._caller(self.lender)
+            run_model = lambda: model.claim_debt(sender.address)
+        else:
+            sender = self.lender
+            on_complete = transaction.OnComplete.DeleteApplicationOC
+            run_model = model.close
+        try:
+            run_model()
+            expected = None
+        except ModelError as e:
+            expected = str(e)
+        try:
+            app.call(method, sender, args, pre=pre, on_complete=on_complete, pre_sender=pre_sender)
+            actual = None
+        except RuntimeError as e:
+            actual = self._failure(e, apps)
+        return expected, actual
+
+    def _compare(self, app: App, model: LoanModel, label: str) -> None:
+        info = self.node.algod.application_info(app.app_id)
+        loan = decode_global_state(info["params"]["global-state"])._asdict()
+        expected = model.fields()
+        expected["lender"] = expected["lender"] or ZERO_ADDRESS
+        expected["borrower"] = expected["borrower"] or ZERO_ADDRESS
+        for name, value in expected.items():
+            if loan[name] != value:
+                self.mismatches.append(f"{label} {name}: model {value}, chain {loan[name]}")
+
+    ##############################################
+    # function: run_trace
+    # arguments:
+    # - index, the trace number
+    # - max_steps, calls per trace
+    # purpose: run one random trace on both
+    ##############################################
+    def run_trace(self, index: int, max_steps: int = 10) -> None:
+        self._top_up()
+        app, lend_asset_id = self._deploy()
+        model = LoanModel(self.lend_type)
+        app.call("setup", self.lender, (self.lend_type, self.lend_payment_asset_id, lend_asset_id))
+        model.setup(self.lend_payment_asset_id, lend_asset_id)
+        for step in range(max_steps):
+            choices = list(NEXT.get(model.lend_status, METHODS))
+            if self.rng.random() < 0.3:
+                choices = list(METHODS)
+            if model.lend_status > 2:
+                # the app has opted out of or already holds
+                # the nft, so the axfer fails before the call
+                choices = [m for m in choices if m != "lend_nft"] or ["claim_debt"]
+            if model.lend_status == 3 and model.lend_time == 1 and self.rng.random() < 0.5:
+                self.node.advance(3)
+            elif model.lend_status == 3 and model.lend_time == 1:
+                # too close to expiry to agree on the timestamp
+                choices = [m for m in choices if m != "claim_nft"] or ["pay_debt"]
+            method = self.rng.choice(choices)
+            label = f"{self.spec.name}/{self.lend_type} trace {index} step {step} {method}"
+            expected, actual = self._step(app, model, method, lend_asset_id)
+            self.steps += 1
+            if expected != actual:
+                self.mismatches.append(f"{label}: model {expected!r}, chain {actual!r}")
+                return
+            if actual is None and method == "close":
+                return
+            self._compare(app, model, label)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--algod-server", default=LOCALNET_ALGOD)
+    parser.add_argument("--kmd-server", default=LOCALNET_KMD)
+    parser.add_argument("--token", default=LOCALNET_TOKEN)
+    parser.add_argument("--traces", type=int, default=10, help="traces per contract")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    node = LocalNet(args.algod_server, args.kmd_server, args.token)
+    rng = random.Random(args.seed)
+    mismatches = []
+    spec = load_app_spec(node.algod, "AssetLending")
+    for lend_type in (1, 2, 3):
+        name = f"AssetLending/{lend_type}"
+        runner = TraceRunner(node, spec, lend_type, rng)
+        for index in range(args.traces):
+            runner.run_trace(index)
+        print(f"{name}: {runner.steps} steps, {len(runner.mismatches)} mismatches")
+        mismatches += runner.mismatches
+    for mismatch in mismatches:
+        print(f"mismatch: {mismatch}", file=sys.stderr)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
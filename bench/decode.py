@@ -0,0 +1,245 @@
+"""Decoding throughput of loan dumps, global state and ABI logs.
+
+A dump of random LoanSnapshot records (the get_loans record layout) is
+written once and decoded with client.loan, the per-record decoder, and with
+client.stream, the streaming memoryview decoder. The benchmark also times
+base64 global-state entries, batched get_loans returns, ARC-200 uint256
+return logs and loan event logs.
+No network is needed.
+
+    python -m bench.decode --loans 2000000
+    python -m bench.decode --loans 5000000 --dump /tmp/loans.bin --json decode.json
+
+Throughput is records decoded per second, best of --repeat runs.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Iterable
+
+import numpy as np
+
+from client.aio import RETURN_PREFIX
+from client.analytics import LOAN_DTYPE
+from client.events import EVENTS, decode_event, event_selector
+from client.loan import LOAN_KEY, LOAN_SIZE, decode_global_state, decode_loan, decode_snapshots
+from client.stream import (
+    SNAPSHOT_LAYOUT,
+    iter_dump,
+    iter_events,
+    iter_global_states,
+    iter_returns,
+    iter_snapshots,
+    iter_uint256,
+)
+
+SNAPSHOT_DTYPE = np.dtype([("loan_id", ">u8"), ("loan", LOAN_DTYPE), ("lend_expiry", ">u8")])
+assert SNAPSHOT_DTYPE.itemsize == SNAPSHOT_LAYOUT.size
+
+
+##############################################
+# function: write_dump
+# arguments:
+# - path, the dump file
+# - loans, records to write
+# - seed, the random seed
+# - chunk, records generated at a time
+# purpose: write random LoanSnapshot records
+##############################################
+def write_dump(path: Path, loans: int, seed: int = 0, chunk: int = 1 << 18) -> None:
+    rng = np.random.default_rng(seed)
+    with path.open("wb") as f:
+        for start in range(0, loans, chunk):
+            n = min(chunk, loans - start)
+            rows = np.zeros(n, SNAPSHOT_DTYPE)
+            loan = rows["loan"]
+            rows["loan_id"] = np.arange(start, start + n)
+            loan["lender"] = rng.integers(0, 256, (n, 32), np.uint8).view("V32").ravel()
+            loan["borrower"] = rng.integers(0, 256, (n, 32), np.uint8).view("V32").ravel()
+            loan["lend_type"] = rng.integers(1, 4, n)
+            loan["lend_status"] = rng.integers(0, 6, n)
+            loan["lend_payment_asset_id"] = rng.integers(0, 1 << 32, n)
+            loan["lend_asset_id"] = rng.integers(1, 1 << 32, n)
+            loan["lend_amount"] = rng.integers(2_000_001, 1 << 40, n)
+            loan["lend_paid"] = rng.integers(0, 1 << 40, n)
+            loan["lend_payback"] = loan["lend_amount"] + rng.integers(2_000_001, 1 << 40, n)
+            loan["lend_date"] = rng.integers(1_600_000_000, 1_800_000_000, n)
+            loan["lend_time"] = rng.integers(1, 1 << 24, n)
+            rows["lend_expiry"] = loan["lend_date"] + loan["lend_time"]
+            rows.tofile(f)
+
+
+def _per_record(path: Path) -> int:
+    count = 0
+    data = path.read_bytes()
+    size = SNAPSHOT_LAYOUT.size
+    for offset in range(0, len(data), size):
+        decode_loan(data[offset + 8:offset + 8 + LOAN_SIZE])
+        count += 1
+    return count
+
+
+def _streamed(path: Path) -> int:
+    count = 0
+    for _ in iter_dump(path):
+        count += 1
+    return count
+
+
+def _global_states(sample: bytes) -> tuple[Callable[[], int], Callable[[], int]]:
+    key = base64.b64encode(LOAN_KEY).decode()
+    size = SNAPSHOT_LAYOUT.size
+    apps = [
+        {"id": i, "params": {"global-state": [
+            {"key": key, "value": {"bytes": base64.b64encode(sample[offset + 8:offset + 8 + LOAN_SIZE]).decode()}},
+        ]}}
+        for i, offset in enumerate(range(0, len(sample), size))
+    ]
+
+    def per_record() -> int:
+        for app in apps:
+            decode_global_state(app["params"]["global-state"])
+        return len(apps)
+
+    def streamed() -> int:
+        return sum(1 for _ in iter_global_states(apps))
+
+    return per_record, streamed
+
+
+def _uint256_returns(count: int, seed: int) -> list[bytes]:
+    rng = random.Random(seed)
+    return [RETURN_PREFIX + rng.getrandbits(256).to_bytes(32, "big") for _ in range(count)]
+
+
+def _events(count: int, seed: int) -> list[bytes]:
+    rng = random.Random(seed)
+    args, _, _ = EVENTS["LoanFunded"]
+    selector = event_selector("LoanFunded", args)
+    return [
+        selector + i.to_bytes(8, "big") + os.urandom(32) + rng.getrandbits(64).to_bytes(8, "big") * 3
+        for i in range(count)
+    ]
+
+
+##############################################
+# function: best_rate
+# arguments:
+# - run, decodes and returns the record count
+# - repeat, the number of runs
+# purpose: time a decoder
+# returns: records per second, best run
+##############################################
+def best_rate(run: Callable[[], int], repeat: int) -> float:
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = run()
+        seconds = time.perf_counter() - start
+        best = max(best, count / seconds if seconds else float("inf"))
+    return best
+
+
+def _count(records: Iterable) -> int:
+    return sum(1 for _ in records)
+
+
+def _batched_returns(sample: bytes, per_call: int) -> list[bytes]:
+    size = SNAPSHOT_LAYOUT.size
+    step = per_call * size
+    return [
+        RETURN_PREFIX + (len(sample[i:i + step]) // size).to_bytes(2, "big") + sample[i:i + step]
+        for i in range(0, len(sample), step)
+    ]
+
+
+##############################################
+# function: run
+# arguments:
+# - args, the parsed arguments
+# - path, the dump file
+# purpose: time every decoder
+# returns: report of records per second
+##############################################
+def run(args: argparse.Namespace, path: Path) -> dict:
+    if not path.exists() or path.stat().st_size != args.loans * SNAPSHOT_LAYOUT.size:
+        write_dump(path, args.loans, args.seed)
+    sample_count = min(args.loans, args.sample)
+    with path.open("rb") as f:
+        sample = f.read(sample_count * SNAPSHOT_LAYOUT.size)
+    state_per_record, state_streamed = _global_states(sample)
+    batched = _batched_returns(sample, args.per_call)
+    returns = _uint256_returns(sample_count, args.seed)
+    events = _events(sample_count, args.seed)
+    return {
+        "dump": {
+            "records": args.loans,
+            "per_record": best_rate(lambda: _per_record(path), args.repeat),
+            "streamed": best_rate(lambda: _streamed(path), args.repeat),
+        },
+        "global_state": {
+            "records": sample_count,
+            "per_record": best_rate(state_per_record, args.repeat),
+            "streamed": best_rate(state_streamed, args.repeat),
+        },
+        "get_loans_returns": {
+            "records": sample_count,
+            "per_record": best_rate(
+                lambda: sum(len(decode_snapshots(log[4:])) for log in batched), args.repeat
+            ),
+            "streamed": best_rate(
+                lambda: sum(_count(iter_snapshots(value)) for value in iter_returns(batched)), args.repeat
+            ),
+        },
+        "uint256_returns": {
+            "records": sample_count,
+            "per_record": best_rate(lambda: len([int.from_bytes(log[4:], "big") for log in returns]), args.repeat),
+            "streamed": best_rate(lambda: _count(iter_uint256(returns)), args.repeat),
+        },
+        "events": {
+            "records": sample_count,
+            "per_record": best_rate(lambda: len([decode_event(log) for log in events]), args.repeat),
+            "streamed": best_rate(lambda: _count(iter_events(events)), args.repeat),
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    for name, result in report.items():
+        speedup = result["streamed"] / result["per_record"] if result["per_record"] else float("nan")
+        print(
+            f"{name:<17} {result['records']:>9} records  per record {result['per_record']:>12,.0f}/s  "
+            f"streamed {result['streamed']:>12,.0f}/s  x{speedup:.2f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--loans", type=int, default=2_000_000, help="records in the dump")
+    parser.add_argument("--sample", type=int, default=200_000, help="records of the in-memory benchmarks")
+    parser.add_argument("--per-call", type=int, default=16, help="snapshots per get_loans return")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dump", type=Path, help="dump file, kept and reused if given")
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    if args.dump:
+        report = run(args, args.dump)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            report = run(args, Path(tmp) / "loans.bin")
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
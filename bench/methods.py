@@ -0,0 +1,625 @@
+"""Per-method opcode cost and fee benchmark for the lending contracts.
+
+Every method of AssetLending is run, once per lend_type, through a repaid and
+a defaulted lifecycle on a LocalNet node, which needs no network access. Each call is simulated
+first, with an execution trace, to record its opcode cost, inner transaction
+count, state reads/writes and minimum fee, and is then submitted with exactly
+that fee so the next step sees the new state.
+
+    algokit localnet start
+    python -m bench.methods                      # compare with baseline
+    python -m bench.methods --update-baseline    # accept current costs
+
+Comparing fails when bench/baseline.json is missing (exit status 2) or lacks
+a method. The baseline is not committed yet because it can only be measured
+on LocalNet; bootstrap it once with the Dockerfile build, then
+`python -m bench.methods --update-baseline`, and commit the file (see the
+README).
+
+Contracts are read from artifacts/*.arc32.json (see the Dockerfile). The
+ARC-200 token used by ARC-200 loans is compiled from
+bench/arc200_token.py when its artifact is missing.
+
+ARC-200 loans escrow the lent tokens at fund. ARC200CheckedLending/3 runs
+the flow they replaced, compiled from bench/arc200_checked.py: fund reads
+arc200_balanceOf and arc200_allowance, and lend_nft pays the borrower with
+arc200_transferFrom from the lender. The difference between its fund,
+lend_nft, pay_debt and lifecycle entries and those of AssetLending/3 is
+printed after the report.
+"""
+import argparse
+import base64
+import json
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Callable
+
+from algosdk import abi, account, transaction
+from algosdk.atomic_transaction_composer import (
+    AccountTransactionSigner,
+    AtomicTransactionComposer,
+    TransactionWithSigner,
+)
+from algosdk.encoding import decode_address
+from algosdk.kmd import KMDClient
+from algosdk.logic import get_application_address
+from algosdk.source_map import SourceMap
+from algosdk.v2client.algod import AlgodClient
+from algosdk.v2client.models import SimulateRequest, SimulateTraceConfig
+
+from client.fees import MIN_FEE, call_fee, count_inner_txns
+
+ROOT = Path(__file__).resolve().parent.parent
+ARTIFACTS = ROOT / "artifacts"
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+# bench only contracts, compiled when their artifact is missing
+BENCH_SOURCES = {
+    "ARC200Token": ROOT / "bench" / "arc200_token.py",
+    "ARC200CheckedLending": ROOT / "bench" / "arc200_checked.py",
+}
+
+LOCALNET_ALGOD = "http://localhost:4001"
+LOCALNET_KMD = "http://localhost:4002"
+LOCALNET_TOKEN = "a" * 64
+
+SIMULATE_FEE = 32 * MIN_FEE
+LEND_AMOUNT = 3_000_000
+LEND_PAYBACK = 6_000_000
+
+READ_OPS = {
+    "app_global_get",
+    "app_global_get_ex",
+    "app_local_get",
+    "app_local_get_ex",
+    "box_get",
+    "box_extract",
+    "box_len",
+}
+WRITE_OPS = {
+    "app_global_put",
+    "app_global_del",
+    "app_local_put",
+    "app_local_del",
+    "box_put",
+    "box_replace",
+    "box_splice",
+    "box_create",
+    "box_resize",
+    "box_del",
+}
+METRICS = ("opcode_cost", "inner_txns", "state_reads", "state_writes", "fee")
+# methods a repaid loan always goes through, summed as "lifecycle"
+LIFECYCLE = ("fund", "lend_nft", "pay_debt")
+# the ARC-200 escrow flow and the checked flow it replaced
+ESCROW_FLOW = "AssetLending/3"
+CHECKED_FLOW = "ARC200CheckedLending/3"
+
+Build = Callable[[transaction.SuggestedParams, transaction.SuggestedParams], AtomicTransactionComposer]
+
+
+@dataclass
+class MethodCost:
+    contract: str
+    method: str
+    opcode_cost: int
+    inner_txns: int
+    state_reads: int
+    state_writes: int
+    fee: int
+
+
+@dataclass
+class Account:
+    private_key: str
+
+    @property
+    def address(self) -> str:
+        return account.address_from_private_key(self.private_key)
+
+    @property
+    def signer(self) -> AccountTransactionSigner:
+        return AccountTransactionSigner(self.private_key)
+
+
+class Program:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - algod, the algod client
+    # - teal, the program source
+    # purpose: compile teal and map pc to opcode
+    #          and to its assert message comment
+    ##############################################
+    def __init__(self, algod: AlgodClient, teal: str) -> None:
+        result = algod.compile(teal, source_map=True)
+        self.bytecode = base64.b64decode(result["result"])
+        lines = teal.splitlines()
+        source_map = SourceMap(result["sourcemap"])
+        self.pc_ops = {
+            pc: lines[line].split()[0]
+            for pc, line in source_map.pc_to_line.items()
+            if lines[line].split()
+        }
+        self.pc_messages = {
+            pc: lines[line].partition("//")[2].strip()
+            for pc, line in source_map.pc_to_line.items()
+            if "//" in lines[line]
+        }
+
+
+@dataclass
+class AppSpec:
+    name: str
+    contract: abi.Contract
+    approval: Program
+    clear: Program
+    global_uints: int
+    global_bytes: int
+
+    @property
+    def extra_pages(self) -> int:
+        size = len(self.approval.bytecode) + len(self.clear.bytecode)
+        return max(0, (size - 1) // 2048)
+
+
+##############################################
+# function: load_app_spec
+# arguments:
+# - algod, the algod client
+# - name, the contract name
+# purpose: load and compile an arc32 artifact
+# returns: AppSpec
+##############################################
+def load_app_spec(algod: AlgodClient, name: str) -> AppSpec:
+    source = BENCH_SOURCES.get(name)
+    if source and not (ARTIFACTS / f"{name}.arc32.json").exists():
+        subprocess.run(
+            ["algokit", "compile", "py", str(source), "--out-dir", str(ARTIFACTS)],
+            check=True,
+            cwd=ROOT,
+        )
+    spec = json.loads((ARTIFACTS / f"{name}.arc32.json").read_text())
+    return AppSpec(
+        name=name,
+        contract=abi.Contract.from_json(json.dumps(spec["contract"])),
+        approval=Program(algod, base64.b64decode(spec["source"]["approval"]).decode()),
+        clear=Program(algod, base64.b64decode(spec["source"]["clear"]).decode()),
+        global_uints=spec["state"]["global"]["num_uints"],
+        global_bytes=spec["state"]["global"]["num_byte_slices"],
+    )
+
+
+class LocalNet:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - algod_server, the algod url
+    # - kmd_server, the kmd url
+    # - token, the api token
+    # purpose: connect and find the dispenser
+    ##############################################
+    def __init__(self, algod_server: str, kmd_server: str, token: str) -> None:
+        self.algod = AlgodClient(token, algod_server)
+        self.kmd = KMDClient(token, kmd_server)
+        self.dispenser = self._dispenser()
+
+    def _dispenser(self) -> Account:
+        wallets = self.kmd.list_wallets()
+        wallet_id = next(w["id"] for w in wallets if w["name"] == "unencrypted-default-wallet")
+        handle = self.kmd.init_wallet_handle(wallet_id, "")
+        try:
+            address = max(
+                self.kmd.list_keys(handle),
+                key=lambda a: self.algod.account_info(a)["amount"],
+            )
+            return Account(self.kmd.export_key(handle, "", address))
+        finally:
+            self.kmd.release_wallet_handle(handle)
+
+    def send(self, *txns: tuple[transaction.Transaction, Account]) -> list[dict]:
+        atc = AtomicTransactionComposer()
+        for txn, sender in txns:
+            atc.add_transaction(TransactionWithSigner(txn, sender.signer))
+        result = atc.execute(self.algod, 4)
+        return [self.algod.pending_transaction_info(tx_id) for tx_id in result.tx_ids]
+
+    def sp(self) -> transaction.SuggestedParams:
+        return self.algod.suggested_params()
+
+    def new_account(self, amount: int = 100_000_000) -> Account:
+        private_key, address = account.generate_account()
+        self.pay(self.dispenser, address, amount)
+        return Account(private_key)
+
+    def pay(self, sender: Account, receiver: str, amount: int) -> None:
+        self.send((transaction.PaymentTxn(sender.address, self.sp(), receiver, amount), sender))
+
+    def create_asset(self, creator: Account, total: int, decimals: int = 0) -> int:
+        txn = transaction.AssetCreateTxn(
+            creator.address, self.sp(), total=total, decimals=decimals, default_frozen=False,
+            unit_name="BENCH", asset_name="bench",
+        )
+        return self.send((txn, creator))[0]["asset-index"]
+
+    def opt_in(self, holder: Account, asset_id: int) -> None:
+        self.send((transaction.AssetOptInTxn(holder.address, self.sp(), asset_id), holder))
+
+    def transfer(self, sender: Account, receiver: str, asset_id: int, amount: int) -> None:
+        txn = transaction.AssetTransferTxn(sender.address, self.sp(), receiver, amount, asset_id)
+        self.send((txn, sender))
+
+    def create_app(self, creator: Account, spec: AppSpec, funding: int) -> int:
+        txn = transaction.ApplicationCreateTxn(
+            creator.address,
+            self.sp(),
+            transaction.OnComplete.NoOpOC,
+            spec.approval.bytecode,
+            spec.clear.bytecode,
+            transaction.StateSchema(spec.global_uints, spec.global_bytes),
+            transaction.StateSchema(0, 0),
+            extra_pages=spec.extra_pages,
+        )
+        app_id = self.send((txn, creator))[0]["application-index"]
+        self.pay(self.dispenser, get_application_address(app_id), funding)
+        return app_id
+
+    def advance(self, seconds: int) -> None:
+        time.sleep(seconds)
+        self.pay(self.dispenser, self.dispenser.address, 0)
+
+    ##############################################
+    # function: measure
+    # arguments:
+    # - spec, the called contract
+    # - method, the called method
+    # - build, builds the group, app call last
+    # purpose: simulate, measure, then submit
+    # returns: MethodCost
+    ##############################################
+    def measure(self, spec: AppSpec, method: str, build: Build) -> MethodCost:
+        sp = self.sp()
+        call_sp = self.sp()
+        call_sp.flat_fee = True
+        call_sp.fee = SIMULATE_FEE
+        request = SimulateRequest(
+            txn_groups=[],
+            allow_unnamed_resources=True,
+            exec_trace_config=SimulateTraceConfig(enable=True),
+        )
+        simulated = build(sp, call_sp).simulate(self.algod, request)
+        if simulated.failure_message:
+            raise RuntimeError(f"{spec.name}.{method}: {simulated.failure_message}")
+        txn_results = simulated.simulate_response["txn-groups"][0]["txn-results"]
+        call_result = txn_results[-1]
+        ops = [
+            spec.approval.pc_ops.get(unit["pc"])
+            for unit in call_result["exec-trace"].get("approval-program-trace", [])
+        ]
+        inner_txns = count_inner_txns(call_result["txn-result"])
+        cost = MethodCost(
+            contract=spec.name,
+            method=method,
+            opcode_cost=call_result.get("app-budget-consumed", 0),
+            inner_txns=inner_txns,
+            state_reads=sum(op in READ_OPS for op in ops),
+            state_writes=sum(op in WRITE_OPS for op in ops),
+            fee=call_fee(inner_txns),
+        )
+        call_sp.fee = cost.fee
+        build(sp, call_sp).execute(self.algod, 4)
+        return cost
+
+
+@dataclass
+class App:
+    node: LocalNet
+    spec: AppSpec
+    app_id: int
+    foreign_assets: list[int] = field(default_factory=list)
+    foreign_apps: list[int] = field(default_factory=list)
+    accounts: list[str] = field(default_factory=list)
+    boxes: list[tuple[int, bytes]] = field(default_factory=list)
+
+    @property
+    def address(self) -> str:
+        return get_application_address(self.app_id)
+
+    ##############################################
+    # function: call
+    # arguments:
+    # - method, the method name
+    # - sender, the caller
+    # - method_args, the abi arguments
+    # - pre, builds the transaction argument, or
+    #   the transaction placed before the call
+    # - on_complete, the on completion action
+    # - pre_sender, signs pre, the caller when
+    #   not given
+    # purpose: call a method and measure it
+    # returns: MethodCost
+    ##############################################
+    def call(
+        self,
+        method: str,
+        sender: Account,
+        method_args: tuple = (),
+        pre: Callable[[transaction.SuggestedParams], transaction.Transaction] | None = None,
+        on_complete: transaction.OnComplete = transaction.OnComplete.NoOpOC,
+        pre_sender: Account | None = None,
+    ) -> MethodCost:
+        def build(sp: transaction.SuggestedParams, call_sp: transaction.SuggestedParams) -> AtomicTransactionComposer:
+            atc = AtomicTransactionComposer()
+            args = list(method_args)
+            pre_txn = pre(sp) if pre is not None else None
+            abi_method = self.spec.contract.get_method_by_name(method)
+            if pre_txn is not None:
+                txn = TransactionWithSigner(pre_txn, (pre_sender or sender).signer)
+                if abi_method.args and isinstance(abi_method.args[0].type, str):
+                    args.insert(0, txn)
+                else:
+                    atc.add_transaction(txn)
+            atc.add_method_call(
+                app_id=self.app_id,
+                method=abi_method,
+                sender=sender.address,
+                sp=call_sp,
+                signer=sender.signer,
+                method_args=args,
+                on_complete=on_complete,
+                foreign_assets=self.foreign_assets,
+                foreign_apps=self.foreign_apps,
+                accounts=self.accounts,
+                boxes=self.boxes,
+            )
+            return atc
+
+        return self.node.measure(self.spec, method, build)
+
+
+class LendingBench:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - node, the LocalNet node
+    # - spec, the lending contract
+    # - lend_type, 1 network, 2 asa, 3 arc200
+    # purpose: prepare accounts and assets
+    # notes:
+    # - the lender also creates every asset so
+    #   close-outs to the creator need no extra
+    #   account reference
+    ##############################################
+    def __init__(self, node: LocalNet, spec: AppSpec, lend_type: int) -> None:
+        self.node = node
+        self.spec = spec
+        self.lend_type = lend_type
+        self.lender = node.new_account()
+        self.borrower = node.new_account()
+        self.lend_payment_asset_id = 0
+        if lend_type == 2:
+            self.lend_payment_asset_id = node.create_asset(self.lender, 10 * LEND_PAYBACK)
+            node.opt_in(self.borrower, self.lend_payment_asset_id)
+            node.transfer(self.lender, self.borrower.address, self.lend_payment_asset_id, 2 * LEND_PAYBACK)
+        if lend_type == 3:
+            self.token = self._deploy_token()
+            self.lend_payment_asset_id = self.token.app_id
+        self.costs: list[MethodCost] = []
+
+    def _deploy_token(self) -> App:
+        spec = load_app_spec(self.node.algod, "ARC200Token")
+        token = App(self.node, spec, self.node.create_app(self.lender, spec, 1_000_000))
+        for holder in (self.lender, self.borrower):
+            token.boxes = [(token.app_id, b"b" + decode_address(holder.address))]
+            token.call("mint", self.lender, (holder.address, 2 * LEND_PAYBACK))
+        return token
+
+    def _approve(self, app: App, owner: Account, amount: int) -> None:
+        self.token.boxes = [(self.token.app_id, b"a" + decode_address(owner.address) + decode_address(app.address))]
+        self.token.call("arc200_approve", owner, (app.address, amount))
+
+    ##############################################
+    # function: _payment
+    # arguments:
+    # - sender, the payer
+    # - app, the loan app
+    # - amount, the amount to pay
+    # purpose: build a payment argument
+    # returns: a transaction builder
+    # notes:
+    # - arc200 loans take a 0 pay, the tokens
+    #   move by allowance
+    ##############################################
+    def _payment(self, sender: Account, app: App, amount: int) -> Callable[[transaction.SuggestedParams], transaction.Transaction]:
+        if self.lend_type == 3:
+            amount = 0
+        if self.lend_type == 2:
+            return lambda sp: transaction.AssetTransferTxn(
+                sender.address, sp, app.address, amount, self.lend_payment_asset_id
+            )
+        return lambda sp: transaction.PaymentTxn(sender.address, sp, app.address, amount)
+
+    def _deploy(self) -> tuple[App, int]:
+        lend_asset_id = self.node.create_asset(self.lender, 1)
+        self.node.opt_in(self.borrower, lend_asset_id)
+        self.node.transfer(self.lender, self.borrower.address, lend_asset_id, 1)
+        app = App(self.node, self.spec, self.node.create_app(self.lender, self.spec, 500_000))
+        app.foreign_assets = [lend_asset_id]
+        app.accounts = [self.lender.address, self.borrower.address]
+        if self.lend_type == 2:
+            app.foreign_assets.append(self.lend_payment_asset_id)
+        if self.lend_type == 3:
+            app.foreign_apps = [self.token.app_id]
+            lender, borrower = decode_address(self.lender.address), decode_address(self.borrower.address)
+            app_address = decode_address(app.address)
+            app.boxes = [
+                (self.token.app_id, b"b" + lender),
+                (self.token.app_id, b"b" + borrower),
+                (self.token.app_id, b"b" + app_address),
+                (self.token.app_id, b"a" + lender + app_address),
+                (self.token.app_id, b"a" + borrower + app_address),
+            ]
+            self._approve(app, self.lender, LEND_AMOUNT)
+            self._approve(app, self.borrower, LEND_PAYBACK)
+        return app, lend_asset_id
+
+    def _lend(self, lend_time: int) -> App:
+        app, lend_asset_id = self._deploy()
+        self.costs.append(app.call("setup", self.lender, (self.lend_type, self.lend_payment_asset_id, lend_asset_id)))
+        self.costs.append(app.call(
+            "fund",
+            self.lender,
+            (LEND_AMOUNT, LEND_PAYBACK, lend_time),
+            pre=self._payment(self.lender, app, LEND_AMOUNT),
+        ))
+        self.costs.append(app.call(
+            "lend_nft",
+            self.borrower,
+            pre=lambda sp: transaction.AssetTransferTxn(self.borrower.address, sp, app.address, 1, lend_asset_id),
+        ))
+        return app
+
+    def _close(self, app: App) -> None:
+        self.costs.append(app.call("close", self.lender, on_complete=transaction.OnComplete.DeleteApplicationOC))
+
+    ##############################################
+    # function: run
+    # purpose: run repaid and defaulted lifecycles
+    # returns: measured costs
+    ##############################################
+    def run(self) -> list[MethodCost]:
+        app = self._lend(3600)
+        self.costs.append(app.call(
+            "pay_debt",
+            self.borrower,
+            pre=self._payment(self.borrower, app, LEND_PAYBACK),
+        ))
+        if self.lend_type != 3:
+            self.costs.append(app.call("claim_debt", self.lender))
+        self._close(app)
+        app = self._lend(1)
+        self.node.advance(3)
+        self.costs.append(app.call("claim_nft", self.lender))
+        self._close(app)
+        return self.costs
+
+
+##############################################
+# function: build_report
+# arguments:
+# - costs, measured method costs
+# purpose: keep the most expensive run per method
+# returns: report keyed by contract and method
+# notes:
+# - "lifecycle" sums the LIFECYCLE methods so
+#   contracts can be compared per loan
+##############################################
+def build_report(costs: list[MethodCost]) -> dict:
+    report: dict = {}
+    for cost in costs:
+        metrics = {k: v for k, v in asdict(cost).items() if k in METRICS}
+        current = report.setdefault(cost.contract, {}).setdefault(cost.method, metrics)
+        for k in METRICS:
+            current[k] = max(current[k], metrics[k])
+    for methods in report.values():
+        methods["lifecycle"] = {
+            k: sum(methods[method][k] for method in LIFECYCLE if method in methods)
+            for k in METRICS
+        }
+    return report
+
+
+##############################################
+# function: find_regressions
+# arguments:
+# - report, the current report
+# - baseline, the stored report
+# - improved, report decreases instead
+# purpose: compare against the baseline
+# returns: human readable regressions
+# notes:
+# - methods missing from the baseline are
+#   regressions, so new methods are reviewed
+##############################################
+def find_regressions(report: dict, baseline: dict, improved: bool = False) -> list[str]:
+    regressions = []
+    for contract, methods in report.items():
+        for method, metrics in methods.items():
+            stored = baseline.get(contract, {}).get(method)
+            if stored is None:
+                if not improved:
+                    regressions.append(f"{contract}.{method} missing from baseline")
+                continue
+            for k in METRICS:
+                before = stored.get(k, metrics[k])
+                if (metrics[k] < before) if improved else (metrics[k] > before):
+                    regressions.append(f"{contract}.{method} {k}: {before} -> {metrics[k]}")
+    return regressions
+
+
+##############################################
+# function: compare_flows
+# arguments:
+# - report, the current report
+# - before, the contract of the old flow
+# - after, the contract of the new flow
+# purpose: compare two flows per method
+# returns: human readable differences
+##############################################
+def compare_flows(report: dict, before: str, after: str) -> list[str]:
+    lines = []
+    for method in (*LIFECYCLE, "lifecycle"):
+        old, new = report[before].get(method), report[after].get(method)
+        if old is None or new is None:
+            continue
+        cells = ", ".join(f"{k} {old[k]} -> {new[k]}" for k in ("opcode_cost", "fee", "inner_txns"))
+        lines.append(f"{before} -> {after} {method}: {cells}")
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--algod-server", default=LOCALNET_ALGOD)
+    parser.add_argument("--kmd-server", default=LOCALNET_KMD)
+    parser.add_argument("--token", default=LOCALNET_TOKEN)
+    parser.add_argument("--report", type=Path, help="write the report here instead of stdout")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+    if not args.update_baseline and not args.baseline.exists():
+        print(f"no baseline at {args.baseline}, run with --update-baseline to create it", file=sys.stderr)
+        return 2
+
+    node = LocalNet(args.algod_server, args.kmd_server, args.token)
+    costs = []
+    # reported once per lend_type
+    for lend_type in (1, 2, 3):
+        spec = replace(load_app_spec(node.algod, "AssetLending"), name=f"AssetLending/{lend_type}")
+        costs += LendingBench(node, spec, lend_type).run()
+    spec = replace(load_app_spec(node.algod, "ARC200CheckedLending"), name=CHECKED_FLOW)
+    costs += LendingBench(node, spec, 3).run()
+    report = build_report(costs)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.report:
+        args.report.write_text(output + "\n")
+    else:
+        print(output)
+    for line in compare_flows(report, CHECKED_FLOW, ESCROW_FLOW):
+        print(line, file=sys.stderr)
+    if args.update_baseline:
+        args.baseline.write_text(output + "\n")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    for improvement in find_regressions(report, baseline, improved=True):
+        print(f"improvement: {improvement}", file=sys.stderr)
+    regressions = find_regressions(report, baseline)
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Approval program size and extra pages of the compiled contracts.
+
+Reads the <Contract>.approval.bin and <Contract>.clear.bin bytecode that
+`algokit compile py --output-bytecode` writes and reports, per contract, the
+approval and clear program bytes and the extra pages an app create needs.
+Give a build from before a change first to compare it with the build after:
+
+    python -m bench.size artifacts
+    python -m bench.size before artifacts artifacts/size --json size.json
+
+Exits non-zero when a directory holds no bytecode or a program needs more
+than MAX_EXTRA_PAGES extra pages. No network is needed.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# bytes of one program page
+PAGE_SIZE = 2048
+# most extra pages an app may have
+MAX_EXTRA_PAGES = 3
+
+
+##############################################
+# function: extra_pages
+# arguments:
+# - approval, approval program bytes
+# - clear, clear program bytes
+# purpose: pages beyond the first
+# returns: extra pages the app create needs
+##############################################
+def extra_pages(approval: int, clear: int) -> int:
+    return max(0, -(-(approval + clear) // PAGE_SIZE) - 1)
+
+
+##############################################
+# function: read_sizes
+# arguments:
+# - directory, a compile output directory
+# purpose: measure the compiled programs
+# returns: sizes keyed by contract name
+##############################################
+def read_sizes(directory: Path) -> dict[str, dict[str, int]]:
+    sizes = {}
+    for approval in sorted(directory.glob("*.approval.bin")):
+        name = approval.name.removesuffix(".approval.bin")
+        clear = directory / f"{name}.clear.bin"
+        approval_bytes = approval.stat().st_size
+        clear_bytes = clear.stat().st_size if clear.exists() else 0
+        sizes[name] = {
+            "approval": approval_bytes,
+            "clear": clear_bytes,
+            "extra_pages": extra_pages(approval_bytes, clear_bytes),
+        }
+    return sizes
+
+
+def print_report(report: dict[str, dict[str, dict[str, int]]]) -> None:
+    builds = list(report)
+    names = sorted({name for sizes in report.values() for name in sizes})
+    width = max(len("contract"), *(len(name) for name in names))
+    print(f"{'contract':<{width}}  " + "  ".join(f"{build:>24}" for build in builds))
+    for name in names:
+        cells = []
+        for build in builds:
+            size = report[build].get(name)
+            cells.append("-" if size is None else f"{size['approval']} B, {size['extra_pages']} extra")
+        print(f"{name:<{width}}  " + "  ".join(f"{cell:>24}" for cell in cells))
+    if len(builds) > 1:
+        first, last = report[builds[0]], report[builds[-1]]
+        for name in names:
+            if name in first and name in last:
+                delta = last[name]["approval"] - first[name]["approval"]
+                print(f"{name}: {delta:+d} approval bytes, "
+                      f"{last[name]['extra_pages'] - first[name]['extra_pages']:+d} extra pages")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("builds", type=Path, nargs="+", help="compile output directories, oldest first")
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    report = {str(build): read_sizes(build) for build in args.builds}
+    empty = [build for build, sizes in report.items() if not sizes]
+    if empty:
+        print(f"no *.approval.bin in {', '.join(empty)}, compile with --output-bytecode", file=sys.stderr)
+        return 2
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+    too_big = [
+        f"{build} {name}"
+        for build, sizes in report.items()
+        for name, size in sizes.items()
+        if size["extra_pages"] > MAX_EXTRA_PAGES
+    ]
+    for label in too_big:
+        print(f"{label}: more than {MAX_EXTRA_PAGES} extra pages", file=sys.stderr)
+    return 1 if too_big else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
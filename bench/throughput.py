@@ -0,0 +1,477 @@
+"""Offline throughput benchmark of full loan lifecycles.
+
+Thousands of concurrent lifecycles (setup, fund, lend_nft, then pay_debt and
+claim_debt or, for defaulted loans, claim_nft after expiry, then close) are
+driven through an in-process ledger stand-in. No network is needed. The
+ledger cuts a block every round_time seconds and takes queued groups in
+arrival order until the next group does not fit the block's bytes or, if
+--block-txns is given, its outer plus inner transactions. Every confirmed
+group is applied to client.model.LoanModel, so a lifecycle that breaks an
+assertion is counted as failed.
+
+The three ways of running loans with contract.py are compared on equal terms:
+
+- single, one app per loan created through LendingFactory.create_loan, and
+  close plus remove_loan in one group
+- pooled, AssetLendingPool with one call per loan and method
+- batched, AssetLendingPool with fund_many, claim_nft_many and
+  claim_debt_many, so loans waiting in the same round share a call
+
+Groups are priced with the inner transaction counts of client.fees. Single
+setups carry an app create of --program-bytes, which fills blocks by bytes
+long before pool calls do. Batches are bounded by the 8 references of an app
+call: a fund_many loan needs its l, c and x boxes and its o book box, so a
+batch of 4 adds a second app call to carry them, and opups once the batch
+outgrows the budget of its calls.
+
+    python -m bench.throughput --loans 5000
+    python -m bench.throughput --loans 3000 --block-txns 400
+    python -m bench.throughput --loans 20000 --block-txns 2000 --rate 500
+
+Latency is the time from submitting a group to the end of the block that
+confirms it. Throughput is closed loans per simulated second.
+"""
+import argparse
+import heapq
+import json
+import math
+import random
+import sys
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from client.fees import OPUP_BUDGET, LoanShape, batch_budget, ensure_opups, inner_txns, pool_inner_txns
+from client.loan import LEND_STATUS_CLAIMED
+from client.model import LoanModel, ModelError
+
+LEND_AMOUNT = 3_000_000
+LEND_PAYBACK = 6_000_000
+PERCENTILES = (50, 99)
+
+# estimated bytes of one signed outer or one
+# inner transaction in a block
+TXN_BYTES = 250
+# MaxTxnBytesPerBlock of the current protocol
+BLOCK_BYTES = 5 * 1024 * 1024
+# approval plus clear program of AssetLending,
+# carried by every app create
+PROGRAM_BYTES = 8192
+# foreign references of one app call
+MAX_REFERENCES = 8
+
+# outer transactions of one call per loan: the
+# app call plus its payment, axfer or, for
+# single, the factory call; arc200 loans pay 0
+SINGLE_OUTER = {
+    "setup": 2, "fund": 2, "lend_nft": 2, "pay_debt": 2,
+    "claim_nft": 1, "claim_debt": 1, "close": 2,
+}
+POOLED_OUTER = {**SINGLE_OUTER, "close": 1}
+
+# batched pool methods and their loans per call
+BATCH_METHODS = {"fund": "fund_many", "claim_nft": "claim_nft_many", "claim_debt": "claim_debt_many"}
+BATCH_SIZES = {"fund": 4, "claim_nft": 8, "claim_debt": 8}
+# references each loan adds to a batch: fund
+# the l, c and x boxes and its o book box,
+# claim_nft the l and c boxes, the lender and
+# the nft, claim_debt the l box and the lender
+BATCH_REFERENCES = {"fund": 4, "claim_nft": 4, "claim_debt": 2}
+
+
+##############################################
+# struct: Shape
+# purpose: what a group costs the block
+##############################################
+@dataclass(frozen=True)
+class Shape:
+    outer: int
+    inner: int = 0
+    program_bytes: int = 0
+
+    @property
+    def txns(self) -> int:
+        return self.outer + self.inner
+
+    def size(self, txn_bytes: int) -> int:
+        return self.txns * txn_bytes + self.program_bytes
+
+
+##############################################
+# function: group_shape
+# arguments:
+# - mode, single, pooled or batched
+# - method, the lifecycle step
+# - loans, loans sharing the group
+# - lend_type, 1 network, 2 asa, 3 arc200
+# - program_bytes, bytes of an app create
+# purpose: transactions and bytes of a group
+# returns: Shape
+# notes:
+# - batch references beyond the 8 of one call
+#   are carried by extra app calls in the group
+# - pool assets are assumed vetted
+##############################################
+def group_shape(mode: str, method: str, loans: int, lend_type: int, program_bytes: int) -> Shape:
+    if mode == "batched" and method in BATCH_METHODS:
+        refs = BATCH_REFERENCES[method] * loans
+        calls = -(-refs // MAX_REFERENCES)
+        payments = loans if method == "fund" else 0
+        shapes = [LoanShape(lend_type)] * loans
+        opups = ensure_opups(batch_budget(BATCH_METHODS[method], shapes), OPUP_BUDGET * calls)
+        return Shape(payments + calls, pool_inner_txns(BATCH_METHODS[method], shapes, opups=opups))
+    if mode == "single":
+        outer = SINGLE_OUTER[method]
+        if method == "setup":
+            inner = inner_txns("LendingFactory", "create_loan", lend_type)
+            return Shape(outer, inner, program_bytes)
+        inner = inner_txns("AssetLending", method, lend_type)
+        if method == "claim_nft" and lend_type == 1:
+            # no installments are paid here
+            inner -= 1
+        if method == "close":
+            inner += inner_txns("LendingFactory", "remove_loan")
+        return Shape(outer, inner)
+    outer = POOLED_OUTER[method]
+    return Shape(outer, pool_inner_txns(method, [LoanShape(lend_type)]))
+
+
+MODES = ("single", "pooled", "batched")
+
+
+##############################################
+# function: percentile
+# arguments:
+# - values, the samples
+# - p, the percentile, 0 to 100
+# purpose: nearest-rank percentile
+# returns: the sample, 0 when empty
+##############################################
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class Group:
+    method: str
+    shape: Shape
+    submitted: float
+    apply: Callable[[], None]
+    done: Callable[[bool], None]
+
+
+class Ledger:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - round_time, seconds per block
+    # - block_txns, outer and inner transactions
+    #   per block, 0 for no limit
+    # - block_bytes, bytes per block
+    # - txn_bytes, bytes of one transaction
+    # purpose: construct an empty ledger
+    ##############################################
+    def __init__(
+        self,
+        round_time: float,
+        block_txns: int = 0,
+        block_bytes: int = BLOCK_BYTES,
+        txn_bytes: int = TXN_BYTES,
+    ) -> None:
+        self.round_time = round_time
+        self.block_txns = block_txns
+        self.block_bytes = block_bytes
+        self.txn_bytes = txn_bytes
+        self.round = 0
+        self.queue: deque[Group] = deque()
+        self.txns = 0
+        self.inner_txns = 0
+        self.bytes = 0
+        self.groups = 0
+        self.full_blocks = 0
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.failures: dict[str, int] = defaultdict(int)
+
+    @property
+    def now(self) -> float:
+        return self.round * self.round_time
+
+    def submit(self, method: str, shape: Shape, apply: Callable[[], None], done: Callable[[bool], None]) -> None:
+        self.queue.append(Group(method, shape, self.now, apply, done))
+
+    ##############################################
+    # function: step
+    # purpose: cut one block
+    # post-conditions:
+    # - groups that fit confirmed in order
+    # - round advanced
+    # notes:
+    # - a group that breaks an assertion is
+    #   confirmed as failed, like a rejected
+    #   group, and uses no block space
+    # - a block is full when the next group does
+    #   not fit its transactions or bytes
+    ##############################################
+    def step(self) -> None:
+        txns = self.block_txns or math.inf
+        size = self.block_bytes
+        block = []
+        while self.queue:
+            shape = self.queue[0].shape
+            if shape.txns > txns or shape.size(self.txn_bytes) > size:
+                self.full_blocks += 1
+                break
+            group = self.queue.popleft()
+            txns -= shape.txns
+            size -= shape.size(self.txn_bytes)
+            block.append(group)
+        self.round += 1
+        for group in block:
+            try:
+                group.apply()
+                ok = True
+                self.txns += group.shape.outer
+                self.inner_txns += group.shape.inner
+                self.bytes += group.shape.size(self.txn_bytes)
+                self.groups += 1
+            except ModelError:
+                ok = False
+                self.failures[group.method] += 1
+            self.latencies[group.method].append(self.now - group.submitted)
+            group.done(ok)
+
+
+class Lifecycle:
+    __slots__ = ("loan_id", "model", "defaults", "started", "closed", "failed")
+
+    def __init__(self, loan_id: int, lend_type: int, defaults: bool, started: float) -> None:
+        self.loan_id = loan_id
+        self.model = LoanModel(lend_type)
+        self.defaults = defaults
+        self.started = started
+        self.closed = None
+        self.failed = False
+
+
+class Harness:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - mode, single, pooled or batched
+    # - ledger, the ledger stand-in
+    # - lend_type, 1 network, 2 asa, 3 arc200
+    # - lend_time, loan term in seconds
+    # - default_rate, share of borrowers that
+    #   never pay
+    # - rng, the random source
+    # - program_bytes, bytes of an app create
+    # purpose: drive lifecycles through a ledger
+    ##############################################
+    def __init__(
+        self,
+        mode: str,
+        ledger: Ledger,
+        lend_type: int,
+        lend_time: int,
+        default_rate: float,
+        rng: random.Random,
+        program_bytes: int = PROGRAM_BYTES,
+    ) -> None:
+        self.mode = mode
+        self.program_bytes = program_bytes
+        self.ledger = ledger
+        self.lend_type = lend_type
+        self.lend_time = lend_time
+        self.default_rate = default_rate
+        self.rng = rng
+        self.loans: list[Lifecycle] = []
+        self.pending: dict[str, list[Lifecycle]] = defaultdict(list)
+        self.timers: list[tuple[float, int, str]] = []
+
+    def start(self) -> None:
+        loan = Lifecycle(len(self.loans), self.lend_type, self.rng.random() < self.default_rate, self.ledger.now)
+        self.loans.append(loan)
+        self.pending["setup"].append(loan)
+
+    def _run(self, loan: Lifecycle, method: str) -> None:
+        model = loan.model
+        now = int(self.ledger.now)
+        if method == "setup":
+            model.setup(1, 2)
+        elif method == "fund":
+            model.fund("lender", LEND_AMOUNT, LEND_PAYBACK, self.lend_time)
+        elif method == "lend_nft":
+            model.lend_nft("borrower", now)
+        elif method == "pay_debt":
+            model.pay_debt("borrower")
+        elif method == "claim_nft":
+            model.claim_nft("lender", now)
+        elif method == "claim_debt":
+            model.claim_debt("lender")
+        else:
+            model.close()
+
+    def _next(self, loan: Lifecycle, method: str) -> None:
+        if method == "setup":
+            self.pending["fund"].append(loan)
+        elif method == "fund":
+            self.pending["lend_nft"].append(loan)
+        elif method == "lend_nft" and loan.defaults:
+            # claimable once a block is past expiry
+            expiry = loan.model.lend_date + loan.model.lend_time
+            heapq.heappush(self.timers, (expiry + 1, loan.loan_id, "claim_nft"))
+        elif method == "lend_nft":
+            self.pending["pay_debt"].append(loan)
+        elif method == "pay_debt" and loan.model.lend_status != LEND_STATUS_CLAIMED:
+            self.pending["claim_debt"].append(loan)
+        elif method == "close":
+            loan.closed = self.ledger.now
+        else:
+            self.pending["close"].append(loan)
+
+    ##############################################
+    # function: flush
+    # purpose: submit every waiting call
+    # notes:
+    # - waiting loans of a batched method share
+    #   groups of up to its batch size
+    ##############################################
+    def flush(self) -> None:
+        while self.timers and self.timers[0][0] <= self.ledger.now:
+            _, loan_id, method = heapq.heappop(self.timers)
+            self.pending[method].append(self.loans[loan_id])
+        pending, self.pending = self.pending, defaultdict(list)
+        for method, loans in pending.items():
+            batch = BATCH_SIZES.get(method, 1) if self.mode == "batched" else 1
+            for i in range(0, len(loans), batch):
+                self._submit(method, loans[i:i + batch])
+
+    def _submit(self, method: str, loans: list[Lifecycle]) -> None:
+        def apply() -> None:
+            for loan in loans:
+                self._run(loan, method)
+
+        def done(ok: bool) -> None:
+            for loan in loans:
+                if ok:
+                    self._next(loan, method)
+                else:
+                    loan.failed = True
+
+        shape = group_shape(self.mode, method, len(loans), self.lend_type, self.program_bytes)
+        self.ledger.submit(method, shape, apply, done)
+
+    def busy(self) -> bool:
+        return bool(self.ledger.queue or self.timers or any(self.pending.values()))
+
+
+##############################################
+# function: run_mode
+# arguments:
+# - mode, single, pooled or batched
+# - args, the parsed command line
+# purpose: run every lifecycle of one mode
+# returns: report of the mode
+##############################################
+def run_mode(mode: str, args: argparse.Namespace) -> dict:
+    ledger = Ledger(args.round_time, args.block_txns, args.block_bytes, args.txn_bytes)
+    harness = Harness(
+        mode,
+        ledger,
+        args.lend_type,
+        args.lend_time,
+        args.default_rate,
+        random.Random(args.seed),
+        args.program_bytes,
+    )
+    started = time.perf_counter()
+    arrivals = 0.0
+    while len(harness.loans) < args.loans or harness.busy():
+        if args.rate:
+            arrivals += args.rate * args.round_time
+        else:
+            arrivals = args.loans
+        while len(harness.loans) < min(args.loans, int(arrivals)):
+            harness.start()
+        harness.flush()
+        ledger.step()
+    wall = time.perf_counter() - started
+
+    closed = [loan for loan in harness.loans if loan.closed is not None]
+    lifecycle = [loan.closed - loan.started for loan in closed]
+    methods = {
+        method: {
+            "calls": len(latencies),
+            "failed": ledger.failures[method],
+            **{f"p{p}": percentile(latencies, p) for p in PERCENTILES},
+        }
+        for method, latencies in sorted(ledger.latencies.items())
+    }
+    return {
+        "loans": len(harness.loans),
+        "closed": len(closed),
+        "failed": sum(loan.failed for loan in harness.loans),
+        "rounds": ledger.round,
+        "seconds": ledger.now,
+        "loans_per_second": len(closed) / ledger.now if ledger.now else 0.0,
+        "txns": ledger.txns,
+        "txns_per_loan": ledger.txns / len(closed) if closed else 0.0,
+        "inner_txns": ledger.inner_txns,
+        "inner_txns_per_loan": ledger.inner_txns / len(closed) if closed else 0.0,
+        "bytes_per_loan": ledger.bytes / len(closed) if closed else 0.0,
+        "full_blocks": ledger.full_blocks,
+        "groups": ledger.groups,
+        "lifecycle": {f"p{p}": percentile(lifecycle, p) for p in PERCENTILES},
+        "methods": methods,
+        "wall_seconds": wall,
+        "groups_per_wall_second": ledger.groups / wall if wall else 0.0,
+    }
+
+
+def print_report(report: dict) -> None:
+    for mode, result in report.items():
+        print(
+            f"{mode}: {result['closed']}/{result['loans']} closed, {result['failed']} failed, "
+            f"{result['loans_per_second']:.1f} loans/s over {result['seconds']:.0f}s, "
+            f"{result['txns_per_loan']:.2f} txns/loan, {result['inner_txns_per_loan']:.2f} inner/loan, "
+            f"{result['bytes_per_loan']:,.0f} bytes/loan, {result['full_blocks']} full blocks, lifecycle p50 {result['lifecycle']['p50']:.1f}s "
+            f"p99 {result['lifecycle']['p99']:.1f}s"
+        )
+        for method, stats in result["methods"].items():
+            print(
+                f"  {method:<11} {stats['calls']:>8} calls {stats['failed']:>5} failed "
+                f"p50 {stats['p50']:6.1f}s p99 {stats['p99']:6.1f}s"
+            )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--loans", type=int, default=5000, help="lifecycles per mode")
+    parser.add_argument("--rate", type=float, default=0, help="new loans per second, 0 starts all at once")
+    parser.add_argument("--lend-type", type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument("--lend-time", type=int, default=60, help="loan term in seconds")
+    parser.add_argument("--default-rate", type=float, default=0.1)
+    parser.add_argument("--round-time", type=float, default=2.8, help="seconds per block")
+    parser.add_argument("--block-txns", type=int, default=0, help="outer and inner transactions per block, 0 for no limit")
+    parser.add_argument("--block-bytes", type=int, default=BLOCK_BYTES, help="transaction bytes per block")
+    parser.add_argument("--txn-bytes", type=int, default=TXN_BYTES, help="estimated bytes per transaction")
+    parser.add_argument("--program-bytes", type=int, default=PROGRAM_BYTES, help="program bytes of an app create")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    report = {mode: run_mode(mode, args) for mode in args.modes}
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+    return 1 if any(result["failed"] for result in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
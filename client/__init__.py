@@ -0,0 +1 @@
+"""Off-chain helpers for the asset lending contracts."""
@@ -0,0 +1,395 @@
+"""Asyncio client for the single-loan lending contract.
+
+Groups are built with algosdk from the ARC-4 contract description that the
+Dockerfile writes next to the generated clients (artifacts/AssetLending.json).
+The generated clients are synchronous, so they are not used here. Signed
+groups are sent over one pooled aiohttp session. At most `window` groups are in flight at a time, so
+submission does not wait for each group to confirm. A single watcher task
+wakes on every new round and checks all pending transactions concurrently.
+Suggested params are fetched once per round and shared by every call.
+
+    async with AsyncAlgod(url, token) as algod:
+        sender = GroupSender(algod, window=16)
+        apps = [LendingApp(sender, contract, app_id, address, signer) for app_id in app_ids]
+        await asyncio.gather(*(app.claim_nft() for app in apps))
+"""
+import asyncio
+import base64
+import copy
+import time
+from typing import Any
+
+from client.fees import call_fee, inner_txns
+from client.loan import LEND_STATUS_INITIALIZED, decode_global_state
+
+RETURN_PREFIX = bytes.fromhex("151f7c75")
+
+
+class AlgodError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"algod {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class AsyncAlgod:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - url, the algod address
+    # - token, the algod api token
+    # - limit, pooled connections
+    # - params_ttl, max age of suggested params
+    #   in seconds, about one round
+    # purpose: construct the algod client
+    # notes:
+    # - the session is opened on first use or by
+    #   entering the context manager
+    ##############################################
+    def __init__(self, url: str, token: str = "", limit: int = 32, params_ttl: float = 3.0) -> None:
+        self.url = url.rstrip("/")
+        self.headers = {"X-Algo-API-Token": token} if token else {}
+        self.limit = limit
+        self.params_ttl = params_ttl
+        self.last_round = 0
+        self._session = None
+        self._params = None
+        self._params_round = -1
+        self._params_time = 0.0
+        self._params_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncAlgod":
+        self.session()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+    def session(self):
+        if self._session is None:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.limit),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        data: bytes | None = None,
+        content_type: str = "application/x-binary",
+    ) -> dict:
+        headers = {"Content-Type": content_type} if data is not None else None
+        async with self.session().request(method, self.url + path, data=data, headers=headers) as response:
+            body = await response.json(content_type=None)
+            if response.status >= 400:
+                raise AlgodError(response.status, (body or {}).get("message", ""))
+            return body
+
+    async def status(self) -> dict:
+        return self._seen(await self._request("GET", "/v2/status"))
+
+    async def wait_for_block_after(self, round_: int) -> dict:
+        return self._seen(await self._request("GET", f"/v2/status/wait-for-block-after/{round_}"))
+
+    async def pending(self, txid: str) -> dict:
+        return await self._request("GET", f"/v2/transactions/pending/{txid}?format=json")
+
+    async def send(self, signed_group: bytes) -> str:
+        return (await self._request("POST", "/v2/transactions", signed_group))["txId"]
+
+    async def application(self, app_id: int) -> dict:
+        return await self._request("GET", f"/v2/applications/{app_id}")
+
+    async def simulate(self, request: bytes) -> dict:
+        return await self._request(
+            "POST", "/v2/transactions/simulate?format=json", request, "application/msgpack"
+        )
+
+    async def compile(self, teal: str) -> dict:
+        return await self._request(
+            "POST", "/v2/teal/compile?sourcemap=true", teal.encode(), "text/plain"
+        )
+
+    def _seen(self, status: dict) -> dict:
+        self.last_round = max(self.last_round, status["last-round"])
+        return status
+
+    ##############################################
+    # function: suggested_params
+    # purpose: get params, fetched once per round
+    # returns: a copy of the cached SuggestedParams
+    ##############################################
+    async def suggested_params(self):
+        from algosdk.transaction import SuggestedParams
+
+        async with self._params_lock:
+            stale = time.monotonic() - self._params_time > self.params_ttl
+            if self._params is None or stale or self.last_round > self._params_round:
+                params = await self._request("GET", "/v2/transactions/params")
+                self._params = SuggestedParams(
+                    fee=params["fee"],
+                    first=params["last-round"],
+                    last=params["last-round"] + 1000,
+                    gh=params["genesis-hash"],
+                    gen=params["genesis-id"],
+                    flat_fee=False,
+                    consensus_version=params["consensus-version"],
+                    min_fee=params["min-fee"],
+                )
+                self._params_round = max(self.last_round, params["last-round"])
+                self._params_time = time.monotonic()
+            return copy.copy(self._params)
+
+
+class GroupSender:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - algod, an AsyncAlgod
+    # - window, max groups in flight
+    # purpose: send groups and track confirmations
+    ##############################################
+    def __init__(self, algod: AsyncAlgod, window: int = 8) -> None:
+        self.algod = algod
+        self.window = asyncio.Semaphore(window)
+        self._pending: dict[str, tuple[int, asyncio.Future]] = {}
+        self._watcher: asyncio.Task | None = None
+
+    ##############################################
+    # function: send
+    # arguments:
+    # - signed, the signed transactions of a group
+    # purpose: send a group and wait until it is
+    #          confirmed
+    # returns: pending info of the last transaction
+    # notes:
+    # - raises AlgodError when rejected and
+    #   TimeoutError when the group expires
+    ##############################################
+    async def send(self, signed: list) -> dict:
+        from algosdk import encoding
+
+        raw = b"".join(base64.b64decode(encoding.msgpack_encode(stxn)) for stxn in signed)
+        last = signed[-1]
+        return await self.send_raw(raw, last.get_txid(), last.transaction.last_valid_round)
+
+    ##############################################
+    # function: send_raw
+    # arguments:
+    # - raw, the msgpack encoded signed group
+    # - txid, id of the last transaction
+    # - last_valid, its last valid round
+    # purpose: send an encoded group and wait
+    #          until it is confirmed
+    # returns: pending info of the last transaction
+    ##############################################
+    async def send_raw(self, raw: bytes, txid: str, last_valid: int) -> dict:
+        async with self.window:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[txid] = (last_valid, future)
+            try:
+                await self.algod.send(raw)
+            except Exception:
+                del self._pending[txid]
+                raise
+            if self._watcher is None or self._watcher.done():
+                self._watcher = asyncio.create_task(self._watch())
+            return await future
+
+    async def _check(self, txid: str, last_valid: int, future: asyncio.Future, round_: int) -> None:
+        try:
+            info = await self.algod.pending(txid)
+        except AlgodError:
+            # not in the pool yet or a transient error,
+            # checked again next round until expired
+            info = {}
+        if future.done():
+            self._pending.pop(txid, None)
+        elif info.get("confirmed-round"):
+            self._pending.pop(txid, None)
+            future.set_result(info)
+        elif info.get("pool-error"):
+            self._pending.pop(txid, None)
+            future.set_exception(AlgodError(400, info["pool-error"]))
+        elif round_ > last_valid:
+            self._pending.pop(txid, None)
+            future.set_exception(TimeoutError(f"{txid} expired at round {last_valid}"))
+
+    async def _watch(self) -> None:
+        try:
+            round_ = (await self.algod.status())["last-round"]
+            while self._pending:
+                await asyncio.gather(*(
+                    self._check(txid, last_valid, future, round_)
+                    for txid, (last_valid, future) in list(self._pending.items())
+                ))
+                if not self._pending:
+                    return
+                round_ = (await self.algod.wait_for_block_after(round_))["last-round"]
+        except Exception as e:
+            for _, future in self._pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            self._pending.clear()
+
+
+##############################################
+# function: method_return
+# arguments:
+# - info, pending info of the app call
+# - method, the called abi.Method
+# purpose: decode the abi return value
+# returns: decoded value, None for void
+##############################################
+def method_return(info: dict, method) -> Any:
+    if method.returns.type == "void":
+        return None
+    for log in reversed(info.get("logs", [])):
+        value = base64.b64decode(log)
+        if value.startswith(RETURN_PREFIX):
+            return method.returns.type.decode(value[len(RETURN_PREFIX):])
+    raise ValueError(f"{method.name} returned no value")
+
+
+class LendingApp:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - sender, a GroupSender
+    # - contract, abi.Contract of the app
+    # - app_id, the loan app
+    # - address, the calling account
+    # - signer, the account transaction signer
+    # - preflight, a client.preflight.Preflight
+    #   that simulates each group before signing
+    # - lend_type, the loan's lend_type, read
+    #   from the app's loan state when None
+    # purpose: async calls to one loan app
+    ##############################################
+    def __init__(
+        self,
+        sender: GroupSender,
+        contract,
+        app_id: int,
+        address: str,
+        signer,
+        preflight=None,
+        lend_type: int | None = None,
+    ) -> None:
+        self.sender = sender
+        self.contract = contract
+        self.app_id = app_id
+        self.address = address
+        self.signer = signer
+        self.preflight = preflight
+        self.lend_type = lend_type
+
+    async def params(self):
+        return await self.sender.algod.suggested_params()
+
+    ##############################################
+    # function: get_lend_type
+    # purpose: get the lend_type fees depend on
+    # returns: lend_type
+    # notes:
+    # - read once from the app's loan state when
+    #   it was not given
+    # - raises ValueError for an app not set up
+    #   yet, call setup with it instead
+    ##############################################
+    async def get_lend_type(self) -> int:
+        if self.lend_type is None:
+            app = await self.sender.algod.application(self.app_id)
+            loan = decode_global_state(app["params"].get("global-state", []))
+            if loan.lend_status == LEND_STATUS_INITIALIZED:
+                raise ValueError(f"app {self.app_id} is not set up, it has no lend_type")
+            self.lend_type = loan.lend_type
+        return self.lend_type
+
+    ##############################################
+    # function: call
+    # arguments:
+    # - method, the method name
+    # - args, the abi arguments
+    # - txn, the transaction argument, or the
+    #   payment placed before the call
+    # - refs, foreign_assets, accounts, ...
+    # purpose: call a method in its own group
+    # returns: the decoded return value
+    # notes:
+    # - raises PreflightError, without sending,
+    #   when the preflight simulation fails
+    # - a missing transaction argument becomes
+    #   the 0 pay to the app that arc200 loans
+    #   take
+    ##############################################
+    async def call(self, method: str, *args: Any, txn=None, **refs: Any) -> Any:
+        from algosdk.atomic_transaction_composer import (
+            AtomicTransactionComposer,
+            TransactionWithSigner,
+        )
+        from algosdk.logic import get_application_address
+        from algosdk.transaction import PaymentTxn
+
+        abi_method = self.contract.get_method_by_name(method)
+        sp = await self.params()
+        sp.flat_fee = True
+        sp.fee = call_fee(inner_txns("AssetLending", method, await self.get_lend_type()), sp.min_fee)
+        method_args = list(args)
+        atc = AtomicTransactionComposer()
+        txn_arg = bool(abi_method.args) and isinstance(abi_method.args[0].type, str)
+        if txn is None and txn_arg:
+            txn_sp = copy.copy(sp)
+            txn_sp.fee = sp.min_fee
+            txn = PaymentTxn(self.address, txn_sp, get_application_address(self.app_id), 0)
+        if txn is not None:
+            if txn_arg:
+                method_args.insert(0, TransactionWithSigner(txn, self.signer))
+            else:
+                atc.add_transaction(TransactionWithSigner(txn, self.signer))
+        atc.add_method_call(
+            app_id=self.app_id,
+            method=abi_method,
+            sender=self.address,
+            sp=sp,
+            signer=self.signer,
+            method_args=method_args,
+            **refs,
+        )
+        if self.preflight is not None:
+            await self.preflight.require([t.txn for t in atc.build_group()])
+        info = await self.sender.send(atc.gather_signatures())
+        if self.preflight is not None:
+            self.preflight.invalidate(self.app_id)
+        return method_return(info, abi_method)
+
+    async def setup(self, lend_type: int, lend_payment_asset_id: int, lend_asset_id: int, **refs: Any) -> None:
+        self.lend_type = lend_type
+        await self.call("setup", lend_type, lend_payment_asset_id, lend_asset_id, **refs)
+
+    async def fund(self, lend_amount: int, lend_payback: int, lend_time: int, payment=None, **refs: Any) -> None:
+        await self.call("fund", lend_amount, lend_payback, lend_time, txn=payment, **refs)
+
+    async def lend_nft(self, axfer, **refs: Any) -> None:
+        await self.call("lend_nft", txn=axfer, **refs)
+
+    async def pay_debt(self, payment=None, **refs: Any) -> None:
+        await self.call("pay_debt", txn=payment, **refs)
+
+    async def claim_nft(self, **refs: Any) -> None:
+        await self.call("claim_nft", **refs)
+
+    async def claim_debt(self, **refs: Any) -> None:
+        await self.call("claim_debt", **refs)
+
+    async def get_loan(self, **refs: Any) -> Any:
+        return await self.call("get_loan", **refs)
@@ -0,0 +1,251 @@
+"""Vectorized portfolio analytics over loan snapshots.
+
+Loans are loaded into a LoanFrame, one NumPy array per Loan field, either
+straight from packed Loan records (global state values, pool boxes or
+get_loans snapshots, no per-loan Python), from decoded Loan tuples or from a
+LoanIndexer. Metrics are computed with array operations and group-by
+reductions, so a million loans take well under a second:
+
+    frame = LoanFrame.from_records(records)
+    frame.apr()
+    frame.time_to_expiry(now)
+    frame.exposure_by_asset()
+    frame.exposure_by_lender()
+"""
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from client.loan import LEND_STATUS_FUNDED, LEND_STATUS_LENT, LOAN_SIZE, Loan, encode_address
+
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+# big-endian layout of the packed Loan record, see client.loan.LOAN_LAYOUT
+LOAN_DTYPE = np.dtype([
+    ("lender", "V32"),
+    ("borrower", "V32"),
+    ("lend_type", "u1"),
+    ("lend_status", "u1"),
+    ("lend_payment_asset_id", ">u8"),
+    ("lend_asset_id", ">u8"),
+    ("lend_amount", ">u8"),
+    ("lend_paid", ">u8"),
+    ("lend_payback", ">u8"),
+    ("lend_date", ">u8"),
+    ("lend_time", ">u8"),
+])
+assert LOAN_DTYPE.itemsize == LOAN_SIZE
+
+UINT_FIELDS = (
+    "lend_type",
+    "lend_status",
+    "lend_payment_asset_id",
+    "lend_asset_id",
+    "lend_amount",
+    "lend_paid",
+    "lend_payback",
+    "lend_date",
+    "lend_time",
+)
+
+
+class Exposure(NamedTuple):
+    keys: np.ndarray
+    principal: np.ndarray
+    payback: np.ndarray
+    count: np.ndarray
+
+
+class LoanFrame:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - columns, one array per Loan field plus
+    #   app_id and loan_id
+    # purpose: hold loans column by column
+    # notes:
+    # - lender and borrower are 32 byte keys from
+    #   packed records or address strings
+    ##############################################
+    def __init__(self, columns: dict[str, np.ndarray]) -> None:
+        self.columns = columns
+        for name, column in columns.items():
+            setattr(self, name, column)
+
+    def __len__(self) -> int:
+        return len(self.lend_status)
+
+    ##############################################
+    # function: from_records
+    # arguments:
+    # - records, concatenated packed Loan records
+    # - app_ids, loan_ids, optional id columns
+    # purpose: load packed records without copies
+    #          beyond one byte swap per column
+    # returns: LoanFrame
+    ##############################################
+    @classmethod
+    def from_records(
+        cls,
+        records: bytes | memoryview,
+        app_ids: Iterable[int] | None = None,
+        loan_ids: Iterable[int] | None = None,
+    ) -> "LoanFrame":
+        raw = np.frombuffer(records, dtype=LOAN_DTYPE)
+        columns = {name: raw[name].astype(np.uint64) for name in UINT_FIELDS}
+        columns["lender"] = raw["lender"]
+        columns["borrower"] = raw["borrower"]
+        n = len(raw)
+        columns["app_id"] = np.zeros(n, np.uint64) if app_ids is None else np.asarray(app_ids, np.uint64)
+        columns["loan_id"] = np.zeros(n, np.uint64) if loan_ids is None else np.asarray(loan_ids, np.uint64)
+        return cls(columns)
+
+    ##############################################
+    # function: from_loans
+    # arguments:
+    # - loans, (app_id, loan_id, Loan) triples
+    # purpose: load decoded loans
+    # returns: LoanFrame
+    ##############################################
+    @classmethod
+    def from_loans(cls, loans: Iterable[tuple[int, int, Loan]]) -> "LoanFrame":
+        app_ids, loan_ids, rows = [], [], []
+        for app_id, loan_id, loan in loans:
+            app_ids.append(app_id)
+            loan_ids.append(loan_id)
+            rows.append(loan)
+        columns = {
+            name: np.fromiter((getattr(loan, name) for loan in rows), np.uint64, len(rows))
+            for name in UINT_FIELDS
+        }
+        columns["lender"] = np.array([loan.lender for loan in rows], dtype=str)
+        columns["borrower"] = np.array([loan.borrower for loan in rows], dtype=str)
+        columns["app_id"] = np.array(app_ids, np.uint64)
+        columns["loan_id"] = np.array(loan_ids, np.uint64)
+        return cls(columns)
+
+    ##############################################
+    # function: from_indexer
+    # arguments:
+    # - indexer, a client.indexer.LoanIndexer
+    # purpose: load every open loan of the index
+    # returns: LoanFrame
+    ##############################################
+    @classmethod
+    def from_indexer(cls, indexer) -> "LoanFrame":
+        names = ("app_id", "loan_id", *UINT_FIELDS)
+        rows = indexer.db.execute(
+            f"SELECT lender, borrower, {', '.join(names)} FROM loans WHERE closed = 0"
+        ).fetchall()
+        values = np.array([tuple(row)[2:] for row in rows], dtype=np.uint64).reshape(len(rows), len(names))
+        columns = {name: values[:, i].copy() for i, name in enumerate(names)}
+        columns["lender"] = np.array([row[0] or "" for row in rows], dtype=str)
+        columns["borrower"] = np.array([row[1] or "" for row in rows], dtype=str)
+        return cls(columns)
+
+    def mask(self, *statuses: int) -> np.ndarray:
+        return np.isin(self.lend_status, statuses)
+
+    ##############################################
+    # function: apr
+    # purpose: implied simple annual rate
+    # returns: float array, nan where lend_amount
+    #          or lend_time is 0
+    ##############################################
+    def apr(self) -> np.ndarray:
+        amount = self.lend_amount.astype(np.float64)
+        lend_time = self.lend_time.astype(np.float64)
+        interest = self.lend_payback.astype(np.float64) - amount
+        valid = (amount > 0) & (lend_time > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(valid, interest / amount * (SECONDS_PER_YEAR / lend_time), np.nan)
+
+    def lend_expiry(self) -> np.ndarray:
+        # 0 until lent, like Loan.lend_expiry
+        return np.where(self.lend_date > 0, self.lend_date + self.lend_time, np.uint64(0))
+
+    ##############################################
+    # function: time_to_expiry
+    # arguments:
+    # - now, the current unix time
+    # purpose: seconds until lent loans expire
+    # returns: float array, negative when overdue,
+    #          nan for loans not lent
+    ##############################################
+    def time_to_expiry(self, now: int) -> np.ndarray:
+        remaining = self.lend_expiry().astype(np.int64) - np.int64(now)
+        return np.where(self.mask(LEND_STATUS_LENT), remaining, np.nan)
+
+    ##############################################
+    # function: exposure_by
+    # arguments:
+    # - keys, the group-by column
+    # - statuses, the loans counted, lent ones by
+    #   default
+    # purpose: sum principal and payback per key
+    # returns: Exposure sorted by key
+    ##############################################
+    def exposure_by(self, keys: np.ndarray, statuses: tuple[int, ...] = (LEND_STATUS_LENT,)) -> Exposure:
+        selected = self.mask(*statuses)
+        keys = keys[selected]
+        principal = self.lend_amount[selected]
+        payback = self.lend_payback[selected]
+        if len(keys) == 0:
+            empty = np.zeros(0, np.uint64)
+            return Exposure(keys, empty, empty, empty)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        return Exposure(
+            keys=keys[starts],
+            principal=np.add.reduceat(principal[order], starts),
+            payback=np.add.reduceat(payback[order], starts),
+            count=np.diff(np.r_[starts, len(keys)]).astype(np.uint64),
+        )
+
+    def exposure_by_asset(self, statuses: tuple[int, ...] = (LEND_STATUS_LENT,)) -> Exposure:
+        return self.exposure_by(self.lend_asset_id, statuses)
+
+    def exposure_by_payment_asset(self, statuses: tuple[int, ...] = (LEND_STATUS_LENT,)) -> Exposure:
+        return self.exposure_by(self.lend_payment_asset_id, statuses)
+
+    def exposure_by_lender(self, statuses: tuple[int, ...] = (LEND_STATUS_LENT,)) -> Exposure:
+        return self.exposure_by(self.lender, statuses)
+
+    ##############################################
+    # function: summary
+    # arguments:
+    # - now, the current unix time
+    # - horizon, seconds counted as expiring soon
+    # purpose: headline numbers of the portfolio
+    # returns: dict of plain python values
+    ##############################################
+    def summary(self, now: int, horizon: int = 24 * 3600) -> dict:
+        lent = self.mask(LEND_STATUS_LENT)
+        ttl = self.time_to_expiry(now)
+        apr = self.apr()
+        weights = np.where(lent & ~np.isnan(apr), self.lend_amount.astype(np.float64), 0.0)
+        total = weights.sum()
+        return {
+            "loans": len(self),
+            "funded": int(self.mask(LEND_STATUS_FUNDED).sum()),
+            "lent": int(lent.sum()),
+            "outstanding": int(self.lend_amount[lent].sum()),
+            "expected_payback": int(self.lend_payback[lent].sum()),
+            "weighted_apr": float((np.nan_to_num(apr) * weights).sum() / total) if total else float("nan"),
+            "expiring": int(((ttl >= 0) & (ttl < horizon)).sum()),
+            "overdue": int((ttl < 0).sum()),
+        }
+
+
+##############################################
+# function: lender_addresses
+# arguments:
+# - keys, lender keys of an Exposure
+# purpose: show lender keys as addresses
+# returns: list of addresses
+##############################################
+def lender_addresses(keys: np.ndarray) -> list[str]:
+    if keys.dtype.kind == "V":
+        return [encode_address(bytes(key)) for key in keys]
+    return [str(key) for key in keys]
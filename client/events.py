@@ -0,0 +1,101 @@
+"""Decoding of the ARC-28 events emitted on loan state transitions.
+
+Every event log is a 4 byte selector, the first bytes of the SHA-512/256
+hash of the event signature, followed by the ABI encoded struct. loan_id
+is 0 for single-loan apps and the pool loan id for AssetLendingPool.
+"""
+import hashlib
+import struct
+from typing import NamedTuple
+
+from client.loan import (
+    LEND_STATUS_CLAIMED,
+    LEND_STATUS_FUNDED,
+    LEND_STATUS_LENT,
+    LEND_STATUS_SETUP,
+    encode_address,
+)
+
+
+class Event(NamedTuple):
+    name: str
+    loan_id: int
+    fields: dict
+
+
+EVENTS = {
+    "LoanSetup": ("(uint64,uint8,uint64,uint64)", ">QBQQ",
+                  ("loan_id", "lend_type", "lend_payment_asset_id", "lend_asset_id")),
+    "LoanFunded": ("(uint64,address,uint64,uint64,uint64)", ">Q32sQQQ",
+                   ("loan_id", "lender", "lend_amount", "lend_payback", "lend_time")),
+    "LoanLent": ("(uint64,address,uint64)", ">Q32sQ",
+                 ("loan_id", "borrower", "lend_date")),
+    "LoanPaid": ("(uint64,uint64,uint8)", ">QQB",
+                 ("loan_id", "lend_paid", "lend_status")),
+    "LoanNftClaimed": ("(uint64,address)", ">Q32s",
+                       ("loan_id", "lender")),
+    "LoanDebtClaimed": ("(uint64,uint64)", ">QQ",
+                        ("loan_id", "lend_payback")),
+    "LoanClosed": ("(uint64)", ">Q",
+                   ("loan_id",)),
+    "LoanRolledOver": ("(uint64,uint64)", ">QQ",
+                       ("loan_id", "lend_time")),
+    "LoanWithdrawn": ("(uint64)", ">Q",
+                      ("loan_id",)),
+}
+
+# lend_status after each event, LoanPaid carries
+# its own, lent for an installment, and LoanClosed
+# and LoanRolledOver leave it unchanged
+EVENT_STATUS = {
+    "LoanSetup": LEND_STATUS_SETUP,
+    "LoanFunded": LEND_STATUS_FUNDED,
+    "LoanLent": LEND_STATUS_LENT,
+    "LoanNftClaimed": LEND_STATUS_CLAIMED,
+    "LoanDebtClaimed": LEND_STATUS_CLAIMED,
+    "LoanWithdrawn": LEND_STATUS_SETUP,
+}
+
+# loan fields cleared by LoanWithdrawn, the loan
+# is open to be funded again
+WITHDRAWN_FIELDS = ("lender", "lend_amount", "lend_payback", "lend_time")
+
+
+##############################################
+# function: event_selector
+# arguments:
+# - name, the event name
+# - args, the event argument tuple type
+# purpose: compute an arc28 event selector
+# returns: 4 byte selector
+##############################################
+def event_selector(name: str, args: str) -> bytes:
+    return hashlib.new("sha512_256", f"{name}{args}".encode()).digest()[:4]
+
+
+# selector to name, struct layout and fields
+EVENT_LAYOUTS = {
+    event_selector(name, args): (name, struct.Struct(layout), fields)
+    for name, (args, layout, fields) in EVENTS.items()
+}
+
+
+##############################################
+# function: decode_event
+# arguments:
+# - log, a raw log entry
+# purpose: decode a loan event
+# returns: Event, or None for other logs
+##############################################
+def decode_event(log: bytes) -> Event | None:
+    entry = EVENT_LAYOUTS.get(log[:4])
+    if entry is None:
+        return None
+    name, layout, fields = entry
+    if len(log) != 4 + layout.size:
+        return None
+    values = dict(zip(fields, layout.unpack_from(log, 4)))
+    for key in ("lender", "borrower"):
+        if key in values:
+            values[key] = encode_address(values[key])
+    return Event(name, values.pop("loan_id"), values)
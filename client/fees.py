@@ -0,0 +1,240 @@
+"""Exact fees for lending calls from their inner transaction counts.
+
+Every inner transaction of the contracts is sent with a fee of 0, so the
+app account never pays fees out of the loan escrow. The outer transactions
+cover them through fee pooling instead. A call therefore needs
+min_fee * (1 + inner transactions), and a group needs the sum of those over
+its transactions, which any of them may carry:
+
+    fee = call_fee(inner_txns("AssetLending", "claim_nft", lend_type=2), sp.min_fee)
+    fee = call_fee(pool_inner_txns("pay_debt", [LoanShape(2, collateral=3)]))
+    set_group_fees(txns, [0, inner], sp.min_fee, payer=1)
+
+Counts follow contract.py. AssetLending counts depend on the loan's
+lend_type, which is passed in. AssetLendingPool calls are described by LoanShape. OpUp calls
+made by ensure_budget depend on the opcodes spent before them, so
+fee_from_simulation gives the exact fee of such groups.
+"""
+from typing import Iterable, NamedTuple, Sequence
+
+MIN_FEE = 1000
+# opcode budget added by each app call or opup
+OPUP_BUDGET = 700
+# added by ensure_budget to the required budget
+ENSURE_BUDGET_BUFFER = 10
+# batch budgets of contract.py: per nft of a
+# claim, kept for returning, per funded loan,
+# per offer scanned and for lending an offer
+CLAIM_BUDGET = 400
+BATCH_RESERVE = 100
+FUND_BUDGET = 800
+OFFER_BUDGET = 100
+ACCEPT_BUDGET = 400
+
+# AssetLending inner transactions per lend_type
+INNER_TXNS = {
+    1: {
+        "setup": 1, "fund": 0, "lend_nft": 1, "pay_debt": 1, "pay_installment": 1,
+        "rollover": 1, "claim_nft": 2, "claim_debt": 1, "close": 1,
+    },
+    2: {
+        "setup": 2, "fund": 0, "lend_nft": 1, "pay_debt": 1, "pay_installment": 1,
+        "rollover": 1, "claim_nft": 2, "claim_debt": 1, "close": 1,
+    },
+    3: {
+        "setup": 1, "fund": 1, "lend_nft": 1, "pay_debt": 2, "pay_installment": 2,
+        "rollover": 1, "claim_nft": 1, "close": 1,
+    },
+}
+
+# app create, funding payment and setup call,
+# plus the opt-ins made by setup
+FACTORY_INNER_TXNS = {"create_loan": 3, "remove_loan": 1}
+
+
+class LoanShape(NamedTuple):
+    lend_type: int
+    # nfts held, more than 1 for bundles
+    collateral: int = 1
+    # installments escrowed, paid out by claim_nft
+    lend_paid: int = 0
+
+
+##############################################
+# function: inner_txns
+# arguments:
+# - contract, the contract name
+# - method, the method name
+# - lend_type, the loan's lend_type, needed
+#   for AssetLending and LendingFactory
+# purpose: inner transactions of a single-loan
+#          or factory call
+# returns: inner transaction count
+# notes:
+# - claim_nft assumes network token
+#   installments were paid, one less otherwise
+# - pay_installment assumes it completes the
+#   loan, one less otherwise
+##############################################
+def inner_txns(contract: str, method: str, lend_type: int | None = None) -> int:
+    if contract == "LendingFactory":
+        if method == "create_loan":
+            return FACTORY_INNER_TXNS[method] + (2 if lend_type == 2 else 1)
+        return FACTORY_INNER_TXNS.get(method, 0)
+    if lend_type not in INNER_TXNS:
+        raise ValueError(f"{contract} needs a lend_type")
+    return INNER_TXNS[lend_type].get(method, 0)
+
+
+##############################################
+# function: pool_inner_txns
+# arguments:
+# - method, the AssetLendingPool method
+# - loans, the loans touched, in call order
+# - opt_ins, assets not yet vetted by the pool
+# - opups, opup calls made, see ensure_opups
+# - paid_in_full, whether pay_installment
+#   completes the loan
+# purpose: inner transactions of a pool call
+# returns: inner transaction count
+##############################################
+def pool_inner_txns(
+    method: str,
+    loans: Sequence[LoanShape] = (),
+    opt_ins: int = 0,
+    opups: int = 0,
+    paid_in_full: bool = False,
+) -> int:
+    arc200 = sum(loan.lend_type == 3 for loan in loans)
+    collateral = sum(loan.collateral for loan in loans)
+    if method in ("setup", "setup_bundle"):
+        count = opt_ins
+    elif method in ("fund", "fund_many"):
+        count = arc200
+    elif method in ("lend_nft", "lend_bundle", "accept_offer", "rollover", "withdraw", "close"):
+        count = 1
+    elif method == "pay_debt":
+        count = arc200 + collateral
+    elif method == "pay_installment":
+        count = arc200 + (collateral if paid_in_full else 0)
+    elif method in ("claim_nft", "claim_nft_many"):
+        count = collateral + sum(loan.lend_type != 3 and loan.lend_paid > 0 for loan in loans)
+    elif method in ("claim_debt", "claim_debt_many"):
+        count = len(loans)
+    else:
+        count = 0
+    return count + opups
+
+
+##############################################
+# function: ensure_opups
+# arguments:
+# - required, the budget passed to
+#   ensure_budget
+# - available, the budget left when it runs,
+#   700 per app call in the group less what
+#   was spent
+# purpose: opups ensure_budget will make
+# returns: opup count
+# notes:
+# - the opup program itself spends 1 of the
+#   700 each call adds
+##############################################
+def ensure_opups(required: int, available: int = OPUP_BUDGET) -> int:
+    missing = required + ENSURE_BUDGET_BUFFER - available
+    if missing <= 0:
+        return 0
+    return -(-missing // (OPUP_BUDGET - 1))
+
+
+##############################################
+# function: batch_budget
+# arguments:
+# - method, the AssetLendingPool batch method
+# - loans, the loans of the batch
+# purpose: opcode budget the batch needs at
+#          worst, as the contract checks it
+# returns: opcode budget
+# notes:
+# - claim_nft_many needs CLAIM_BUDGET for each
+#   nft a loan holds, so bundles count once
+#   per asset
+# - accept_offer takes one loan per offer in
+#   the book
+##############################################
+def batch_budget(method: str, loans: Sequence[LoanShape]) -> int:
+    if method == "claim_nft_many":
+        return CLAIM_BUDGET * sum(loan.collateral for loan in loans) + BATCH_RESERVE
+    if method == "claim_debt_many":
+        return CLAIM_BUDGET * len(loans) + BATCH_RESERVE
+    if method == "fund_many":
+        return FUND_BUDGET * len(loans)
+    if method == "accept_offer":
+        return OFFER_BUDGET * len(loans) + ACCEPT_BUDGET
+    raise ValueError(f"{method} is not a batch method")
+
+
+def call_fee(inner: int, min_fee: int = MIN_FEE) -> int:
+    return min_fee * (1 + inner)
+
+
+##############################################
+# function: group_fee
+# arguments:
+# - inner, inner transaction count of each
+#   transaction in the group
+# - min_fee, the network minimum fee
+# purpose: total fee a group must carry
+# returns: fee in microunits
+##############################################
+def group_fee(inner: Iterable[int], min_fee: int = MIN_FEE) -> int:
+    return sum(call_fee(count, min_fee) for count in inner)
+
+
+##############################################
+# function: set_group_fees
+# arguments:
+# - txns, the group's unsigned transactions
+# - inner, inner transaction count of each
+# - min_fee, the network minimum fee
+# - payer, index of the transaction paying
+#   the whole group, each pays its own if None
+# purpose: give a group exactly the fee needed
+# returns: the group fee
+##############################################
+def set_group_fees(txns: list, inner: Sequence[int], min_fee: int = MIN_FEE, payer: int | None = None) -> int:
+    if len(txns) != len(inner):
+        raise ValueError("one inner count per transaction")
+    total = group_fee(inner, min_fee)
+    for i, (txn, count) in enumerate(zip(txns, inner)):
+        if payer is None:
+            txn.fee = call_fee(count, min_fee)
+        else:
+            txn.fee = total if i == payer else 0
+    return total
+
+
+##############################################
+# function: count_inner_txns
+# arguments:
+# - txn_result, a pending transaction result
+# purpose: count inner transactions recursively
+# returns: inner transaction count
+##############################################
+def count_inner_txns(txn_result: dict) -> int:
+    inner_txns = txn_result.get("inner-txns", [])
+    return len(inner_txns) + sum(count_inner_txns(inner) for inner in inner_txns)
+
+
+##############################################
+# function: fee_from_simulation
+# arguments:
+# - group, one "txn-groups" entry of a
+#   simulate response
+# - min_fee, the network minimum fee
+# purpose: exact fee of a simulated group,
+#          opups included
+# returns: fee in microunits
+##############################################
+def fee_from_simulation(group: dict, min_fee: int = MIN_FEE) -> int:
+    return group_fee((count_inner_txns(result["txn-result"]) for result in group["txn-results"]), min_fee)
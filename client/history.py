@@ -0,0 +1,308 @@
+"""Columnar, memory-mapped loan history.
+
+Every loan event becomes one row holding the full loan state after the
+event. That is every Loan field plus the block timestamp of each lend_status
+change so far (setup, funded, lent, paid, claimed, closed). Each column is a
+fixed-width little-endian file in the history directory. meta.json records
+the schema, the committed row count and the last round, so a reader never
+sees a half-written append:
+
+    writer = HistoryWriter("history", app_ids={pool_id}, factory_id=factory_id)
+    writer.sync(FileBlockSource("blocks.jsonl"))    # appends new rounds only
+
+    history = History("history")                    # np.memmap, no copy
+    rows = history.select(lend_asset_id=asset_id, start=t0, end=t1)
+    rows["lend_amount"], rows["lent_ts"]
+
+Rows are appended in round order, so a time range is found by binary search
+on the ts column and only the pages it covers are read. As in the indexer,
+only events of app_ids and of the loan apps factory_id creates are exported,
+since any app can log bytes that look like a loan event.
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from client.events import EVENT_STATUS, EVENTS, WITHDRAWN_FIELDS, Event, decode_event
+from client.indexer import BlockSource, iter_app_logs, iter_created_apps
+from client.loan import LEND_STATUS_LENT, decode_address, encode_address
+
+EVENT_NAMES = tuple(EVENTS)
+
+TRANSITIONS = {
+    "LoanSetup": "setup_ts",
+    "LoanFunded": "funded_ts",
+    "LoanLent": "lent_ts",
+    "LoanPaid": "paid_ts",
+    "LoanNftClaimed": "claimed_ts",
+    "LoanDebtClaimed": "claimed_ts",
+    "LoanClosed": "closed_ts",
+}
+
+COLUMNS = {
+    "round": "<u8",
+    "ts": "<u8",
+    "app_id": "<u8",
+    "loan_id": "<u8",
+    "event": "u1",
+    "lender": "V32",
+    "borrower": "V32",
+    "lend_type": "u1",
+    "lend_status": "u1",
+    "lend_payment_asset_id": "<u8",
+    "lend_asset_id": "<u8",
+    "lend_amount": "<u8",
+    "lend_paid": "<u8",
+    "lend_payback": "<u8",
+    "lend_date": "<u8",
+    "lend_time": "<u8",
+    "setup_ts": "<u8",
+    "funded_ts": "<u8",
+    "lent_ts": "<u8",
+    "paid_ts": "<u8",
+    "claimed_ts": "<u8",
+    "closed_ts": "<u8",
+}
+
+STATE_COLUMNS = tuple(name for name in COLUMNS if name not in ("round", "ts", "app_id", "loan_id", "event"))
+ZERO_KEY = bytes(32)
+
+
+def _column_path(path: Path, name: str) -> Path:
+    return path / f"{name}.bin"
+
+
+def _read_meta(path: Path) -> dict:
+    meta_path = path / "meta.json"
+    if not meta_path.exists():
+        return {"version": 1, "rows": 0, "round": -1, "columns": COLUMNS, "apps": []}
+    meta = json.loads(meta_path.read_text())
+    if meta["columns"] != COLUMNS:
+        raise ValueError(f"{path} has a different schema")
+    return meta
+
+
+class HistoryWriter:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - path, the history directory
+    # - app_ids, pools and loan apps to export
+    # - factory_id, also export the loan apps
+    #   this LendingFactory creates
+    # purpose: open or create a history
+    # notes:
+    # - one of app_ids or factory_id is needed,
+    #   events of other apps are ignored
+    # - bytes past the committed row count, left
+    #   by an interrupted append, are truncated
+    # - the latest state of every loan is rebuilt
+    #   from the existing rows
+    ##############################################
+    def __init__(
+        self,
+        path: str | Path,
+        app_ids: set[int] | None = None,
+        factory_id: int | None = None,
+    ) -> None:
+        if not app_ids and factory_id is None:
+            raise ValueError("history needs app_ids or a factory_id")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.meta = _read_meta(self.path)
+        self.factory_id = factory_id
+        self.app_ids = set(app_ids or ())
+        # factory apps found in committed rounds
+        self.created = set(self.meta.get("apps", []))
+        rows = self.meta["rows"]
+        for name, dtype in COLUMNS.items():
+            column_path = _column_path(self.path, name)
+            column_path.touch()
+            size = rows * np.dtype(dtype).itemsize
+            if column_path.stat().st_size != size:
+                os.truncate(column_path, size)
+        self.loans: dict[tuple[int, int], dict] = {}
+        if rows:
+            self._load_state()
+
+    def _load_state(self) -> None:
+        history = History(self.path)
+        pairs = np.stack([history["app_id"], history["loan_id"]], axis=1)
+        # last row of every (app_id, loan_id)
+        _, from_end = np.unique(pairs[::-1], axis=0, return_index=True)
+        for i in len(pairs) - 1 - from_end:
+            self.loans[(int(pairs[i, 0]), int(pairs[i, 1]))] = {
+                name: bytes(history[name][i]) if name in ("lender", "borrower") else int(history[name][i])
+                for name in STATE_COLUMNS
+            }
+
+    @property
+    def round(self) -> int:
+        return self.meta["round"]
+
+    def _new_loan(self) -> dict:
+        loan = {name: 0 for name in STATE_COLUMNS}
+        loan["lender"] = loan["borrower"] = ZERO_KEY
+        return loan
+
+    ##############################################
+    # function: apply_event
+    # arguments:
+    # - app_id, the emitting app
+    # - event, the decoded event
+    # - round_, ts, the block of the event
+    # purpose: fold an event into the loan state
+    # returns: the history row
+    ##############################################
+    def apply_event(self, app_id: int, event: Event, round_: int, ts: int) -> dict:
+        loan = self.loans.setdefault((app_id, event.loan_id), self._new_loan())
+        for name, value in event.fields.items():
+            loan[name] = decode_address(value) if name in ("lender", "borrower") else value
+        if event.name == "LoanWithdrawn":
+            loan.update((name, ZERO_KEY if name == "lender" else 0) for name in WITHDRAWN_FIELDS)
+        if event.name in EVENT_STATUS:
+            loan["lend_status"] = EVENT_STATUS[event.name]
+        # installments and rollovers leave the loan lent
+        transition = TRANSITIONS.get(event.name)
+        if transition is not None and not (event.name == "LoanPaid" and loan["lend_status"] == LEND_STATUS_LENT):
+            loan[transition] = ts
+        return {
+            "round": round_,
+            "ts": ts,
+            "app_id": app_id,
+            "loan_id": event.loan_id,
+            "event": EVENT_NAMES.index(event.name),
+            **loan,
+        }
+
+    def _append(self, rows: list[dict]) -> None:
+        if not rows:
+            return
+        for name, dtype in COLUMNS.items():
+            column = np.array([row[name] for row in rows], dtype=dtype)
+            with _column_path(self.path, name).open("ab") as f:
+                column.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        self.meta["rows"] += len(rows)
+
+    def _commit(self, round_: int) -> None:
+        self.meta["round"] = round_
+        self.meta["apps"] = sorted(self.created)
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta))
+        os.replace(tmp, self.path / "meta.json")
+
+    ##############################################
+    # function: sync
+    # arguments:
+    # - source, the block source
+    # - until, last round to export
+    # - batch, rounds per append
+    # purpose: append rounds after the last one
+    # returns: number of rows appended
+    ##############################################
+    def sync(self, source: BlockSource, until: int | None = None, batch: int = 1024) -> int:
+        last = source.last_round() if until is None else until
+        appended = 0
+        round_ = self.round + 1
+        while round_ <= last:
+            end = min(round_ + batch, last + 1)
+            rows = []
+            for r in range(round_, end):
+                block = source.block(r)
+                ts = block.get("ts", 0)
+                txns = block.get("txns", [])
+                if self.factory_id is not None:
+                    self.created.update(iter_created_apps(txns, self.factory_id))
+                for app_id, log in iter_app_logs(txns):
+                    if app_id not in self.app_ids and app_id not in self.created:
+                        continue
+                    event = decode_event(log)
+                    if event is not None:
+                        rows.append(self.apply_event(app_id, event, r, ts))
+            self._append(rows)
+            self._commit(end - 1)
+            appended += len(rows)
+            round_ = end
+        return appended
+
+
+class History:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - path, the history directory
+    # purpose: map the committed rows read-only
+    ##############################################
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.meta = _read_meta(self.path)
+        rows = self.meta["rows"]
+        self.columns: dict[str, np.ndarray] = {
+            name: (
+                np.memmap(_column_path(self.path, name), dtype=dtype, mode="r", shape=(rows,))
+                if rows else np.zeros(0, dtype)
+            )
+            for name, dtype in COLUMNS.items()
+        }
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    ##############################################
+    # function: time_range
+    # arguments:
+    # - start, first block timestamp, inclusive
+    # - end, last block timestamp, exclusive
+    # purpose: find the rows of a time range
+    # returns: slice into every column
+    ##############################################
+    def time_range(self, start: int | None = None, end: int | None = None) -> slice:
+        ts = self.columns["ts"]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, side="left"))
+        return slice(lo, hi)
+
+    ##############################################
+    # function: select
+    # arguments:
+    # - lend_asset_id, only rows of this asset
+    # - app_id, only rows of this app
+    # - start, end, the time range
+    # - columns, the columns to return
+    # purpose: slice the history
+    # returns: column name to array, views of the
+    #          mapped files unless filtered
+    ##############################################
+    def select(
+        self,
+        lend_asset_id: int | None = None,
+        app_id: int | None = None,
+        start: int | None = None,
+        end: int | None = None,
+        columns: tuple[str, ...] | None = None,
+    ) -> dict[str, np.ndarray]:
+        window = self.time_range(start, end)
+        names = columns or tuple(COLUMNS)
+        selected = {name: self.columns[name][window] for name in names}
+        mask = None
+        if lend_asset_id is not None:
+            mask = self.columns["lend_asset_id"][window] == lend_asset_id
+        if app_id is not None:
+            app_mask = self.columns["app_id"][window] == app_id
+            mask = app_mask if mask is None else mask & app_mask
+        if mask is not None:
+            selected = {name: column[mask] for name, column in selected.items()}
+        return selected
+
+    def event_names(self, events: np.ndarray) -> list[str]:
+        return [EVENT_NAMES[e] for e in events]
+
+    def addresses(self, keys: np.ndarray) -> list[str]:
+        return [encode_address(bytes(key)) for key in keys]
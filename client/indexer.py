@@ -0,0 +1,303 @@
+"""Local SQLite index of lending loans built from block data.
+
+Blocks come from any BlockSource: AlgodBlockSource reads a node and
+FileBlockSource reads a JSON lines file of blocks, one block per line, in the
+algod JSON block format ("rnd", "ts", "txns"). Loan state is rebuilt from
+the ARC-28 events the contracts log, including inner transactions, so no app
+state is read. Processing resumes from the last stored round.
+
+Any app can log bytes that decode as a loan event, so only trusted apps are
+indexed: pools and single-loan apps listed in app_ids, and the loan apps a
+LendingFactory creates, found from its inner app creations:
+
+    indexer = LoanIndexer("loans.sqlite", app_ids={pool_id}, factory_id=factory_id)
+    indexer.sync(FileBlockSource("blocks.jsonl"), start=factory_created_round)
+    indexer.loans_by_lender(address)
+"""
+import base64
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterator, Protocol
+
+from client.events import EVENT_STATUS, WITHDRAWN_FIELDS, Event, decode_event
+from client.loan import LEND_STATUS_FUNDED, LEND_STATUS_LENT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS loans (
+    app_id INTEGER NOT NULL,
+    loan_id INTEGER NOT NULL,
+    lender TEXT,
+    borrower TEXT,
+    lend_type INTEGER NOT NULL DEFAULT 0,
+    lend_status INTEGER NOT NULL DEFAULT 0,
+    lend_payment_asset_id INTEGER NOT NULL DEFAULT 0,
+    lend_asset_id INTEGER NOT NULL DEFAULT 0,
+    lend_amount INTEGER NOT NULL DEFAULT 0,
+    lend_paid INTEGER NOT NULL DEFAULT 0,
+    lend_payback INTEGER NOT NULL DEFAULT 0,
+    lend_date INTEGER NOT NULL DEFAULT 0,
+    lend_time INTEGER NOT NULL DEFAULT 0,
+    lend_expiry INTEGER,
+    closed INTEGER NOT NULL DEFAULT 0,
+    updated_round INTEGER NOT NULL,
+    PRIMARY KEY (app_id, loan_id)
+);
+CREATE INDEX IF NOT EXISTS loans_lender ON loans (lender);
+CREATE INDEX IF NOT EXISTS loans_borrower ON loans (borrower);
+CREATE INDEX IF NOT EXISTS loans_asset_status ON loans (lend_asset_id, lend_status);
+CREATE INDEX IF NOT EXISTS loans_status_expiry ON loans (lend_status, lend_expiry);
+CREATE TABLE IF NOT EXISTS apps (
+    app_id INTEGER PRIMARY KEY,
+    created_round INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS progress (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    round INTEGER NOT NULL
+);
+"""
+
+
+class BlockSource(Protocol):
+    def last_round(self) -> int: ...
+
+    def block(self, round_: int) -> dict: ...
+
+
+class AlgodBlockSource:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - algod, an algosdk AlgodClient
+    # purpose: read blocks from a node
+    ##############################################
+    def __init__(self, algod) -> None:
+        self.algod = algod
+
+    def last_round(self) -> int:
+        return self.algod.status()["last-round"]
+
+    def block(self, round_: int) -> dict:
+        return self.algod.block_info(round_num=round_)["block"]
+
+
+class FileBlockSource:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - path, JSON lines file, one block per line
+    # purpose: read blocks from a local file
+    # notes:
+    # - rounds need not start at 0 but must be
+    #   consecutive
+    ##############################################
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._blocks: dict[int, dict] = {}
+        self._offset = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with self.path.open() as f:
+            f.seek(self._offset)
+            for line in iter(f.readline, ""):
+                if not line.endswith("\n"):
+                    break
+                if line.strip():
+                    block = json.loads(line)
+                    self._blocks[block.get("rnd", 0)] = block
+                self._offset = f.tell()
+
+    def append(self, block: dict) -> None:
+        with self.path.open("a") as f:
+            f.write(json.dumps(block) + "\n")
+        self._load()
+
+    def last_round(self) -> int:
+        self._load()
+        return max(self._blocks, default=-1)
+
+    def block(self, round_: int) -> dict:
+        return self._blocks.get(round_, {"rnd": round_, "txns": []})
+
+
+##############################################
+# function: iter_app_logs
+# arguments:
+# - txns, the block or inner transactions
+# purpose: walk app calls including inner calls
+# returns: app id and raw log pairs
+##############################################
+def iter_app_logs(txns: list[dict]) -> Iterator[tuple[int, bytes]]:
+    for stxn in txns:
+        txn = stxn.get("txn", {})
+        apply_data = stxn.get("dt", {})
+        app_id = txn.get("apid") or stxn.get("apid", 0)
+        if txn.get("type") == "appl":
+            for log in apply_data.get("lg", []):
+                yield app_id, base64.b64decode(log) if isinstance(log, str) else log
+        yield from iter_app_logs(apply_data.get("itx", []))
+
+
+##############################################
+# function: iter_created_apps
+# arguments:
+# - txns, the block transactions
+# - factory_id, the LendingFactory app
+# purpose: find loan apps the factory created
+# returns: generator of created app ids
+##############################################
+def iter_created_apps(txns: list[dict], factory_id: int) -> Iterator[int]:
+    for stxn in txns:
+        txn = stxn.get("txn", {})
+        inner_txns = stxn.get("dt", {}).get("itx", [])
+        if txn.get("type") == "appl" and txn.get("apid") == factory_id:
+            for inner in inner_txns:
+                inner_txn = inner.get("txn", {})
+                if inner_txn.get("type") == "appl" and not inner_txn.get("apid") and inner.get("apid"):
+                    yield inner["apid"]
+        else:
+            yield from iter_created_apps(inner_txns, factory_id)
+
+
+class LoanIndexer:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - path, the sqlite database path
+    # - app_ids, pools and loan apps to index
+    # - factory_id, also index the loan apps
+    #   this LendingFactory creates
+    # purpose: open or create the index
+    # notes:
+    # - one of app_ids or factory_id is needed,
+    #   events of other apps are ignored
+    ##############################################
+    def __init__(
+        self,
+        path: str | Path,
+        app_ids: set[int] | None = None,
+        factory_id: int | None = None,
+    ) -> None:
+        if not app_ids and factory_id is None:
+            raise ValueError("index needs app_ids or a factory_id")
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        self.factory_id = factory_id
+        self.app_ids = set(app_ids or ())
+        self.app_ids.update(row["app_id"] for row in self.db.execute("SELECT app_id FROM apps"))
+
+    def close(self) -> None:
+        self.db.close()
+
+    @property
+    def round(self) -> int:
+        row = self.db.execute("SELECT round FROM progress WHERE id = 0").fetchone()
+        return -1 if row is None else row["round"]
+
+    ##############################################
+    # function: sync
+    # arguments:
+    # - source, the block source
+    # - until, last round to process
+    # - batch, rounds per sqlite transaction
+    # - start, first round to process, e.g. the
+    #   round the apps or factory were created
+    # purpose: index rounds after the stored round
+    # returns: number of events applied
+    # notes:
+    # - start only skips rounds, rounds already
+    #   stored are never processed again
+    ##############################################
+    def sync(self, source: BlockSource, until: int | None = None, batch: int = 256, start: int = 0) -> int:
+        last = source.last_round() if until is None else until
+        applied = 0
+        round_ = max(self.round + 1, start)
+        while round_ <= last:
+            end = min(round_ + batch, last + 1)
+            with self.db:
+                for r in range(round_, end):
+                    applied += self.apply_block(source.block(r), r)
+                self.db.execute(
+                    "INSERT INTO progress (id, round) VALUES (0, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET round = excluded.round",
+                    (end - 1,),
+                )
+            round_ = end
+        return applied
+
+    def apply_block(self, block: dict, round_: int) -> int:
+        applied = 0
+        txns = block.get("txns", [])
+        if self.factory_id is not None:
+            for app_id in iter_created_apps(txns, self.factory_id):
+                self.app_ids.add(app_id)
+                self.db.execute(
+                    "INSERT OR IGNORE INTO apps (app_id, created_round) VALUES (?, ?)", (app_id, round_)
+                )
+        for app_id, log in iter_app_logs(txns):
+            if app_id not in self.app_ids:
+                continue
+            event = decode_event(log)
+            if event is not None:
+                self.apply_event(app_id, event, round_)
+                applied += 1
+        return applied
+
+    ##############################################
+    # function: apply_event
+    # arguments:
+    # - app_id, the emitting app
+    # - event, the decoded event
+    # - round_, the round of the event
+    # purpose: fold an event into the loan row
+    ##############################################
+    def apply_event(self, app_id: int, event: Event, round_: int) -> None:
+        key = (app_id, event.loan_id)
+        self.db.execute(
+            "INSERT OR IGNORE INTO loans (app_id, loan_id, updated_round) VALUES (?, ?, ?)",
+            (*key, round_),
+        )
+        updates = dict(event.fields)
+        if event.name == "LoanWithdrawn":
+            updates.update((name, None if name == "lender" else 0) for name in WITHDRAWN_FIELDS)
+        if event.name in EVENT_STATUS:
+            updates["lend_status"] = EVENT_STATUS[event.name]
+        elif event.name == "LoanClosed":
+            updates["closed"] = 1
+        updates["updated_round"] = round_
+        assignments = ", ".join(f"{column} = ?" for column in updates)
+        self.db.execute(
+            f"UPDATE loans SET {assignments} WHERE app_id = ? AND loan_id = ?",
+            (*updates.values(), *key),
+        )
+        if event.name in ("LoanLent", "LoanRolledOver"):
+            self.db.execute(
+                "UPDATE loans SET lend_expiry = lend_date + lend_time WHERE app_id = ? AND loan_id = ?",
+                key,
+            )
+
+    def loans_by_lender(self, lender: str) -> list[sqlite3.Row]:
+        return self.db.execute(
+            "SELECT * FROM loans WHERE lender = ? AND closed = 0", (lender,)
+        ).fetchall()
+
+    def loans_by_borrower(self, borrower: str) -> list[sqlite3.Row]:
+        return self.db.execute(
+            "SELECT * FROM loans WHERE borrower = ? AND closed = 0", (borrower,)
+        ).fetchall()
+
+    def expiring(self, before: int) -> list[sqlite3.Row]:
+        return self.db.execute(
+            "SELECT * FROM loans WHERE lend_status = ? AND lend_expiry < ? ORDER BY lend_expiry",
+            (LEND_STATUS_LENT, before),
+        ).fetchall()
+
+    def open_offers(self, lend_asset_id: int) -> list[sqlite3.Row]:
+        return self.db.execute(
+            "SELECT * FROM loans WHERE lend_asset_id = ? AND lend_status = ? ORDER BY lend_payback",
+            (lend_asset_id, LEND_STATUS_FUNDED),
+        ).fetchall()
@@ -0,0 +1,623 @@
+"""Liquidation keeper that claims the nft of expired loans.
+
+Lent loans are kept in a min-heap keyed by expiry (lend_date + lend_time).
+The keeper sleeps until the earliest deadline, pops every loan that is past
+it and submits claim_nft for them in transaction groups of at most 16 app
+calls. Loans of AssetLendingPool apps are claimed with claim_nft_many,
+which claims as many loans as its opcode budget allows. Pool calls are
+sized so that every loan's worst case, CLAIM_BUDGET per nft it holds, fits
+the budget of the call plus at most max_opups opups. Loans it leaves
+are sent again next tick without counting as a failed attempt, and are
+dropped after max_requeues such returns. The asset
+ids of bundle loans are read from their box when a pool loan is loaded.
+References that do not fit the claim_nft_many call, at most 8, are carried
+by get_bundle calls in the same group, since resources are shared across a
+group.
+The cost of each tick depends only on the number of expired loans, not on
+the number of tracked loans.
+
+Submission is bounded. At most max_groups groups are sent per tick, and the
+rest wait for the next tick. A failed group is retried with exponential
+backoff, one loan per group so that a single bad loan cannot keep others
+from being claimed, and a loan is dropped after max_attempts failures.
+Claimed and dropped loans are not tracked again for pending_time seconds,
+longer than a group stays valid, or until load finds the index no longer
+lists them as lent.
+
+Single-loan apps of lend_type 2 only let the lender claim, so they are
+tracked only when the keeper account is their lender.
+
+    submitter = AlgodSubmitter(algod, sender, signer, contract, pool_contract)
+    keeper = Keeper(submitter, pool_app_ids, address=sender)
+    keeper.load(indexer)
+    keeper.run()
+"""
+import base64
+import copy
+import heapq
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, NamedTuple, Protocol
+
+from client.fees import OPUP_BUDGET, LoanShape, batch_budget, call_fee, ensure_opups, inner_txns, pool_inner_txns
+from client.loan import LEND_TYPE_ASA, bundle_box_name, decode_bundle_box, loan_box_name
+
+logger = logging.getLogger(__name__)
+
+MAX_GROUP_SIZE = 16
+# foreign accounts, assets, apps and boxes of
+# one app call, and foreign accounts alone
+MAX_REFERENCES = 8
+MAX_ACCOUNTS = 4
+
+
+@dataclass
+class Claim:
+    app_id: int
+    loan_id: int
+    expiry: int
+    lend_asset_id: int
+    lender: str
+    lend_type: int
+    lend_payment_asset_id: int = 0
+    # installments paid, sent to the lender
+    lend_paid: int = 0
+    attempts: int = 0
+    # returns by claim_nft_many out of budget
+    requeues: int = 0
+    not_before: float = 0
+    isolate: bool = False
+    # asset ids of a pool bundle loan
+    bundle: tuple[int, ...] = ()
+
+    @property
+    def key(self) -> tuple[int, int]:
+        return self.app_id, self.loan_id
+
+    @property
+    def lend_asset_ids(self) -> tuple[int, ...]:
+        return self.bundle or (self.lend_asset_id,)
+
+    @property
+    def shape(self) -> LoanShape:
+        return LoanShape(self.lend_type, len(self.lend_asset_ids), self.lend_paid)
+
+
+class CallReferences(NamedTuple):
+    accounts: list[str]
+    assets: list[int]
+    boxes: list[bytes]
+
+
+##############################################
+# function: pool_references
+# arguments:
+# - claims, the claims of one claim_nft_many
+# purpose: spread the references of the call
+#          over as few app calls as fit them
+# returns: references of each app call, the
+#          claim_nft_many call first
+# notes:
+# - send_collateral reads the bundle box of
+#   every loan, so it is referenced even for
+#   loans without one
+# - every call names the lenders, so their
+#   holdings of the assets it names are
+#   available to the group
+##############################################
+def pool_references(claims: list[Claim]) -> list[CallReferences]:
+    accounts = sorted({claim.lender for claim in claims})
+    if len(accounts) > MAX_ACCOUNTS:
+        raise ValueError(f"at most {MAX_ACCOUNTS} lenders per claim_nft_many call")
+    boxes = [name for claim in claims for name in (loan_box_name(claim.loan_id), bundle_box_name(claim.loan_id))]
+    assets = {asset for claim in claims for asset in claim.lend_asset_ids}
+    # asa installments paid out to the lender
+    assets.update(
+        claim.lend_payment_asset_id for claim in claims if claim.lend_type == LEND_TYPE_ASA and claim.lend_paid
+    )
+    assets = sorted(assets)
+    refs: list[bytes | int] = [*boxes, *assets]
+    room = MAX_REFERENCES - len(accounts)
+    return [
+        CallReferences(
+            accounts,
+            [ref for ref in refs[i:i + room] if isinstance(ref, int)],
+            [ref for ref in refs[i:i + room] if isinstance(ref, bytes)],
+        )
+        for i in range(0, max(len(refs), 1), room)
+    ]
+
+
+@dataclass
+class ClaimCall:
+    app_id: int
+    claims: list[Claim]
+    pooled: bool
+
+    @property
+    def txns(self) -> int:
+        return len(pool_references(self.claims)) if self.pooled else 1
+
+    ##############################################
+    # function: opups
+    # purpose: opups a pool call may need
+    # returns: opup count, passed as max_opups
+    # notes:
+    # - covers the worst case claim_nft_many
+    #   checks before each loan, less the budget
+    #   of the call and its get_bundle calls
+    ##############################################
+    @property
+    def opups(self) -> int:
+        if not self.pooled:
+            return 0
+        shapes = [claim.shape for claim in self.claims]
+        return ensure_opups(batch_budget("claim_nft_many", shapes), OPUP_BUDGET * self.txns)
+
+    ##############################################
+    # function: inner_txns
+    # purpose: inner transactions of the claim
+    # returns: inner transaction count
+    # notes:
+    # - a pool call pays for its opups
+    # - a single-loan network token claim sends
+    #   installments only when some were paid
+    ##############################################
+    def inner_txns(self) -> int:
+        if self.pooled:
+            return pool_inner_txns("claim_nft_many", [claim.shape for claim in self.claims], opups=self.opups)
+        claim = self.claims[0]
+        return inner_txns("AssetLending", "claim_nft", claim.lend_type) - int(
+            claim.lend_type == 1 and not claim.lend_paid
+        )
+
+
+class ExpiryHeap:
+    ##############################################
+    # function: __init__ (builtin)
+    # purpose: min-heap of claims keyed by expiry
+    # notes:
+    # - removed or updated loans leave stale heap
+    #   entries that are skipped when popped
+    ##############################################
+    def __init__(self) -> None:
+        self._heap: list[tuple[int, tuple[int, int]]] = []
+        self._claims: dict[tuple[int, int], Claim] = {}
+
+    def __len__(self) -> int:
+        return len(self._claims)
+
+    def __contains__(self, key: tuple[int, int]) -> bool:
+        return key in self._claims
+
+    def push(self, claim: Claim) -> None:
+        current = self._claims.get(claim.key)
+        self._claims[claim.key] = claim
+        if current is None or current.expiry != claim.expiry:
+            heapq.heappush(self._heap, (claim.expiry, claim.key))
+
+    def get(self, key: tuple[int, int]) -> Claim | None:
+        return self._claims.get(key)
+
+    def remove(self, key: tuple[int, int]) -> None:
+        self._claims.pop(key, None)
+
+    def _prune(self) -> None:
+        while self._heap:
+            expiry, key = self._heap[0]
+            claim = self._claims.get(key)
+            if claim is not None and claim.expiry == expiry:
+                return
+            heapq.heappop(self._heap)
+
+    def next_expiry(self) -> int | None:
+        self._prune()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now: float) -> list[Claim]:
+        expired = []
+        while True:
+            self._prune()
+            if not self._heap or self._heap[0][0] >= now:
+                return expired
+            _, key = heapq.heappop(self._heap)
+            expired.append(self._claims.pop(key))
+
+
+class Submitter(Protocol):
+    # returns the claims left unclaimed, if any
+    def submit(self, calls: list[ClaimCall]) -> list[Claim] | None: ...
+
+    # returns the asset ids of a pool bundle loan,
+    # empty for other loans
+    def bundle(self, app_id: int, loan_id: int) -> tuple[int, ...]: ...
+
+
+class AlgodSubmitter:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - algod, an algosdk AlgodClient
+    # - sender, the keeper address
+    # - signer, the keeper transaction signer
+    # - contract, abi.Contract of the loan apps
+    # - pool_contract, abi.Contract of the pool
+    # - valid_rounds, rounds a group stays valid
+    #   and is waited for
+    # purpose: submit claim groups through algod
+    ##############################################
+    def __init__(self, algod, sender: str, signer, contract, pool_contract, valid_rounds: int = 10) -> None:
+        self.algod = algod
+        self.sender = sender
+        self.signer = signer
+        self.contract = contract
+        self.pool_contract = pool_contract
+        self.valid_rounds = valid_rounds
+        self._creators: dict[int, str] = {}
+
+    def _creator(self, asset_id: int) -> str:
+        if asset_id not in self._creators:
+            self._creators[asset_id] = self.algod.asset_info(asset_id)["params"]["creator"]
+        return self._creators[asset_id]
+
+    ##############################################
+    # function: bundle
+    # arguments:
+    # - app_id, the pool app
+    # - loan_id, the pool loan
+    # purpose: read a bundle loan's asset ids
+    # returns: asset ids, empty without a bundle
+    #          box
+    ##############################################
+    def bundle(self, app_id: int, loan_id: int) -> tuple[int, ...]:
+        from algosdk.error import AlgodHTTPError
+
+        try:
+            box = self.algod.application_box_by_name(app_id, bundle_box_name(loan_id))
+        except AlgodHTTPError as e:
+            if e.code == 404:
+                return ()
+            raise
+        return decode_bundle_box(base64.b64decode(box["value"]))
+
+    ##############################################
+    # function: submit
+    # arguments:
+    # - calls, the app calls of one group
+    # purpose: claim the loans in one group
+    # returns: claims left by claim_nft_many when
+    #          its opcode budget ran out
+    # notes:
+    # - waits until the group confirms or is past
+    #   its last valid round, so a failure means
+    #   it will never confirm
+    ##############################################
+    def submit(self, calls: list[ClaimCall]) -> list[Claim]:
+        from algosdk.atomic_transaction_composer import AtomicTransactionComposer
+
+        sp = self.algod.suggested_params()
+        sp.flat_fee = True
+        sp.last = sp.first + self.valid_rounds
+        atc = AtomicTransactionComposer()
+        for call in calls:
+            call_sp = copy.copy(sp)
+            call_sp.fee = call_fee(call.inner_txns(), sp.min_fee)
+            assets = {claim.lend_asset_id for claim in call.claims}
+            # lend_type 2 claims close out of the payment asset
+            assets.update(claim.lend_payment_asset_id for claim in call.claims if claim.lend_type == LEND_TYPE_ASA)
+            assets = sorted(assets)
+            accounts = sorted({claim.lender for claim in call.claims})
+            if call.pooled:
+                refs, *shared = pool_references(call.claims)
+                atc.add_method_call(
+                    app_id=call.app_id,
+                    method=self.pool_contract.get_method_by_name("claim_nft_many"),
+                    sender=self.sender,
+                    sp=call_sp,
+                    signer=self.signer,
+                    method_args=[[claim.loan_id for claim in call.claims], call.opups],
+                    foreign_assets=refs.assets,
+                    accounts=refs.accounts,
+                    boxes=[(call.app_id, name) for name in refs.boxes],
+                )
+                for refs in shared:
+                    shared_sp = copy.copy(sp)
+                    shared_sp.fee = call_fee(0, sp.min_fee)
+                    atc.add_method_call(
+                        app_id=call.app_id,
+                        method=self.pool_contract.get_method_by_name("get_bundle"),
+                        sender=self.sender,
+                        sp=shared_sp,
+                        signer=self.signer,
+                        method_args=[call.claims[0].loan_id],
+                        foreign_assets=refs.assets,
+                        accounts=refs.accounts,
+                        boxes=[(call.app_id, name) for name in refs.boxes],
+                    )
+            else:
+                accounts = sorted(set(accounts) | {self._creator(asset) for asset in assets})
+                atc.add_method_call(
+                    app_id=call.app_id,
+                    method=self.contract.get_method_by_name("claim_nft"),
+                    sender=self.sender,
+                    sp=call_sp,
+                    signer=self.signer,
+                    foreign_assets=assets,
+                    accounts=accounts,
+                )
+        result = atc.execute(self.algod, self.valid_rounds + 1)
+        left = []
+        abi_results = iter(result.abi_results)
+        for call in calls:
+            abi_result = next(abi_results)
+            if call.pooled:
+                left += call.claims[len(abi_result.return_value):]
+                # skip the get_bundle calls
+                for _ in range(call.txns - 1):
+                    next(abi_results)
+        return left
+
+
+class Keeper:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - submitter, sends claim groups
+    # - pool_app_ids, apps using the pool contract
+    # - address, the keeper account, single-loan
+    #   lend_type 2 loans are only claimed when
+    #   it is their lender
+    # - margin, seconds past expiry before claiming
+    #   since latest_timestamp lags the wall clock
+    # - claims_per_call, pool loans per app call
+    # - max_opups, opups a pool call may pay for,
+    #   a loan needing more is claimed alone
+    # - max_groups, groups submitted per tick
+    # - max_attempts, submissions before dropping
+    # - max_requeues, claim_nft_many returns out
+    #   of budget before dropping
+    # - backoff, first retry delay in seconds
+    # - pending_time, seconds a claimed or
+    #   dropped loan is not tracked again, longer
+    #   than the submitter's valid_rounds
+    # - clock, returns the current unix time
+    # purpose: construct the keeper
+    ##############################################
+    def __init__(
+        self,
+        submitter: Submitter,
+        pool_app_ids: Iterable[int] = (),
+        address: str | None = None,
+        margin: int = 5,
+        claims_per_call: int = 2,
+        max_opups: int = 4,
+        max_groups: int = 4,
+        max_attempts: int = 3,
+        max_requeues: int = 8,
+        backoff: float = 2.0,
+        pending_time: float = 300.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if not 1 <= claims_per_call <= MAX_ACCOUNTS:
+            raise ValueError(f"claims_per_call must be 1 to {MAX_ACCOUNTS}, one lender account each")
+        self.submitter = submitter
+        self.pool_app_ids = set(pool_app_ids)
+        self.address = address
+        self.margin = margin
+        self.claims_per_call = claims_per_call
+        self.max_opups = max_opups
+        self.max_groups = max_groups
+        self.max_attempts = max_attempts
+        self.max_requeues = max_requeues
+        self.backoff = backoff
+        self.pending_time = pending_time
+        self.clock = clock
+        self.heap = ExpiryHeap()
+        self.ready: list[Claim] = []
+        self.claimed: list[Claim] = []
+        self.dropped: list[Claim] = []
+        # claimed or dropped loans and when they
+        # may be tracked again
+        self._submitted: dict[tuple[int, int], float] = {}
+
+    def _known(self, key: tuple[int, int]) -> bool:
+        return key in self._submitted or any(claim.key == key for claim in self.ready)
+
+    def track(self, claim: Claim) -> None:
+        if self._known(claim.key):
+            return
+        self.heap.push(claim)
+
+    def untrack(self, app_id: int, loan_id: int) -> None:
+        self.heap.remove((app_id, loan_id))
+        self.ready = [claim for claim in self.ready if claim.key != (app_id, loan_id)]
+
+    def _drop(self, claim: Claim, now: float) -> None:
+        self.dropped.append(claim)
+        self._submitted[claim.key] = now + self.pending_time
+
+    def _evict(self, now: float) -> None:
+        for key in [key for key, until in self._submitted.items() if until <= now]:
+            del self._submitted[key]
+
+    ##############################################
+    # function: load
+    # arguments:
+    # - indexer, a client.indexer.LoanIndexer
+    # purpose: track every lent loan of the index
+    # notes:
+    # - the bundle of a pool loan is read once,
+    #   when the loan is first tracked
+    # - loans whose setup was not indexed have
+    #   no lend_type and are skipped
+    # - claimed or dropped loans the index no
+    #   longer lists as lent are forgotten
+    ##############################################
+    def load(self, indexer) -> None:
+        rows = indexer.expiring(2 ** 63 - 1)
+        lent = {(row["app_id"], row["loan_id"]) for row in rows}
+        for key in [key for key in self._submitted if key not in lent]:
+            del self._submitted[key]
+        for row in rows:
+            claim = Claim(
+                app_id=row["app_id"],
+                loan_id=row["loan_id"],
+                expiry=row["lend_expiry"],
+                lend_asset_id=row["lend_asset_id"],
+                lender=row["lender"],
+                lend_type=row["lend_type"],
+                lend_payment_asset_id=row["lend_payment_asset_id"],
+                lend_paid=row["lend_paid"],
+            )
+            if self._known(claim.key) or not claim.lend_type:
+                continue
+            pooled = claim.app_id in self.pool_app_ids
+            if not pooled and claim.lend_type == LEND_TYPE_ASA and claim.lender != self.address:
+                continue
+            current = self.heap.get(claim.key)
+            if current is not None:
+                claim.bundle = current.bundle
+            elif pooled:
+                claim.bundle = self.submitter.bundle(claim.app_id, claim.loan_id)
+            self.track(claim)
+
+    ##############################################
+    # function: _fits
+    # arguments:
+    # - call, a pool call
+    # purpose: whether the call may be sent
+    # returns: True within claims_per_call and
+    #          max_opups
+    # notes:
+    # - every loan is checked at its worst case,
+    #   CLAIM_BUDGET per nft, so a call sized
+    #   here is not cut short by claim_nft_many
+    #   unless a loan costs more than that
+    ##############################################
+    def _fits(self, call: ClaimCall) -> bool:
+        return len(call.claims) <= self.claims_per_call and call.opups <= self.max_opups
+
+    def _groups(self, claims: list[Claim]) -> list[list[ClaimCall]]:
+        calls: list[ClaimCall] = []
+        isolated: list[list[ClaimCall]] = []
+        by_pool: dict[int, list[Claim]] = {}
+        for claim in claims:
+            pooled = claim.app_id in self.pool_app_ids
+            if claim.isolate:
+                isolated.append([ClaimCall(claim.app_id, [claim], pooled)])
+            elif pooled:
+                by_pool.setdefault(claim.app_id, []).append(claim)
+            else:
+                calls.append(ClaimCall(claim.app_id, [claim], False))
+        for app_id, pool_claims in by_pool.items():
+            batch: list[Claim] = []
+            for claim in pool_claims:
+                if batch and not self._fits(ClaimCall(app_id, batch + [claim], True)):
+                    calls.append(ClaimCall(app_id, batch, True))
+                    batch = []
+                batch.append(claim)
+            if batch:
+                calls.append(ClaimCall(app_id, batch, True))
+        # pack calls and their get_bundle calls
+        groups: list[list[ClaimCall]] = []
+        size = 0
+        for call in calls:
+            if not groups or size + call.txns > MAX_GROUP_SIZE:
+                groups.append([])
+                size = 0
+            groups[-1].append(call)
+            size += call.txns
+        return isolated + groups
+
+    ##############################################
+    # function: tick
+    # arguments:
+    # - now, the current unix time
+    # purpose: submit claims for expired loans
+    # returns: number of loans claimed
+    ##############################################
+    def tick(self, now: float | None = None) -> int:
+        now = self.clock() if now is None else now
+        self._evict(now)
+        self.ready += self.heap.pop_expired(now - self.margin)
+        due = [claim for claim in self.ready if claim.not_before <= now]
+        waiting = [claim for claim in self.ready if claim.not_before > now]
+        groups = self._groups(due)
+        claimed = 0
+        for group in groups[self.max_groups:]:
+            for call in group:
+                waiting += call.claims
+        for group in groups[:self.max_groups]:
+            group_claims = [claim for call in group for claim in call.claims]
+            try:
+                left = self.submitter.submit(group) or []
+            except Exception as e:
+                for claim in group_claims:
+                    claim.attempts += 1
+                    if claim.attempts >= self.max_attempts:
+                        logger.warning("dropping claim %s after %d attempts: %s", claim.key, claim.attempts, e)
+                        self._drop(claim, now)
+                        continue
+                    claim.isolate = True
+                    claim.not_before = now + self.backoff * 2 ** (claim.attempts - 1)
+                    waiting.append(claim)
+                continue
+            left_keys = {claim.key for claim in left}
+            group_claims = [claim for claim in group_claims if claim.key not in left_keys]
+            for claim in left:
+                claim.requeues += 1
+                if claim.requeues >= self.max_requeues:
+                    logger.warning("dropping claim %s after %d budget requeues", claim.key, claim.requeues)
+                    self._drop(claim, now)
+                else:
+                    waiting.append(claim)
+            self.claimed += group_claims
+            self._submitted.update((claim.key, now + self.pending_time) for claim in group_claims)
+            claimed += len(group_claims)
+        self.ready = waiting
+        return claimed
+
+    ##############################################
+    # function: next_wakeup
+    # arguments:
+    # - now, the current unix time
+    # purpose: time of the next deadline or retry
+    # returns: unix time, None when idle
+    ##############################################
+    def next_wakeup(self, now: float) -> float | None:
+        if any(claim.not_before <= now for claim in self.ready):
+            return now
+        times = [claim.not_before for claim in self.ready]
+        next_expiry = self.heap.next_expiry()
+        if next_expiry is not None:
+            # pop_expired takes loans strictly past expiry
+            times.append(next_expiry + self.margin + 1)
+        return min(times, default=None)
+
+    ##############################################
+    # function: run
+    # arguments:
+    # - stop, set to stop the loop
+    # - idle, max sleep in seconds, so newly
+    #   tracked loans are picked up
+    # - on_tick, called before each tick, e.g. to
+    #   sync the indexer and track new loans
+    # purpose: sleep until deadlines and claim
+    ##############################################
+    def run(
+        self,
+        stop: threading.Event | None = None,
+        idle: float = 60,
+        on_tick: Callable[["Keeper"], None] | None = None,
+    ) -> None:
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            if on_tick is not None:
+                on_tick(self)
+            now = self.clock()
+            self.tick(now)
+            wakeup = self.next_wakeup(self.clock())
+            timeout = idle if wakeup is None else min(idle, max(0.0, wakeup - self.clock()))
+            stop.wait(timeout)
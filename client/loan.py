@@ -0,0 +1,301 @@
+"""Decoding of the packed Loan record stored by the lending contracts.
+
+The single-loan contracts keep the record under the ``loan`` global state
+key and ``AssetLendingPool`` keeps one record per box named ``l`` followed
+by the big-endian loan id, so one fetch is enough to rebuild a loan. The
+``get_loan`` and ``get_loans`` methods return the same record wrapped in a
+LoanSnapshot, decoded by ``decode_snapshot`` and ``decode_snapshots``.
+The pool's offer book keeps the open offers for each lend_asset_id in a box
+named ``o`` followed by the big-endian asset id, decoded by
+``decode_offer_box``.
+"""
+import base64
+import hashlib
+import struct
+from typing import NamedTuple
+
+LOAN_KEY = b"loan"
+LOAN_BOX_PREFIX = b"l"
+CREATOR_BOX_PREFIX = b"p"
+BUNDLE_BOX_PREFIX = b"c"
+OFFER_BOX_PREFIX = b"o"
+OFFER_SLOT_BOX_PREFIX = b"x"
+OFFER_LAYOUT = struct.Struct(">QQQQQ")
+LOAN_LAYOUT = struct.Struct(">32s32sBBQQQQQQQ")
+LOAN_SIZE = LOAN_LAYOUT.size
+SNAPSHOT_SIZE = 8 + LOAN_SIZE + 8
+
+LEND_TYPE_NETWORK = 1
+LEND_TYPE_ASA = 2
+LEND_TYPE_ARC200 = 3
+
+LEND_STATUS_INITIALIZED = 0
+LEND_STATUS_SETUP = 1
+LEND_STATUS_FUNDED = 2
+LEND_STATUS_LENT = 3
+LEND_STATUS_PAID = 4
+LEND_STATUS_CLAIMED = 5
+
+LEND_STATUS_NAMES = {
+    LEND_STATUS_INITIALIZED: "initialized",
+    LEND_STATUS_SETUP: "setup",
+    LEND_STATUS_FUNDED: "funded",
+    LEND_STATUS_LENT: "lent",
+    LEND_STATUS_PAID: "paid",
+    LEND_STATUS_CLAIMED: "claimed",
+}
+
+ZERO_ADDRESS = "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAY5HFKQ"
+
+
+class Loan(NamedTuple):
+    lender: str
+    borrower: str
+    lend_type: int
+    lend_status: int
+    lend_payment_asset_id: int
+    lend_asset_id: int
+    lend_amount: int
+    lend_paid: int
+    lend_payback: int
+    lend_date: int
+    lend_time: int
+
+    @property
+    def lend_expiry(self) -> int:
+        # 0 until lent, like the contract's loan_snapshot
+        return self.lend_date + self.lend_time if self.lend_date else 0
+
+    @property
+    def status_name(self) -> str:
+        return LEND_STATUS_NAMES.get(self.lend_status, "unknown")
+
+
+class Offer(NamedTuple):
+    loan_id: int
+    lend_payment_asset_id: int
+    lend_amount: int
+    lend_payback: int
+    lend_time: int
+
+
+##############################################
+# function: encode_address
+# arguments:
+# - public_key, 32 byte account public key
+# purpose: encode an account as an address
+# returns: base32 address with checksum
+##############################################
+def encode_address(public_key: bytes) -> str:
+    checksum = hashlib.new("sha512_256", public_key).digest()[-4:]
+    return base64.b32encode(public_key + checksum).decode().rstrip("=")
+
+
+##############################################
+# function: decode_address
+# arguments:
+# - address, base32 address with checksum
+# purpose: decode an address to its public key
+# returns: 32 byte public key
+##############################################
+def decode_address(address: str) -> bytes:
+    raw = base64.b32decode(address + "=" * (-len(address) % 8))
+    public_key, checksum = raw[:32], raw[32:]
+    if hashlib.new("sha512_256", public_key).digest()[-4:] != checksum:
+        raise ValueError(f"invalid address checksum: {address}")
+    return public_key
+
+
+##############################################
+# function: decode_loan
+# arguments:
+# - value, packed Loan bytes
+# purpose: decode a packed loan record
+# returns: Loan
+##############################################
+def decode_loan(value: bytes) -> Loan:
+    if len(value) != LOAN_SIZE:
+        raise ValueError(f"loan record must be {LOAN_SIZE} bytes, got {len(value)}")
+    lender, borrower, *fields = LOAN_LAYOUT.unpack(value)
+    return Loan(encode_address(lender), encode_address(borrower), *fields)
+
+
+##############################################
+# function: encode_loan
+# arguments:
+# - loan, the loan to encode
+# purpose: encode a loan record as stored on chain
+# returns: packed Loan bytes
+##############################################
+def encode_loan(loan: Loan) -> bytes:
+    return LOAN_LAYOUT.pack(
+        decode_address(loan.lender),
+        decode_address(loan.borrower),
+        *loan[2:],
+    )
+
+
+##############################################
+# function: decode_global_state
+# arguments:
+# - global_state, algod "global-state" list
+# purpose: decode the loan of a single-loan app
+# returns: Loan
+##############################################
+def decode_global_state(global_state: list[dict]) -> Loan:
+    key = base64.b64encode(LOAN_KEY).decode()
+    for entry in global_state:
+        if entry["key"] == key:
+            return decode_loan(base64.b64decode(entry["value"]["bytes"]))
+    raise KeyError("loan not found in global state")
+
+
+##############################################
+# function: loan_box_name
+# arguments:
+# - loan_id, the pool loan id
+# purpose: get the box name of a pool loan
+# returns: box name
+##############################################
+def loan_box_name(loan_id: int) -> bytes:
+    return LOAN_BOX_PREFIX + loan_id.to_bytes(8, "big")
+
+
+##############################################
+# function: creator_box_name
+# arguments:
+# - loan_id, the pool loan id
+# purpose: get the box name of the account
+#          that paid a pool loan's setup
+# returns: box name
+##############################################
+def creator_box_name(loan_id: int) -> bytes:
+    return CREATOR_BOX_PREFIX + loan_id.to_bytes(8, "big")
+
+
+##############################################
+# function: bundle_box_name
+# arguments:
+# - loan_id, the pool loan id
+# purpose: get the box name of a bundle loan's
+#          collateral asset ids
+# returns: box name
+##############################################
+def bundle_box_name(loan_id: int) -> bytes:
+    return BUNDLE_BOX_PREFIX + loan_id.to_bytes(8, "big")
+
+
+##############################################
+# function: decode_bundle_box
+# arguments:
+# - value, the bundle box value, a uint64[]
+# purpose: decode a bundle's asset ids
+# returns: asset ids in bundle order
+##############################################
+def decode_bundle_box(value: bytes) -> tuple[int, ...]:
+    count = int.from_bytes(value[:2], "big")
+    if len(value) != 2 + 8 * count:
+        raise ValueError(f"{count} asset ids must be {2 + 8 * count} bytes, got {len(value)}")
+    return struct.unpack_from(f">{count}Q", value, 2)
+
+
+##############################################
+# function: decode_loan_box
+# arguments:
+# - name, the box name
+# - value, the box value
+# purpose: decode a pool loan box
+# returns: loan id and Loan
+##############################################
+def decode_loan_box(name: bytes, value: bytes) -> tuple[int, Loan]:
+    if len(name) != len(LOAN_BOX_PREFIX) + 8 or not name.startswith(LOAN_BOX_PREFIX):
+        raise ValueError(f"not a loan box: {name!r}")
+    return int.from_bytes(name[len(LOAN_BOX_PREFIX):], "big"), decode_loan(value)
+
+
+##############################################
+# function: decode_snapshot
+# arguments:
+# - value, a LoanSnapshot abi return value
+# purpose: decode a get_loan result
+# returns: loan or app id, Loan and expiry
+##############################################
+def decode_snapshot(value: bytes) -> tuple[int, Loan, int]:
+    if len(value) != SNAPSHOT_SIZE:
+        raise ValueError(f"snapshot must be {SNAPSHOT_SIZE} bytes, got {len(value)}")
+    loan_id = int.from_bytes(value[:8], "big")
+    lend_expiry = int.from_bytes(value[-8:], "big")
+    return loan_id, decode_loan(value[8:-8]), lend_expiry
+
+
+##############################################
+# function: decode_snapshots
+# arguments:
+# - value, a LoanSnapshot[] abi return value
+# purpose: decode a get_loans result
+# returns: list of decode_snapshot results
+##############################################
+def decode_snapshots(value: bytes) -> list[tuple[int, Loan, int]]:
+    count = int.from_bytes(value[:2], "big")
+    if len(value) != 2 + count * SNAPSHOT_SIZE:
+        raise ValueError(f"{count} snapshots must be {2 + count * SNAPSHOT_SIZE} bytes, got {len(value)}")
+    return [
+        decode_snapshot(value[2 + i * SNAPSHOT_SIZE:2 + (i + 1) * SNAPSHOT_SIZE])
+        for i in range(count)
+    ]
+
+
+##############################################
+# function: offer_box_name
+# arguments:
+# - lend_asset_id, the asset lent against
+# purpose: get the box name of an offer book
+# returns: box name
+##############################################
+def offer_box_name(lend_asset_id: int) -> bytes:
+    return OFFER_BOX_PREFIX + lend_asset_id.to_bytes(8, "big")
+
+
+##############################################
+# function: offer_slot_box_name
+# arguments:
+# - loan_id, the listed pool loan id
+# purpose: get the box name of the index of a
+#          loan's offer in its book
+# returns: box name
+##############################################
+def offer_slot_box_name(loan_id: int) -> bytes:
+    return OFFER_SLOT_BOX_PREFIX + loan_id.to_bytes(8, "big")
+
+
+##############################################
+# function: decode_offer_box
+# arguments:
+# - value, the box value
+# purpose: decode the offers of an asset
+# returns: list of Offer in book order
+##############################################
+def decode_offer_box(value: bytes) -> list[Offer]:
+    count = int.from_bytes(value[:2], "big")
+    if len(value) != 2 + count * OFFER_LAYOUT.size:
+        raise ValueError(f"{count} offers must be {2 + count * OFFER_LAYOUT.size} bytes, got {len(value)}")
+    return [Offer(*fields) for fields in OFFER_LAYOUT.iter_unpack(value[2:])]
+
+
+##############################################
+# function: best_offer
+# arguments:
+# - offers, the offers of an asset
+# - lend_payment_asset_id, 0 for network token
+# - min_lend_amount, the least amount to borrow
+# purpose: pick the offer accept_offer takes
+# returns: Offer or None
+##############################################
+def best_offer(offers: list[Offer], lend_payment_asset_id: int, min_lend_amount: int = 0) -> Offer | None:
+    best = None
+    for offer in offers:
+        if offer.lend_payment_asset_id != lend_payment_asset_id or offer.lend_amount < min_lend_amount:
+            continue
+        if best is None or offer.lend_payback * best.lend_amount < best.lend_payback * offer.lend_amount:
+            best = offer
+    return best
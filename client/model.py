@@ -0,0 +1,476 @@
+"""Pure Python model of the single-loan lending contract.
+
+LoanModel mirrors the transitions of AssetLending, for one lend_type, and its
+assertions, in the same order, including installments and rollover. A rejected
+call raises ModelError carrying the contract's assert message and leaves the
+state unchanged. State is kept in __slots__ and nothing outside the standard
+library is needed, so millions of loans can be run across a process pool:
+
+    summary = monte_carlo(Scenario(default_rate=0.2), 1_000_000, workers=8)
+    summary.counts, summary.interest
+
+Asset clawback/freeze checks in setup and balances other than the ARC-200
+allowance are not modelled. bench/consistency.py replays sampled traces on
+LocalNet and checks that the model agrees with the compiled contracts.
+"""
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from client.loan import (
+    LEND_STATUS_CLAIMED,
+    LEND_STATUS_FUNDED,
+    LEND_STATUS_INITIALIZED,
+    LEND_STATUS_LENT,
+    LEND_STATUS_PAID,
+    LEND_STATUS_SETUP,
+    LEND_TYPE_ARC200,
+    LEND_TYPE_ASA,
+    LEND_TYPE_NETWORK,
+)
+
+UINT64_MAX = 2 ** 64 - 1
+MIN_AMOUNT = 2_000_000
+
+
+class ModelError(Exception):
+    pass
+
+
+def _require(condition: bool, message: str) -> None:
+    if not condition:
+        raise ModelError(message)
+
+
+def _add(a: int, b: int) -> int:
+    _require(a + b <= UINT64_MAX, "+ overflowed")
+    return a + b
+
+
+class LoanModel:
+    __slots__ = (
+        "lender",
+        "borrower",
+        "lend_type",
+        "lend_status",
+        "lend_payment_asset_id",
+        "lend_asset_id",
+        "lend_amount",
+        "lend_paid",
+        "lend_payback",
+        "lend_date",
+        "lend_time",
+        "variant",
+        "deleted",
+    )
+
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - variant, the lend_type passed to setup,
+    #   1 network token, 2 ASA, 3 ARC-200
+    # purpose: a freshly created loan app
+    ##############################################
+    def __init__(self, variant: int) -> None:
+        self.variant = variant
+        self.lender = None
+        self.borrower = None
+        self.lend_type = 0
+        self.lend_status = LEND_STATUS_INITIALIZED
+        self.lend_payment_asset_id = 0
+        self.lend_asset_id = 0
+        self.lend_amount = 0
+        self.lend_paid = 0
+        self.lend_payback = 0
+        self.lend_date = 0
+        self.lend_time = 0
+        self.deleted = False
+
+    def setup(self, lend_payment_asset_id: int, lend_asset_id: int) -> None:
+        _require(self.lend_status == LEND_STATUS_INITIALIZED, "lend_status not initialized")
+        if self.variant == LEND_TYPE_ASA:
+            _require(lend_payment_asset_id != lend_asset_id, "lend_payment_asset_id not equal to lend_asset_id")
+        self.lend_type = self.variant
+        if self.variant != LEND_TYPE_NETWORK:
+            self.lend_payment_asset_id = lend_payment_asset_id
+        self.lend_asset_id = lend_asset_id
+        self.lend_status = LEND_STATUS_SETUP
+
+    ##############################################
+    # function: fund
+    # arguments:
+    # - sender, the lender
+    # - lend_amount, lend_payback, lend_time, the
+    #   method arguments
+    # - payment_sender, payment_amount,
+    #   payment_asset_id, the payment argument,
+    #   defaulting to a correct payment, a 0 pay
+    #   for ARC-200 loans
+    # - allowance, balance, of the lender's
+    #   ARC-200 tokens, unlimited by default
+    # purpose: fund the loan
+    ##############################################
+    def fund(
+        self,
+        sender: str,
+        lend_amount: int,
+        lend_payback: int,
+        lend_time: int,
+        payment_sender: str | None = None,
+        payment_amount: int | None = None,
+        payment_asset_id: int | None = None,
+        allowance: int | None = None,
+        balance: int | None = None,
+    ) -> None:
+        _require(self.lend_status == LEND_STATUS_SETUP, "lend_status not setup")
+        payment_amount = self._payment(sender, lend_amount, payment_sender, payment_amount, payment_asset_id)
+        if self.variant == LEND_TYPE_ARC200:
+            _require(lend_payback > lend_amount, "lend_payback accurate")
+            _require(lend_time > 0, "lend_time accurate")
+            self._transfer_from(lend_amount, allowance, balance)
+            payment_amount = lend_amount
+        else:
+            _require(payment_amount == lend_amount, "payment amount accurate")
+            _require(payment_amount > MIN_AMOUNT, "payment amount accurate")
+            _require(lend_payback > _add(payment_amount, MIN_AMOUNT), "lend_payback accurate")
+            _require(lend_time > 0, "lend_time accurate")
+        self.lender = sender
+        self.lend_amount = payment_amount
+        self.lend_payback = lend_payback
+        self.lend_time = lend_time
+        self.lend_status = LEND_STATUS_FUNDED
+
+    ##############################################
+    # function: lend_nft
+    # arguments:
+    # - sender, the borrower
+    # - now, the latest block timestamp
+    # - axfer_sender, axfer_asset_id,
+    #   axfer_amount, the nft transfer argument
+    # purpose: lend the nft
+    ##############################################
+    def lend_nft(
+        self,
+        sender: str,
+        now: int,
+        axfer_sender: str | None = None,
+        axfer_asset_id: int | None = None,
+        axfer_amount: int = 1,
+    ) -> None:
+        _require(self.lend_status == LEND_STATUS_FUNDED, "lend_status not funded")
+        _require((axfer_sender or sender) == sender, "axfer sender accurate")
+        _require(axfer_asset_id in (None, self.lend_asset_id), "axfer asset accurate")
+        _require(axfer_amount == 1, "axfer amount accurate")
+        self.borrower = sender
+        self.lend_date = now
+        self.lend_status = LEND_STATUS_LENT
+
+    ##############################################
+    # function: pay_debt
+    # arguments:
+    # - sender, the borrower
+    # - payment_sender, payment_amount,
+    #   payment_asset_id, the payment argument,
+    #   defaulting to what remains of
+    #   lend_payback, a 0 pay for ARC-200 loans
+    # - allowance, balance, of the borrower's
+    #   ARC-200 tokens, unlimited by default
+    # purpose: pay what remains of the debt
+    ##############################################
+    def pay_debt(
+        self,
+        sender: str,
+        payment_sender: str | None = None,
+        payment_amount: int | None = None,
+        payment_asset_id: int | None = None,
+        allowance: int | None = None,
+        balance: int | None = None,
+    ) -> None:
+        _require(self.lend_status == LEND_STATUS_LENT, "lend_status not lent")
+        _require(sender == self.borrower, "sender accurate")
+        remaining = self.lend_payback - self.lend_paid
+        payment_amount = self._receive(
+            self.borrower, remaining, payment_sender, payment_amount, payment_asset_id, allowance, balance,
+        )
+        _require(payment_amount == remaining, "payment amount accurate")
+        self._repay(payment_amount)
+
+    ##############################################
+    # function: pay_installment
+    # arguments:
+    # - sender, the borrower
+    # - amount, the part of lend_payback paid
+    # - payment_sender, payment_amount,
+    #   payment_asset_id, the payment argument,
+    #   defaulting to a payment of amount, a 0
+    #   pay for ARC-200 loans
+    # - allowance, balance, of the borrower's
+    #   ARC-200 tokens, unlimited by default
+    # purpose: pay part of the debt
+    ##############################################
+    def pay_installment(
+        self,
+        sender: str,
+        amount: int,
+        payment_sender: str | None = None,
+        payment_amount: int | None = None,
+        payment_asset_id: int | None = None,
+        allowance: int | None = None,
+        balance: int | None = None,
+    ) -> None:
+        _require(self.lend_status == LEND_STATUS_LENT, "lend_status not lent")
+        _require(sender == self.borrower, "sender accurate")
+        payment_amount = self._receive(
+            self.borrower, amount, payment_sender, payment_amount, payment_asset_id, allowance, balance,
+        )
+        _require(payment_amount == amount, "payment amount accurate")
+        self._repay(payment_amount)
+
+    ##############################################
+    # function: rollover
+    # arguments:
+    # - sender, the lender
+    # - lend_time, the time added to the term
+    # - payment_sender, payment_amount,
+    #   payment_asset_id, the borrower's payment
+    #   argument, defaulting to the interest, a
+    #   0 pay for ARC-200 loans
+    # - allowance, balance, of the borrower's
+    #   ARC-200 tokens, unlimited by default
+    # purpose: extend the loan for one term's
+    #          interest
+    ##############################################
+    def rollover(
+        self,
+        sender: str,
+        lend_time: int,
+        payment_sender: str | None = None,
+        payment_amount: int | None = None,
+        payment_asset_id: int | None = None,
+        allowance: int | None = None,
+        balance: int | None = None,
+    ) -> None:
+        _require(self.lend_status == LEND_STATUS_LENT, "lend_status not lent")
+        _require(sender == self.lender, "sender accurate")
+        _require(lend_time > 0, "lend_time accurate")
+        interest = self.lend_payback - self.lend_amount
+        payment_amount = self._receive(
+            self.borrower, interest, payment_sender, payment_amount, payment_asset_id, allowance, balance,
+        )
+        _require(payment_amount == interest, "payment amount accurate")
+        self.lend_time = _add(self.lend_time, lend_time)
+
+    def claim_nft(self, sender: str, now: int) -> None:
+        _require(self.lend_status == LEND_STATUS_LENT, "lend_status not lent")
+        if self.variant == LEND_TYPE_ASA:
+            _require(sender == self.lender, "sender accurate")
+        _require(now > _add(self.lend_date, self.lend_time), "lend_time expired")
+        self.lend_status = LEND_STATUS_CLAIMED
+
+    def claim_debt(self, sender: str) -> None:
+        _require(self.lend_status == LEND_STATUS_PAID, "lend_status not claimed")
+        _require(self.lend_paid > 0, "lend_paid accurate")
+        if self.variant == LEND_TYPE_ASA:
+            _require(sender == self.lender, "sender accurate")
+        self.lend_status = LEND_STATUS_CLAIMED
+
+    def close(self) -> None:
+        _require(self.lend_status == LEND_STATUS_CLAIMED, "lend_status not claimed")
+        self.deleted = True
+
+    ##############################################
+    # function: _payment
+    # arguments:
+    # - sender, the expected payer
+    # - expected, the amount of a correct payment
+    # - payment_sender, payment_amount,
+    #   payment_asset_id, the payment argument
+    # purpose: check the payment argument as
+    #          require_lend_payment does
+    # returns: amount paid, 0 for ARC-200 loans
+    ##############################################
+    def _payment(
+        self,
+        sender: str,
+        expected: int,
+        payment_sender: str | None,
+        payment_amount: int | None,
+        payment_asset_id: int | None,
+    ) -> int:
+        if self.variant == LEND_TYPE_ASA:
+            _require((payment_sender or sender) == sender, "axfer sender accurate")
+            _require(payment_asset_id in (None, self.lend_payment_asset_id), "axfer asset accurate")
+            return expected if payment_amount is None else payment_amount
+        _require((payment_sender or sender) == sender, "payment sender accurate")
+        if self.variant == LEND_TYPE_ARC200:
+            _require(not payment_amount, "payment amount accurate")
+            return 0
+        return expected if payment_amount is None else payment_amount
+
+    ##############################################
+    # function: _receive
+    # arguments:
+    # - payer, the borrower
+    # - expected, the amount owed
+    # - payment_sender, payment_amount,
+    #   payment_asset_id, the payment argument
+    # - allowance, balance, of the payer's
+    #   ARC-200 tokens
+    # purpose: take a borrower payment as
+    #          receive_payment does
+    # returns: amount paid
+    ##############################################
+    def _receive(
+        self,
+        payer: str,
+        expected: int,
+        payment_sender: str | None,
+        payment_amount: int | None,
+        payment_asset_id: int | None,
+        allowance: int | None,
+        balance: int | None,
+    ) -> int:
+        payment_amount = self._payment(payer, expected, payment_sender, payment_amount, payment_asset_id)
+        if self.variant != LEND_TYPE_ARC200:
+            return payment_amount
+        self._transfer_from(expected, allowance, balance)
+        return expected
+
+    ##############################################
+    # function: _repay
+    # arguments:
+    # - payment_amount, the amount paid
+    # purpose: add to lend_paid as repay does
+    # post-conditions:
+    # - lend_status paid once paid in full,
+    #   claimed for ARC-200 loans
+    ##############################################
+    def _repay(self, payment_amount: int) -> None:
+        _require(payment_amount > 0, "payment amount accurate")
+        lend_paid = _add(self.lend_paid, payment_amount)
+        _require(lend_paid <= self.lend_payback, "payment amount accurate")
+        self.lend_paid = lend_paid
+        if lend_paid == self.lend_payback:
+            self.lend_status = LEND_STATUS_CLAIMED if self.variant == LEND_TYPE_ARC200 else LEND_STATUS_PAID
+
+    def _transfer_from(self, amount: int, allowance: int | None, balance: int | None) -> None:
+        _require(allowance is None or allowance >= amount, "arc200_allowance accurate")
+        _require(balance is None or balance >= amount, "arc200_balanceOf accurate")
+
+    def fields(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__ if name not in ("variant", "deleted")}
+
+
+@dataclass(frozen=True)
+class Scenario:
+    lend_type: int = LEND_TYPE_NETWORK
+    # every default loan meets fund's minimums,
+    # lend_amount and the interest over MIN_AMOUNT
+    lend_amount: tuple[int, int] = (10_000_000, 100_000_000)
+    payback_ratio: tuple[float, float] = (1.25, 1.5)
+    lend_time: tuple[int, int] = (3600, 30 * 86400)
+    # borrowers that never pay
+    default_rate: float = 0.1
+    # borrowers that pay after expiry, racing the
+    # lender's claim_nft
+    late_rate: float = 0.05
+    # seconds after expiry the lender claims
+    claim_delay: int = 3600
+
+
+@dataclass
+class Summary:
+    counts: Counter = field(default_factory=Counter)
+    principal: int = 0
+    interest: int = 0
+    defaulted_principal: int = 0
+
+    def merge(self, other: "Summary") -> "Summary":
+        self.counts.update(other.counts)
+        self.principal += other.principal
+        self.interest += other.interest
+        self.defaulted_principal += other.defaulted_principal
+        return self
+
+
+##############################################
+# function: run_loans
+# arguments:
+# - scenario, the loan terms and behaviour
+# - n, loans to run
+# - seed, the random seed
+# purpose: run loans through the model
+# returns: Summary
+# notes:
+# - rejected loans are counted by message
+##############################################
+def run_loans(scenario: Scenario, n: int, seed: int = 0) -> Summary:
+    rng = random.Random(seed)
+    summary = Summary()
+    counts = summary.counts
+    lender, borrower = "lender", "borrower"
+    for _ in range(n):
+        loan = LoanModel(scenario.lend_type)
+        loan.setup(1, 2)
+        lend_amount = rng.randint(*scenario.lend_amount)
+        lend_payback = int(lend_amount * rng.uniform(*scenario.payback_ratio))
+        lend_time = rng.randint(*scenario.lend_time)
+        try:
+            loan.fund(lender, lend_amount, lend_payback, lend_time)
+        except ModelError as e:
+            counts[f"rejected: {e}"] += 1
+            continue
+        loan.lend_nft(borrower, 0)
+        summary.principal += lend_amount
+        expiry = lend_time
+        claim_time = expiry + scenario.claim_delay
+        draw = rng.random()
+        if draw < scenario.default_rate:
+            pay_time = None
+        elif draw < scenario.default_rate + scenario.late_rate:
+            pay_time = expiry + rng.randint(1, 2 * scenario.claim_delay)
+        else:
+            pay_time = rng.randint(0, expiry)
+        if pay_time is not None and pay_time < claim_time:
+            loan.pay_debt(borrower)
+            if scenario.lend_type != LEND_TYPE_ARC200:
+                loan.claim_debt(lender)
+            counts["repaid late" if pay_time > expiry else "repaid"] += 1
+            summary.interest += lend_payback - lend_amount
+        else:
+            loan.claim_nft(lender, claim_time)
+            counts["defaulted"] += 1
+            summary.defaulted_principal += lend_amount
+        loan.close()
+    return summary
+
+
+def _run_chunk(args: tuple[Scenario, int, int]) -> Summary:
+    return run_loans(*args)
+
+
+##############################################
+# function: monte_carlo
+# arguments:
+# - scenario, the loan terms and behaviour
+# - n, total loans
+# - workers, processes, None for cpu count
+# - seed, base seed, chunk i uses seed + i
+# - chunk, loans per task
+# purpose: run loans on a process pool
+# returns: merged Summary
+##############################################
+def monte_carlo(
+    scenario: Scenario,
+    n: int,
+    workers: int | None = None,
+    seed: int = 0,
+    chunk: int = 50_000,
+) -> Summary:
+    tasks = [(scenario, min(chunk, n - start), seed + i) for i, start in enumerate(range(0, n, chunk))]
+    summary = Summary()
+    with ProcessPoolExecutor(workers) as pool:
+        for part in pool.map(_run_chunk, tasks):
+            summary.merge(part)
+    return summary
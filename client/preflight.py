@@ -0,0 +1,232 @@
+"""Simulate-based preflight for lending groups.
+
+Each group is simulated before it is signed and sent. A group that would
+fail, e.g. on "lend_status not funded" or "lend_time expired", is dropped
+locally with a PreflightError naming the failed assertion, so no fee is paid
+and no round is lost. The assertion is the comment puya writes next to the
+failing assert in the approval TEAL, found through the program source map.
+
+Results are cached by the state version of the called apps and the group
+contents, ignoring validity rounds, group id and note. A repeated check
+against unchanged state is answered from the cache without a request. The
+version of an app is bumped by invalidate, which the client calls after each
+confirmed group and an indexer can call for every event it sees. Entries
+expire max_rounds rounds after the round they were simulated in, so by default
+a result is reused only within that round. This also covers state changed by
+other accounts and methods depending on the block timestamp, e.g. claim_nft.
+check reads the current round from algod when the known one is older than
+round_ttl seconds, so the round advances without any other calls.
+
+    preflight = Preflight(algod)
+    preflight.register(app_id, approval_teal)
+    result = await preflight.check(txns)
+"""
+import base64
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+from client.aio import AsyncAlgod
+
+# fields that do not change what a group does
+VOLATILE_FIELDS = ("fv", "lv", "grp", "note")
+
+
+@dataclass(frozen=True)
+class PreflightResult:
+    ok: bool
+    opcode_cost: int
+    message: str = ""
+    failed_at: tuple[int, ...] = ()
+    app_id: int = 0
+    pc: int | None = None
+    assertion: str | None = None
+    round: int = 0
+    cached: bool = False
+
+
+class PreflightError(Exception):
+    def __init__(self, result: PreflightResult) -> None:
+        super().__init__(result.assertion or result.message)
+        self.result = result
+
+
+class AssertionMap:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - teal, the approval program source
+    # - sourcemap, the algod compile source map
+    # purpose: map program counters to messages
+    ##############################################
+    def __init__(self, teal: str, sourcemap: dict) -> None:
+        from algosdk.source_map import SourceMap
+
+        self.lines = teal.splitlines()
+        self.pc_to_line = SourceMap(sourcemap).pc_to_line
+
+    def message(self, pc: int) -> str | None:
+        line = self.pc_to_line.get(pc)
+        if line is None or line >= len(self.lines):
+            return None
+        _, sep, comment = self.lines[line].partition("//")
+        if not sep:
+            return None
+        return comment.strip() or None
+
+
+##############################################
+# function: group_digest
+# arguments:
+# - txns, the unsigned transactions
+# purpose: hash what a group does
+# returns: hex digest
+##############################################
+def group_digest(txns: list) -> str:
+    from algosdk import encoding
+
+    h = hashlib.sha256()
+    for txn in txns:
+        fields = {k: v for k, v in txn.dictify().items() if k not in VOLATILE_FIELDS}
+        h.update(base64.b64decode(encoding.msgpack_encode(fields)))
+    return h.hexdigest()
+
+
+class Preflight:
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments:
+    # - algod, an AsyncAlgod
+    # - max_rounds, rounds a result stays valid
+    # - max_entries, cached results kept
+    # - round_ttl, seconds before the current
+    #   round is read again, under a round
+    # purpose: construct the preflight
+    ##############################################
+    def __init__(
+        self,
+        algod: AsyncAlgod,
+        max_rounds: int = 0,
+        max_entries: int = 4096,
+        round_ttl: float = 1.0,
+    ) -> None:
+        self.algod = algod
+        self.max_rounds = max_rounds
+        self.max_entries = max_entries
+        self.round_ttl = round_ttl
+        self._round_time = float("-inf")
+        self.versions: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[tuple, PreflightResult] = OrderedDict()
+        self._teal: dict[int, str] = {}
+        self._maps: dict[int, AssertionMap] = {}
+
+    ##############################################
+    # function: register
+    # arguments:
+    # - app_id, the app
+    # - teal, its approval program source
+    # purpose: name failed assertions of the app
+    # notes:
+    # - compiled on the first failure only
+    ##############################################
+    def register(self, app_id: int, teal: str) -> None:
+        self._teal[app_id] = teal
+        self._maps.pop(app_id, None)
+
+    def invalidate(self, app_id: int) -> None:
+        self.versions[app_id] = self.versions.get(app_id, 0) + 1
+
+    ##############################################
+    # function: current_round
+    # purpose: get the round, read from algod at
+    #          most once per round_ttl
+    # returns: the last round
+    ##############################################
+    async def current_round(self) -> int:
+        now = time.monotonic()
+        if now - self._round_time > self.round_ttl:
+            await self.algod.status()
+            self._round_time = now
+        return self.algod.last_round
+
+    def _key(self, txns: list) -> tuple:
+        app_ids = sorted({txn.index for txn in txns if getattr(txn, "index", 0)})
+        return tuple((app_id, self.versions.get(app_id, 0)) for app_id in app_ids), group_digest(txns)
+
+    async def _assertion(self, app_id: int, pc: int) -> str | None:
+        if app_id not in self._teal:
+            return None
+        if app_id not in self._maps:
+            compiled = await self.algod.compile(self._teal[app_id])
+            self._maps[app_id] = AssertionMap(self._teal[app_id], compiled["sourcemap"])
+        return self._maps[app_id].message(pc)
+
+    ##############################################
+    # function: simulate
+    # arguments:
+    # - txns, the unsigned transactions
+    # purpose: simulate a group without signatures
+    # returns: PreflightResult
+    ##############################################
+    async def simulate(self, txns: list) -> PreflightResult:
+        from algosdk import encoding
+        from algosdk.transaction import SignedTransaction
+
+        request = {
+            "txn-groups": [{"txns": [SignedTransaction(txn, None).dictify() for txn in txns]}],
+            "allow-empty-signatures": True,
+        }
+        response = await self.algod.simulate(base64.b64decode(encoding.msgpack_encode(request)))
+        group = response["txn-groups"][0]
+        opcode_cost = group.get("app-budget-consumed", 0)
+        round_ = response.get("last-round", self.algod.last_round)
+        message = group.get("failure-message", "")
+        if not message:
+            return PreflightResult(ok=True, opcode_cost=opcode_cost, round=round_)
+        failed_at = tuple(group.get("failed-at", ()))
+        app_id = getattr(txns[failed_at[0]], "index", 0) if len(failed_at) == 1 else 0
+        match = re.search(r"pc=(\d+)", message)
+        pc = int(match.group(1)) if match else None
+        assertion = await self._assertion(app_id, pc) if pc is not None else None
+        return PreflightResult(
+            ok=False,
+            opcode_cost=opcode_cost,
+            message=message,
+            failed_at=failed_at,
+            app_id=app_id,
+            pc=pc,
+            assertion=assertion,
+            round=round_,
+        )
+
+    ##############################################
+    # function: check
+    # arguments:
+    # - txns, the unsigned transactions
+    # purpose: simulate unless a result is cached
+    # returns: PreflightResult
+    ##############################################
+    async def check(self, txns: list) -> PreflightResult:
+        key = self._key(txns)
+        cached = self._cache.get(key)
+        if cached is not None and await self.current_round() <= cached.round + self.max_rounds:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return replace(cached, cached=True)
+        self.misses += 1
+        result = await self.simulate(txns)
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return result
+
+    async def require(self, txns: list) -> PreflightResult:
+        result = await self.check(txns)
+        if not result.ok:
+            raise PreflightError(result)
+        return result
@@ -0,0 +1,222 @@
+"""Streaming, zero-copy decoding of loan records, events and ABI returns.
+
+Loan records, snapshots and events are read straight from a memoryview
+with a precompiled struct layout, and every decoder yields compact records
+from a generator. Binary buffers are
+never copied into intermediate bytes objects, only base64 state values are
+decoded once, and addresses are encoded only on request. A
+dump of millions of loans is streamed from a memory-mapped file without
+loading it:
+
+    for record in iter_dump("loans.bin"):            # LoanSnapshot records
+        record.loan_id, record.lend_status, record.lend_expiry
+
+    for app_id, record in iter_global_states(apps):  # algod application info
+        record.to_loan()                             # client.loan.Loan
+
+    for value in iter_returns(logs):                 # batched ABI returns
+        snapshots = iter_snapshots(value)
+
+    balances = list(iter_uint256(logs))              # ARC-200 uint256 returns
+
+Records keep lender and borrower as 32 byte public keys. to_loan encodes
+them as addresses.
+"""
+import binascii
+import mmap
+import struct
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+
+from client.aio import RETURN_PREFIX
+from client.events import EVENT_LAYOUTS, Event
+from client.loan import LOAN_BOX_PREFIX, LOAN_KEY, LOAN_LAYOUT, Loan, encode_address
+
+# loan id, packed Loan, lend_expiry
+SNAPSHOT_LAYOUT = struct.Struct(">Q32s32sBBQQQQQQQQ")
+UINT256_SIZE = 32
+LOAN_KEY_B64 = binascii.b2a_base64(LOAN_KEY, newline=False).decode()
+
+
+class LoanRecord(NamedTuple):
+    loan_id: int
+    lender: bytes
+    borrower: bytes
+    lend_type: int
+    lend_status: int
+    lend_payment_asset_id: int
+    lend_asset_id: int
+    lend_amount: int
+    lend_paid: int
+    lend_payback: int
+    lend_date: int
+    lend_time: int
+    lend_expiry: int
+
+    def to_loan(self) -> Loan:
+        return Loan(encode_address(self.lender), encode_address(self.borrower), *self[3:12])
+
+
+def _record(loan_id: int, fields: tuple) -> LoanRecord:
+    return LoanRecord(loan_id, *fields, fields[9] + fields[10] if fields[9] else 0)
+
+
+##############################################
+# function: iter_loans
+# arguments:
+# - buffer, concatenated packed Loan records
+# - loan_ids, ids of the records if known
+# purpose: stream packed loans
+# returns: generator of LoanRecord
+##############################################
+def iter_loans(buffer, loan_ids: Iterable[int] | None = None) -> Iterator[LoanRecord]:
+    view = memoryview(buffer)
+    if len(view) % LOAN_LAYOUT.size:
+        raise ValueError(f"loan records must be a multiple of {LOAN_LAYOUT.size} bytes, got {len(view)}")
+    ids = iter(loan_ids) if loan_ids is not None else None
+    for fields in LOAN_LAYOUT.iter_unpack(view):
+        yield _record(next(ids) if ids is not None else 0, fields)
+
+
+##############################################
+# function: iter_snapshots
+# arguments:
+# - buffer, a LoanSnapshot[] abi value, with
+#   its 2 byte length, or concatenated
+#   LoanSnapshot records without one
+# - counted, whether the length is present
+# purpose: stream get_loans results and dumps
+# returns: generator of LoanRecord
+##############################################
+def iter_snapshots(buffer, counted: bool = True) -> Iterator[LoanRecord]:
+    view = memoryview(buffer)
+    if counted:
+        count = int.from_bytes(view[:2], "big")
+        view = view[2:]
+        if len(view) != count * SNAPSHOT_LAYOUT.size:
+            raise ValueError(f"{count} snapshots must be {2 + count * SNAPSHOT_LAYOUT.size} bytes, got {2 + len(view)}")
+    elif len(view) % SNAPSHOT_LAYOUT.size:
+        raise ValueError(f"snapshots must be a multiple of {SNAPSHOT_LAYOUT.size} bytes, got {len(view)}")
+    for fields in SNAPSHOT_LAYOUT.iter_unpack(view):
+        yield LoanRecord._make(fields)
+
+
+##############################################
+# function: iter_dump
+# arguments:
+# - path, a file of concatenated LoanSnapshot
+#   records
+# purpose: stream a loan dump from disk
+# returns: generator of LoanRecord
+# notes:
+# - the file is memory-mapped, so only the
+#   pages being decoded are resident
+##############################################
+def iter_dump(path: str | Path) -> Iterator[LoanRecord]:
+    with open(path, "rb") as f:
+        if Path(path).stat().st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            records = iter_snapshots(view, counted=False)
+            try:
+                yield from records
+            finally:
+                # drop the exports before unmapping
+                records.close()
+                view.release()
+
+
+##############################################
+# function: iter_global_states
+# arguments:
+# - apps, algod application info responses
+# purpose: stream the loans of single-loan apps
+# returns: generator of app id and LoanRecord
+# notes:
+# - apps without a loan key are skipped
+##############################################
+def iter_global_states(apps: Iterable[dict]) -> Iterator[tuple[int, LoanRecord]]:
+    for app in apps:
+        for entry in app["params"].get("global-state", ()):
+            if entry["key"] == LOAN_KEY_B64:
+                value = binascii.a2b_base64(entry["value"]["bytes"])
+                if len(value) == LOAN_LAYOUT.size:
+                    yield app["id"], _record(0, LOAN_LAYOUT.unpack(value))
+                break
+
+
+##############################################
+# function: iter_loan_boxes
+# arguments:
+# - boxes, (name, value) pairs of pool boxes
+# purpose: stream the loans of a pool
+# returns: generator of LoanRecord
+# notes:
+# - boxes other than loan boxes are skipped
+##############################################
+def iter_loan_boxes(boxes: Iterable[tuple[bytes, bytes]]) -> Iterator[LoanRecord]:
+    for name, value in boxes:
+        if len(name) == len(LOAN_BOX_PREFIX) + 8 and name[:1] == LOAN_BOX_PREFIX and len(value) == LOAN_LAYOUT.size:
+            yield _record(int.from_bytes(name[1:], "big"), LOAN_LAYOUT.unpack(value))
+
+
+##############################################
+# function: iter_returns
+# arguments:
+# - logs, raw logs of a group's app calls
+# purpose: find the abi return values
+# returns: generator of memoryviews past the
+#          return prefix
+##############################################
+def iter_returns(logs: Iterable[bytes]) -> Iterator[memoryview]:
+    for log in logs:
+        if log[:4] == RETURN_PREFIX:
+            yield memoryview(log)[4:]
+
+
+##############################################
+# function: iter_uint256
+# arguments:
+# - logs, raw logs, e.g. of arc200_balanceOf
+#   and arc200_allowance calls
+# purpose: decode uint256 abi returns
+# returns: generator of int
+# notes:
+# - returns of other sizes are skipped
+# - logs are sliced directly, a memoryview
+#   from iter_returns costs more than the 32
+#   byte copy it saves
+##############################################
+def iter_uint256(logs: Iterable[bytes]) -> Iterator[int]:
+    for log in logs:
+        if len(log) == 4 + UINT256_SIZE and log[:4] == RETURN_PREFIX:
+            yield int.from_bytes(log[4:], "big")
+
+
+##############################################
+# function: iter_events
+# arguments:
+# - logs, raw logs of the lending apps
+# - addresses, encode lender and borrower
+# purpose: stream loan events
+# returns: generator of Event
+# notes:
+# - with addresses False, lender and borrower
+#   stay 32 byte public keys
+##############################################
+def iter_events(logs: Iterable[bytes], addresses: bool = False) -> Iterator[Event]:
+    for log in logs:
+        view = memoryview(log)
+        entry = EVENT_LAYOUTS.get(bytes(view[:4]))
+        if entry is None:
+            continue
+        name, layout, fields = entry
+        if len(view) != 4 + layout.size:
+            continue
+        values = dict(zip(fields, layout.unpack_from(view, 4)))
+        if addresses:
+            for key in ("lender", "borrower"):
+                if key in values:
+                    values[key] = encode_address(values[key])
+        yield Event(name, values.pop("loan_id"), values)
@@ -1,21 +1,137 @@
 from algopy import (
     ARC4Contract, 
     Account,
+    Application,
     Asset,
+    BigUInt,
+    BoxMap,
     Global,
     OnCompleteAction,
+    OpUpFeeSource,
     Txn,
     UInt64,
     arc4,
+    compile_contract,
+    ensure_budget,
+    gtxn,
     itxn,
     op,
+    subroutine,
+    urange,
 )
 from utils import (
-    require_payment,
-    require_asset_transfer,
-    app_asset_opt_in
+    require_payment_txn,
+    require_asset_transfer_txn,
+    require_lend_payment,
+    app_asset_opt_in,
+    arc200_transfer,
+    arc200_transfer_from,
+    budget_used,
+    reserve_budget,
 )
 
+##############################################
+# struct: Loan
+# purpose: packed loan record
+# notes:
+# - 122 bytes, fits a single global state
+#   value or box
+##############################################
+class Loan(arc4.Struct):
+    lender: arc4.Address
+    borrower: arc4.Address
+    lend_type: arc4.UInt8
+    lend_status: arc4.UInt8
+    lend_payment_asset_id: arc4.UInt64
+    lend_asset_id: arc4.UInt64
+    lend_amount: arc4.UInt64
+    lend_paid: arc4.UInt64
+    lend_payback: arc4.UInt64
+    lend_date: arc4.UInt64
+    lend_time: arc4.UInt64
+
+##############################################
+# struct: LoanSnapshot
+# purpose: loan as returned by get_loan(s)
+# notes:
+# - loan_id is 0 from get_loan of single-loan
+#   apps, the app id from their get_loans
+# - lend_expiry is 0 until the loan is lent
+# - 138 bytes, so at most 7 fit the 1024 byte
+#   return log of get_loans
+##############################################
+class LoanSnapshot(arc4.Struct):
+    loan_id: arc4.UInt64
+    loan: Loan
+    lend_expiry: arc4.UInt64
+
+MAX_SNAPSHOTS = 7
+
+##############################################
+# function: loan_snapshot (internal)
+# arguments:
+# - loan_id, the loan or app id
+# - loan, the loan record
+# purpose: build a snapshot with derived fields
+# returns: LoanSnapshot
+##############################################
+@subroutine
+def loan_snapshot(loan_id: UInt64, loan: Loan) -> LoanSnapshot:
+    lend_expiry = UInt64(0)
+    if loan.lend_date.native != UInt64(0):
+        lend_expiry = loan.lend_date.native + loan.lend_time.native
+    return LoanSnapshot(
+        loan_id=arc4.UInt64(loan_id),
+        loan=loan.copy(),
+        lend_expiry=arc4.UInt64(lend_expiry),
+    )
+
+##############################################
+# events: loan state transitions (arc28)
+# notes:
+# - loan_id is 0 for single-loan apps
+##############################################
+class LoanSetup(arc4.Struct):
+    loan_id: arc4.UInt64
+    lend_type: arc4.UInt8
+    lend_payment_asset_id: arc4.UInt64
+    lend_asset_id: arc4.UInt64
+
+class LoanFunded(arc4.Struct):
+    loan_id: arc4.UInt64
+    lender: arc4.Address
+    lend_amount: arc4.UInt64
+    lend_payback: arc4.UInt64
+    lend_time: arc4.UInt64
+
+class LoanLent(arc4.Struct):
+    loan_id: arc4.UInt64
+    borrower: arc4.Address
+    lend_date: arc4.UInt64
+
+class LoanPaid(arc4.Struct):
+    loan_id: arc4.UInt64
+    lend_paid: arc4.UInt64
+    lend_status: arc4.UInt8
+
+class LoanNftClaimed(arc4.Struct):
+    loan_id: arc4.UInt64
+    lender: arc4.Address
+
+class LoanDebtClaimed(arc4.Struct):
+    loan_id: arc4.UInt64
+    lend_payback: arc4.UInt64
+
+class LoanClosed(arc4.Struct):
+    loan_id: arc4.UInt64
+
+class LoanRolledOver(arc4.Struct):
+    loan_id: arc4.UInt64
+    lend_time: arc4.UInt64
+
+class LoanWithdrawn(arc4.Struct):
+    loan_id: arc4.UInt64
+
 class AssetLendingBase(ARC4Contract):
     ##############################################
     # function: __init__ (builtin)
@@ -23,19 +139,28 @@ class AssetLendingBase(ARC4Contract):
     # purpose: construct initial state
     # pre-conditions: None
     # post-conditions: initial state set
+    # notes:
+    # - fund, lend_nft and pay_debt are defined
+    #   by AssetLending, which picks the payment
+    #   leg from the stored lend_type
+    # - loan state is a single packed Loan kept
+    #   under the "loan" key, read once at method
+    #   entry and written once at exit
     ##############################################
     def __init__(self) -> None:
-        self.lender = Account()                 # zero address
-        self.borrower = Account()               # zero address
-        self.lend_type = UInt64()               # 0
-        self.lend_payment_asset_id = UInt64()   # 0
-        self.lend_asset_id = UInt64()           # 0
-        self.lend_amount = UInt64()             # 0
-        self.lend_paid = UInt64()               # 0
-        self.lend_status = UInt64()             # ""
-        self.lend_payback = UInt64()            # 0
-        self.lend_date = UInt64()               # 0
-        self.lend_time = UInt64()               # 0
+        self.loan = Loan(
+            lender=arc4.Address(),              # zero address
+            borrower=arc4.Address(),            # zero address
+            lend_type=arc4.UInt8(0),            # 0
+            lend_status=arc4.UInt8(0),          # 0
+            lend_payment_asset_id=arc4.UInt64(0),
+            lend_asset_id=arc4.UInt64(0),
+            lend_amount=arc4.UInt64(0),
+            lend_paid=arc4.UInt64(0),
+            lend_payback=arc4.UInt64(0),
+            lend_date=arc4.UInt64(0),
+            lend_time=arc4.UInt64(0),
+        )
 
     ##############################################
     # function: setup
@@ -55,47 +180,6 @@ class AssetLendingBase(ARC4Contract):
     ) -> None:
         pass
 
-    ##############################################
-    # function: fund
-    # arguments: 
-    # - lend_payback, the amount to pay back
-    # - lend_time, the time to pay back
-    # purpose: fund the contract
-    # post-conditions: lend_status funded
-    ##############################################
-    @arc4.abimethod
-    def fund(
-        self, 
-        lend_amount: arc4.UInt64,
-        lend_payback: arc4.UInt64,
-        lend_time: arc4.UInt64,
-    ) -> None:
-        pass
-
-    ##############################################
-    # function: lend_nft
-    # arguments: None
-    # purpose: lend the nft
-    # post-conditions: lend_status lent
-    ##############################################
-    @arc4.abimethod
-    def lend_nft(
-        self,
-    ) -> None:
-        pass 
-
-    ##############################################
-    # function: pay_debt
-    # arguments: None
-    # purpose: pay dept
-    # post-conditions: lend_status paid
-    ##############################################
-    @arc4.abimethod
-    def pay_debt(
-        self
-    ) -> None:
-        pass
-
     ##############################################
     # function: claim_nft
     # arguments: None
@@ -120,6 +204,42 @@ class AssetLendingBase(ARC4Contract):
     ) -> None:
         pass
 
+    ##############################################
+    # function: get_loan
+    # arguments: None
+    # purpose: read the loan in one call
+    # returns: LoanSnapshot with loan_id 0
+    # notes:
+    # - readonly, call through simulate
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def get_loan(self) -> LoanSnapshot:
+        return loan_snapshot(UInt64(0), self.loan.copy())
+
+    ##############################################
+    # function: get_loans
+    # arguments:
+    # - app_ids, single-loan apps to read
+    # purpose: read the loans of many apps
+    # returns: LoanSnapshot per app, loan_id set
+    #          to the app id
+    # notes:
+    # - readonly, call through simulate
+    # - at most MAX_SNAPSHOTS app ids per call
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def get_loans(
+        self,
+        app_ids: arc4.DynamicArray[arc4.UInt64],
+    ) -> arc4.DynamicArray[LoanSnapshot]:
+        assert app_ids.length <= UInt64(MAX_SNAPSHOTS), "app_ids length accurate"
+        snapshots = arc4.DynamicArray[LoanSnapshot]()
+        for app_id in app_ids:
+            value, exists = op.AppGlobal.get_ex_bytes(Application(app_id.native), b"loan")
+            assert exists, "loan exists"
+            snapshots.append(loan_snapshot(app_id.native, Loan.from_bytes(value)))
+        return snapshots
+
     ##############################################
     # function: close
     # purpose: deletes contract
@@ -136,32 +256,38 @@ class AssetLendingBase(ARC4Contract):
         OnCompleteAction.DeleteApplication
     ])
     def close(self) -> None:
+        loan = self.loan.copy()
         ###########################################
-        assert self.lend_status == UInt64(5), "lend_status not claimed"
+        assert loan.lend_status == arc4.UInt8(5), "lend_status not claimed"
         ###########################################
         oca = Txn.on_completion
         if oca == OnCompleteAction.DeleteApplication:
+            arc4.emit(LoanClosed(loan_id=arc4.UInt64(0)))
             itxn.Payment(
-                receiver=self.lender,
-                close_remainder_to=self.lender
+                receiver=loan.lender.native,
+                close_remainder_to=loan.lender.native
             ).submit()
         else:
             op.err() 
 
-class NTAssetLending(AssetLendingBase):
+class AssetLending(AssetLendingBase):
     ##############################################
     # function: setup
+    # arguments:
+    # - lend_type, the type of lending
+    # - lend_payment_asset_id, the asset to be lent
+    # - lend_asset_id, the asset to be paid back
     # purpose: prepare for lending
     # pre-conditions:
     # - lend_status is 0
     # post-conditions:
+    # - lend_type set
+    # - lend_payment_asset set
     # - lend_asset set
-    # - lend_payback set
-    # - lend_time set
-    # - lender set
-    # - lend_amount set
     # notes:
     # - should be called by app creator
+    # - every later method picks the payment leg
+    #   from the stored lend_type
     ##############################################
     @arc4.abimethod
     def setup(
@@ -170,490 +296,1761 @@ class NTAssetLending(AssetLendingBase):
         lend_payment_asset_id: UInt64,
         lend_asset_id: UInt64,
     ) -> None:
+        loan = self.loan.copy()
         ##########################################
-        assert self.lend_status == UInt64(0), "lend_status not initialized"
+        assert loan.lend_status == arc4.UInt8(0), "lend_status not initialized"
+        assert lend_type >= UInt64(1), "lend_type accurate"
+        assert lend_type <= UInt64(3), "lend_type accurate"
         ##########################################
+        if lend_type == UInt64(2):
+            lend_payment_asset = Asset(lend_payment_asset_id)
+            assert lend_payment_asset_id != lend_asset_id, "lend_payment_asset_id not equal to lend_asset_id"
+            assert lend_payment_asset.clawback == Global.zero_address, "lend_payment_asset not clawback"
+            assert lend_payment_asset.freeze == Global.zero_address, "lend_payment_asset not freeze"
+            app_asset_opt_in(lend_payment_asset)
+        if lend_type == UInt64(1):
+            lend_payment_asset_id = UInt64(0)
         lend_asset = Asset(lend_asset_id)
         assert lend_asset.clawback == Global.zero_address, "lend_asset not clawback"
         assert lend_asset.freeze == Global.zero_address, "lend_asset not freeze"
         ##########################################
         app_asset_opt_in(lend_asset)
         ##########################################
-        self.lend_type = UInt64(1)
-        self.lend_asset_id = lend_asset_id
-        self.lend_status = UInt64(1)
+        loan.lend_type = arc4.UInt8(lend_type)
+        loan.lend_payment_asset_id = arc4.UInt64(lend_payment_asset_id)
+        loan.lend_asset_id = arc4.UInt64(lend_asset_id)
+        loan.lend_status = arc4.UInt8(1)
+        self.loan = loan.copy()
+        arc4.emit(LoanSetup(
+            loan_id=arc4.UInt64(0),
+            lend_type=loan.lend_type,
+            lend_payment_asset_id=loan.lend_payment_asset_id,
+            lend_asset_id=loan.lend_asset_id,
+        ))
+
+    ##############################################
+    # function: send_payment (internal)
+    # arguments:
+    # - loan, the loan
+    # - receiver, the account to pay
+    # - amount, the amount to pay
+    # purpose: pay out in the lend_type's asset
+    # post-conditions: amount sent
+    ##############################################
+    @subroutine
+    def send_payment(self, loan: Loan, receiver: Account, amount: UInt64) -> None:
+        lend_type = loan.lend_type.native
+        if lend_type == UInt64(1):
+            itxn.Payment(
+                amount=amount,
+                receiver=receiver
+            ).submit()
+        elif lend_type == UInt64(2):
+            itxn.AssetTransfer(
+                asset_amount=amount,
+                asset_receiver=receiver,
+                xfer_asset=Asset(loan.lend_payment_asset_id.native)
+            ).submit()
+        else:
+            arc200_transfer(
+                loan.lend_payment_asset_id.native,
+                receiver,
+                amount
+            )
+
+    ##############################################
+    # function: receive_payment (internal)
+    # arguments:
+    # - loan, the lent loan
+    # - payment, the borrower's transaction
+    #   argument
+    # - amount, the amount taken from arc200
+    #   borrowers
+    # purpose: take a borrower payment in the
+    #          lend_type's asset
+    # pre-conditions:
+    # - arc200 amount approved to the app
+    # returns: amount paid
+    # notes:
+    # - arc200 payments go straight to the lender
+    ##############################################
+    @subroutine
+    def receive_payment(self, loan: Loan, payment: gtxn.Transaction, amount: UInt64) -> UInt64:
+        lend_type = loan.lend_type.native
+        lend_payment_asset = Asset(loan.lend_payment_asset_id.native)
+        payment_amount = require_lend_payment(loan.borrower.native, payment, lend_type, lend_payment_asset)
+        if lend_type != UInt64(3):
+            return payment_amount
+        arc200_transfer_from(
+            loan.lend_payment_asset_id.native,
+            loan.borrower.native,
+            loan.lender.native,
+            amount
+        )
+        return amount
 
     ##############################################
     # function: fund
-    # arguments: None
+    # arguments:
+    # - payment, pay or axfer of lend_amount, a
+    #   0 pay for arc200 loans
+    # - lend_amount, the amount to lend
+    # - lend_payback, the amount to pay back
+    # - lend_time, the time to pay back
     # purpose: fund the contract
-    # post-conditions: lend_status funded
+    # pre-conditions:
+    # - arc200 lend_amount approved to the app
+    # post-conditions:
+    # - arc200 lend_amount escrowed by the app
+    # - lend_status funded
     ##############################################
     @arc4.abimethod
     def fund(
         self, 
+        payment: gtxn.Transaction,
         lend_amount: arc4.UInt64,
         lend_payback: arc4.UInt64,
         lend_time: arc4.UInt64,
     ) -> None:
+        loan = self.loan.copy()
         ##########################################
-        assert self.lend_status == UInt64(1), "lend_status not setup"
+        assert loan.lend_status == arc4.UInt8(1), "lend_status not setup"
         ##########################################
-        lender = Txn.sender
-        payment_amount = require_payment(Txn.sender, UInt64(1))
-        assert payment_amount == lend_amount, "payment amount accurate"
-        assert payment_amount > UInt64(2000000), "payment amount accurate"
-        assert self.lend_payback > payment_amount + UInt64(2000000), "lend_payback accurate"
+        lend_type = loan.lend_type.native
+        lend_payment_asset = Asset(loan.lend_payment_asset_id.native)
+        payment_amount = require_lend_payment(Txn.sender, payment, lend_type, lend_payment_asset)
+        if lend_type == UInt64(3):
+            payment_amount = lend_amount.native
+            assert lend_payback > lend_amount, "lend_payback accurate"
+        else:
+            assert payment_amount == lend_amount, "payment amount accurate"
+            assert payment_amount > UInt64(2000000), "payment amount accurate"
+            assert lend_payback > payment_amount + UInt64(2000000), "lend_payback accurate"
         assert lend_time > UInt64(0), "lend_time accurate"
+        if lend_type == UInt64(3):
+            arc200_transfer_from(
+                loan.lend_payment_asset_id.native,
+                Txn.sender,
+                Global.current_application_address,
+                payment_amount
+            )
         ##########################################
-        self.lender = lender
-        self.lend_amount = payment_amount
-        self.lend_payback = lend_payback.native
-        self.lend_time = lend_time.native
-        self.lend_status = UInt64(2)
+        loan.lender = arc4.Address(Txn.sender)
+        loan.lend_amount = arc4.UInt64(payment_amount)
+        loan.lend_payback = lend_payback
+        loan.lend_time = lend_time
+        loan.lend_status = arc4.UInt8(2)
+        self.loan = loan.copy()
+        arc4.emit(LoanFunded(
+            loan_id=arc4.UInt64(0),
+            lender=loan.lender,
+            lend_amount=loan.lend_amount,
+            lend_payback=loan.lend_payback,
+            lend_time=loan.lend_time,
+        ))
 
     ##############################################
     # function: lend_nft
-    # arguments: None
+    # arguments:
+    # - axfer, the transfer of the nft
     # purpose: lend the nft
     # post-conditions: lend_status lent
     ##############################################
     @arc4.abimethod
     def lend_nft(
         self,
+        axfer: gtxn.AssetTransferTransaction,
     ) -> None:
+        loan = self.loan.copy()
         ##########################################
-        assert self.lend_status == UInt64(2), "lend_status not funded"
+        assert loan.lend_status == arc4.UInt8(2), "lend_status not funded"
         ##########################################
-        lend_asset = Asset(self.lend_asset_id)
-        axfer_amount = require_asset_transfer(Txn.sender, UInt64(1), lend_asset)
+        lend_asset = Asset(loan.lend_asset_id.native)
+        axfer_amount = require_asset_transfer_txn(Txn.sender, axfer, lend_asset)
         assert axfer_amount == UInt64(1), "axfer amount accurate"
         ##########################################
         borrower = Txn.sender
+        self.send_payment(loan.copy(), borrower, loan.lend_amount.native)
         ##########################################
-        itxn.Payment(
-            amount=self.lend_amount,
-            receiver=borrower
-        ).submit()
-        ##########################################
-        self.borrower = borrower
-        self.lend_date = Global.latest_timestamp
-        self.lend_status = UInt64(3)
-
-    ##############################################
-    # function: pay_debt
-    # arguments: None
-    # purpose: pay dept
-    # post-conditions: lend_status paid
-    ##############################################
-    @arc4.abimethod
-    def pay_debt(
-        self
-    ) -> None:
-        ##########################################
-        assert self.lend_status == UInt64(3), "lend_status not lent"
-        ##########################################
-        assert Txn.sender == self.borrower, "sender accurate"
-        payment_amount = require_payment(Txn.sender, UInt64(1))
-        assert payment_amount == self.lend_payback, "payment amount accurate"
-        ##########################################
-        lend_asset = Asset(self.lend_asset_id)
-        itxn.AssetTransfer(
-            asset_amount=UInt64(1),
-            asset_receiver=self.borrower,
-            xfer_asset=lend_asset,
-            asset_close_to=lend_asset.creator
-        ).submit()
-        ##########################################
-        self.lend_paid = payment_amount
-        self.lend_status = UInt64(4)
+        loan.borrower = arc4.Address(borrower)
+        loan.lend_date = arc4.UInt64(Global.latest_timestamp)
+        loan.lend_status = arc4.UInt8(3)
+        self.loan = loan.copy()
+        arc4.emit(LoanLent(
+            loan_id=arc4.UInt64(0),
+            borrower=loan.borrower,
+            lend_date=loan.lend_date,
+        ))
 
     ##############################################
-    # function: claim_nft
-    # arguments: None
-    # purpose: claim the nft
-    # post-conditions: nft claimed
+    # function: repay (internal)
+    # arguments:
+    # - loan, the loan being paid
+    # - payment_amount, the amount paid
+    # purpose: add a payment to lend_paid and
+    #          return the nft once paid in full
+    # post-conditions:
+    # - lend_paid increased
+    # - lend_status paid when lend_paid reaches
+    #   lend_payback, claimed for arc200 loans
     ##############################################
-    @arc4.abimethod
-    def claim_nft(
-        self
-    ) -> None:
-        ##########################################
-        assert self.lend_status == UInt64(3), "lend_status not lent"
+    @subroutine
+    def repay(self, loan: Loan, payment_amount: UInt64) -> None:
+        assert payment_amount > UInt64(0), "payment amount accurate"
+        lend_paid = loan.lend_paid.native + payment_amount
+        assert lend_paid <= loan.lend_payback.native, "payment amount accurate"
+        loan.lend_paid = arc4.UInt64(lend_paid)
         ##########################################
-        assert Global.latest_timestamp > self.lend_date + self.lend_time, "lend_time expired"
-        ##########################################
-        lend_asset = Asset(self.lend_asset_id)
-        itxn.AssetTransfer(
-            asset_amount=UInt64(1),
-            asset_receiver=self.lender,
-            xfer_asset=lend_asset,
-            asset_close_to=lend_asset.creator
-        ).submit()
+        if lend_paid == loan.lend_payback.native:
+            lend_asset = Asset(loan.lend_asset_id.native)
+            itxn.AssetTransfer(
+                asset_amount=UInt64(1),
+                asset_receiver=loan.borrower.native,
+                xfer_asset=lend_asset,
+                asset_close_to=lend_asset.creator
+            ).submit()
+            if loan.lend_type == arc4.UInt8(3):
+                loan.lend_status = arc4.UInt8(5)
+            else:
+                loan.lend_status = arc4.UInt8(4)
         ##########################################
-        self.lend_status = UInt64(5)
+        self.loan = loan.copy()
+        arc4.emit(LoanPaid(
+            loan_id=arc4.UInt64(0),
+            lend_paid=loan.lend_paid,
+            lend_status=loan.lend_status,
+        ))
 
     ##############################################
-    # function: claim_debt
-    # arguments: None
-    # purpose: claim the debt
-    # post-conditions: lend_status claimed
+    # function: pay_debt
+    # arguments:
+    # - payment, pay or axfer of what remains of
+    #   lend_payback, a 0 pay for arc200 loans
+    # purpose: pay what remains of lend_payback
+    # pre-conditions:
+    # - arc200 amount approved to the app
+    # post-conditions:
+    # - lend_status paid
+    # - lend_status claimed for arc200 loans
     ##############################################
     @arc4.abimethod
-    def claim_debt(
-        self
+    def pay_debt(
+        self,
+        payment: gtxn.Transaction,
     ) -> None:
+        loan = self.loan.copy()
         ##########################################
-        assert self.lend_status == UInt64(4), "lend_status not claimed"
-        assert self.lend_paid > 0, "lend_paid accurate"
-        ##########################################
-        itxn.Payment(
-            amount=self.lend_payback,
-            receiver=self.lender
-        ).submit()
+        assert loan.lend_status == arc4.UInt8(3), "lend_status not lent"
         ##########################################
-        self.lend_status = UInt64(5)
+        assert Txn.sender == loan.borrower.native, "sender accurate"
+        remaining = loan.lend_payback.native - loan.lend_paid.native
+        payment_amount = self.receive_payment(loan.copy(), payment, remaining)
+        assert payment_amount == remaining, "payment amount accurate"
+        self.repay(loan.copy(), payment_amount)
 
-class NNTAssetLending(AssetLendingBase):
     ##############################################
-    # function: setup
-    # purpose: prepare for lending
+    # function: pay_installment
+    # arguments:
+    # - payment, pay or axfer of amount, a 0 pay
+    #   for arc200 loans
+    # - amount, a part of lend_payback
+    # purpose: pay part of the debt
     # pre-conditions:
-    # - lend_status is 0
+    # - arc200 amount approved to the app
     # post-conditions:
-    # - lend_payment_asset set
-    # - lend_asset set
-    # - lend_payback set
-    # - lend_time set
-    # - lender set
-    # - lend_amount set
+    # - lend_paid increased
+    # - lend_status paid once paid in full,
+    #   claimed for arc200 loans
     # notes:
-    # - should be called by app creator
+    # - arc200 installments go to the lender
     ##############################################
     @arc4.abimethod
-    def setup(
-        self, 
-        lend_type: UInt64,
-        lend_payment_asset_id: UInt64,
-        lend_asset_id: UInt64,
+    def pay_installment(
+        self,
+        payment: gtxn.Transaction,
+        amount: arc4.UInt64,
     ) -> None:
+        loan = self.loan.copy()
         ##########################################
-        assert self.lend_status == UInt64(0), "lend_status not initialized"
-        ##########################################
-        lend_payment_asset = Asset(lend_payment_asset_id)
-        lend_asset = Asset(lend_asset_id)
-        assert lend_payment_asset_id != lend_asset_id, "lend_payment_asset_id not equal to lend_asset_id"
-        assert lend_payment_asset.clawback == Global.zero_address, "lend_payment_asset not clawback"
-        assert lend_payment_asset.freeze == Global.zero_address, "lend_payment_asset not freeze"
-        assert lend_asset.clawback == Global.zero_address, "lend_asset not clawback"
-        assert lend_asset.freeze == Global.zero_address, "lend_asset not freeze"
-        ##########################################
-        app_asset_opt_in(lend_payment_asset)
-        app_asset_opt_in(lend_asset)
+        assert loan.lend_status == arc4.UInt8(3), "lend_status not lent"
         ##########################################
-        self.lend_type = UInt64(2)
-        self.lend_payment_asset_id = lend_payment_asset_id
-        self.lend_asset_id = lend_asset_id
-        self.lend_status = UInt64(1)
+        assert Txn.sender == loan.borrower.native, "sender accurate"
+        payment_amount = self.receive_payment(loan.copy(), payment, amount.native)
+        assert payment_amount == amount, "payment amount accurate"
+        self.repay(loan.copy(), payment_amount)
 
     ##############################################
-    # function: fund
-    # arguments: 
-    # - lend_payback, the amount to pay back
-    # - lend_time, the time to pay back
-    # purpose: fund the contract
-    # post-conditions: lend_status funded
+    # function: rollover
+    # arguments:
+    # - payment, the borrower's pay or axfer of
+    #   the interest, lend_payback - lend_amount,
+    #   a 0 pay for arc200 loans
+    # - lend_time, the time added to the term
+    # purpose: extend the loan in place for the
+    #          interest of one term
+    # pre-conditions:
+    # - called by the lender
+    # - arc200 interest approved to the app
+    # post-conditions:
+    # - interest paid to the lender
+    # - lend_time extended
+    # notes:
+    # - the borrower signs the payment, so the
+    #   lender cannot take the interest without
+    #   the borrower
     ##############################################
     @arc4.abimethod
-    def fund(
-        self, 
-        lend_amount: arc4.UInt64,
-        lend_payback: arc4.UInt64,
-        lend_time: arc4.UInt64,
+    def rollover(
+        self,
+        payment: gtxn.Transaction,
+        lend_time: UInt64,
     ) -> None:
+        loan = self.loan.copy()
         ##########################################
-        assert self.lend_status == UInt64(1), "lend_status not setup"
+        assert loan.lend_status == arc4.UInt8(3), "lend_status not lent"
         ##########################################
-        lender = Txn.sender
-        lend_payment_asset = Asset(self.lend_payment_asset_id)
-        payment_amount = require_asset_transfer(Txn.sender, UInt64(1), lend_payment_asset)
-        assert payment_amount == lend_amount, "payment amount accurate"
-        assert payment_amount > UInt64(2000000), "payment amount accurate"
-        assert lend_payback > payment_amount + UInt64(2000000), "lend_payback accurate"
+        assert Txn.sender == loan.lender.native, "sender accurate"
         assert lend_time > UInt64(0), "lend_time accurate"
+        interest = loan.lend_payback.native - loan.lend_amount.native
+        payment_amount = self.receive_payment(loan.copy(), payment, interest)
+        assert payment_amount == interest, "payment amount accurate"
+        if loan.lend_type != arc4.UInt8(3):
+            self.send_payment(loan.copy(), loan.lender.native, interest)
         ##########################################
-        self.lender = lender
-        self.lend_amount = payment_amount
-        self.lend_payback = lend_payback.native
-        self.lend_time = lend_time.native
-        self.lend_status = UInt64(2)
-
-    ##############################################
-    # function: pay_debt
-    # arguments: None
-    # purpose: pay dept
-    # post-conditions: lend_status paid
-    ##############################################
-    @arc4.abimethod
-    def pay_debt(
-        self
-    ) -> None:
-        ##########################################
-        assert self.lend_status == UInt64(3), "lend_status not lent"
-        ##########################################
-        assert Txn.sender == self.borrower, "sender accurate"
-        lend_payment_asset = Asset(self.lend_payment_asset_id)
-        payment_amount = require_asset_transfer(Txn.sender, UInt64(1), lend_payment_asset)
-        assert payment_amount == self.lend_payback, "payment amount accurate"
-        ##########################################
-        lend_asset = Asset(self.lend_asset_id)
-        itxn.AssetTransfer(
-            asset_amount=UInt64(1),
-            asset_receiver=self.borrower,
-            xfer_asset=lend_asset,
-            asset_close_to=lend_asset.creator
-        ).submit()
-        ##########################################
-        self.lend_paid = payment_amount
-        self.lend_status = UInt64(4)
+        loan.lend_time = arc4.UInt64(loan.lend_time.native + lend_time)
+        self.loan = loan.copy()
+        arc4.emit(LoanRolledOver(loan_id=arc4.UInt64(0), lend_time=loan.lend_time))
 
     ##############################################
     # function: claim_nft
     # arguments: None
     # purpose: claim the nft
-    # post-conditions: nft claimed
+    # post-conditions: lend_status claimed
+    # notes:
+    # - asa loans are claimed by the lender only
+    #   and close out of the payment asset
+    # - installments already paid go to the
+    #   lender with the nft
     ##############################################
     @arc4.abimethod
     def claim_nft(
         self
     ) -> None:
+        loan = self.loan.copy()
         ##########################################
-        assert self.lend_status == UInt64(3), "lend_status not lent"
+        assert loan.lend_status == arc4.UInt8(3), "lend_status not lent"
         ##########################################
-        assert Txn.sender == self.lender, "sender accurate"
-        assert Global.latest_timestamp > self.lend_date + self.lend_time, "lend_time expired"
+        lend_type = loan.lend_type.native
+        if lend_type == UInt64(2):
+            assert Txn.sender == loan.lender.native, "sender accurate"
+        assert Global.latest_timestamp > loan.lend_date.native + loan.lend_time.native, "lend_time expired"
         ##########################################
-        lend_payment_asset = Asset(self.lend_payment_asset_id)
-        lend_asset = Asset(self.lend_asset_id)
+        lend_asset = Asset(loan.lend_asset_id.native)
         itxn.AssetTransfer(
             asset_amount=UInt64(1),
-            asset_receiver=self.lender,
+            asset_receiver=loan.lender.native,
             xfer_asset=lend_asset,
             asset_close_to=lend_asset.creator
         ).submit()
-        itxn.AssetTransfer(
-            asset_amount=UInt64(0),
-            asset_receiver=self.lender,
-            xfer_asset=lend_payment_asset,
-            asset_close_to=lend_payment_asset.creator
-        ).submit()
+        if lend_type == UInt64(2):
+            lend_payment_asset = Asset(loan.lend_payment_asset_id.native)
+            itxn.AssetTransfer(
+                asset_amount=loan.lend_paid.native,
+                asset_receiver=loan.lender.native,
+                xfer_asset=lend_payment_asset,
+                asset_close_to=lend_payment_asset.creator
+            ).submit()
+        elif lend_type == UInt64(1) and loan.lend_paid.native > UInt64(0):
+            itxn.Payment(
+                amount=loan.lend_paid.native,
+                receiver=loan.lender.native
+            ).submit()
         ##########################################
-        self.lend_status = UInt64(5)
+        loan.lend_status = arc4.UInt8(5)
+        self.loan = loan.copy()
+        arc4.emit(LoanNftClaimed(loan_id=arc4.UInt64(0), lender=loan.lender))
 
     ##############################################
     # function: claim_debt
     # arguments: None
     # purpose: claim the debt
     # post-conditions: lend_status claimed
+    # notes:
+    # - arc200 loans are paid to the lender in
+    #   pay_debt and go straight to claimed, so
+    #   claiming them fails
     ##############################################
     @arc4.abimethod
     def claim_debt(
         self
     ) -> None:
+        loan = self.loan.copy()
         ##########################################
-        assert self.lend_status == UInt64(4), "lend_status not claimed"
-        assert self.lend_paid > 0, "lend_paid accurate"
+        assert loan.lend_status == arc4.UInt8(4), "lend_status not claimed"
+        assert loan.lend_paid.native > 0, "lend_paid accurate"
         ##########################################
-        assert Txn.sender == self.lender, "sender accurate"
-        lend_payment_asset = Asset(self.lend_payment_asset_id)     
-        itxn.AssetTransfer(
-            asset_amount=self.lend_payback,
-            asset_receiver=self.lender,
-            xfer_asset=lend_payment_asset,
-            asset_close_to=lend_payment_asset.creator
-        ).submit()
+        lend_type = loan.lend_type.native
+        if lend_type == UInt64(2):
+            assert Txn.sender == loan.lender.native, "sender accurate"
+            lend_payment_asset = Asset(loan.lend_payment_asset_id.native)
+            itxn.AssetTransfer(
+                asset_amount=loan.lend_payback.native,
+                asset_receiver=loan.lender.native,
+                xfer_asset=lend_payment_asset,
+                asset_close_to=lend_payment_asset.creator
+            ).submit()
+        else:
+            itxn.Payment(
+                amount=loan.lend_payback.native,
+                receiver=loan.lender.native
+            ).submit()
         ##########################################
-        self.lend_status = UInt64(5)
+        loan.lend_status = arc4.UInt8(5)
+        self.loan = loan.copy()
+        arc4.emit(LoanDebtClaimed(loan_id=arc4.UInt64(0), lend_payback=loan.lend_payback))
 
-class SmartAssetLending(AssetLendingBase):
+# at most the foreign assets of one call
+MAX_BUNDLE = 8
+
+##############################################
+# struct: Offer
+# purpose: funded pool loan open to borrowers
+# notes:
+# - 40 bytes, kept with the other offers for
+#   the same lend_asset_id in one box
+##############################################
+class Offer(arc4.Struct):
+    loan_id: arc4.UInt64
+    lend_payment_asset_id: arc4.UInt64
+    lend_amount: arc4.UInt64
+    lend_payback: arc4.UInt64
+    lend_time: arc4.UInt64
+
+# box mbr of one offer and of its slot box,
+# paid at setup
+OFFER_MBR = 400 * 40 + 2500 + 400 * (9 + 8)
+# offers scanned by accept_offer, per asset
+MAX_OFFERS = 64
+# opcode budget assumed for each nft of the
+# first loan of a claim batch, later loans use
+# the most measured per nft; must cover a claim
+# of one nft
+CLAIM_BUDGET = 400
+# opcode budget kept for returning from a batch
+BATCH_RESERVE = 100
+# opcode budget of funding one loan of fund_many
+FUND_BUDGET = 800
+# opcode budget of scanning one offer, and of
+# lending against the best once found
+OFFER_BUDGET = 100
+ACCEPT_BUDGET = 400
+
+class AssetLendingPool(ARC4Contract):
     ##############################################
-    # function: setup
+    # function: __init__ (builtin)
+    # arguments: None
+    # purpose: construct initial state
+    # pre-conditions: None
+    # post-conditions: initial state set
+    # notes:
+    # - loans are kept in boxes keyed by loan id
+    #   instead of one app per loan
+    # - bundle loans keep their collateral asset
+    #   ids in a second box keyed by loan id
+    # - vetted assets are kept in boxes keyed by
+    #   asset id
+    # - open offers are kept in one box per
+    #   lend_asset_id, and the index of each
+    #   offer in a box keyed by loan id
+    # - the account that paid a loan's setup is
+    #   kept in a box keyed by loan id, so close
+    #   refunds it
+    ##############################################
+    def __init__(self) -> None:
+        self.loan_count = UInt64()              # 0
+        self.loans = BoxMap(UInt64, Loan, key_prefix="l")
+        self.creators = BoxMap(UInt64, arc4.Address, key_prefix="p")
+        self.bundles = BoxMap(UInt64, arc4.DynamicArray[arc4.UInt64], key_prefix="c")
+        self.vetted = BoxMap(UInt64, arc4.Bool, key_prefix="v")
+        self.offers = BoxMap(UInt64, arc4.DynamicArray[Offer], key_prefix="o")
+        self.offer_slots = BoxMap(UInt64, arc4.UInt64, key_prefix="x")
+
+    ##############################################
+    # function: send_payment (internal)
     # arguments:
     # - lend_type, the type of lending
     # - lend_payment_asset_id, the asset to be lent
-    # - lend_asset_id, the asset to be paid back
-    # purpose: setup lending
-    # post-conditions: lend_status setup
+    # - receiver, the account to pay
+    # - amount, the amount to pay
+    # purpose: pay out native or asa payment
+    # pre-conditions: lend_type is 1 or 2
+    # post-conditions: amount sent
     ##############################################
-    @arc4.abimethod
-    def setup(
-        self, 
+    @subroutine
+    def send_payment(
+        self,
         lend_type: UInt64,
         lend_payment_asset_id: UInt64,
-        lend_asset_id: UInt64,
+        receiver: Account,
+        amount: UInt64,
     ) -> None:
-        ##########################################
-        assert self.lend_status == UInt64(0), "lend_status not initialized"
-        ##########################################
-        lend_asset = Asset(lend_asset_id)
-        assert lend_asset.clawback == Global.zero_address, "lend_asset not clawback"
-        assert lend_asset.freeze == Global.zero_address, "lend_asset not freeze"
-        ##########################################
-        app_asset_opt_in(lend_asset)
-        ##########################################
-        self.lend_type = UInt64(3)
-        self.lend_payment_asset_id = lend_payment_asset_id
-        self.lend_asset_id = lend_asset_id
-        self.lend_status = UInt64(1)
+        if lend_type == UInt64(1):
+            itxn.Payment(
+                amount=amount,
+                receiver=receiver
+            ).submit()
+        else:
+            itxn.AssetTransfer(
+                asset_amount=amount,
+                asset_receiver=receiver,
+                xfer_asset=Asset(lend_payment_asset_id),
+            ).submit()
 
     ##############################################
-    # function: fund
-    # arguments: 
-    # - lend_payback, the amount to pay back
+    # function: send_nft (internal)
+    # arguments:
+    # - lend_asset_id, the asset lent against
+    # - receiver, the account to send to
+    # purpose: send the nft
+    # post-conditions: nft sent
+    ##############################################
+    @subroutine
+    def send_nft(self, lend_asset_id: UInt64, receiver: Account) -> None:
+        itxn.AssetTransfer(
+            asset_amount=UInt64(1),
+            asset_receiver=receiver,
+            xfer_asset=Asset(lend_asset_id),
+        ).submit()
+
+    ##############################################
+    # function: send_collateral (internal)
+    # arguments:
+    # - loan_id, the loan
+    # - lend_asset_id, the asset lent against
+    # - receiver, the account to send to
+    # purpose: send the nft or every nft of the
+    #          bundle
+    # post-conditions: collateral sent
+    ##############################################
+    @subroutine
+    def send_collateral(self, loan_id: UInt64, lend_asset_id: UInt64, receiver: Account) -> None:
+        lend_asset_ids, is_bundle = self.bundles.maybe(loan_id)
+        if is_bundle:
+            for bundle_asset_id in lend_asset_ids:
+                self.send_nft(bundle_asset_id.native, receiver)
+        else:
+            self.send_nft(lend_asset_id, receiver)
+
+    ##############################################
+    # function: collateral_count (internal)
+    # arguments:
+    # - loan_id, the loan
+    # purpose: count the nfts a loan holds
+    # returns: bundle length, 1 without a bundle
+    # notes:
+    # - reads the box length only, a bundle box
+    #   is a 2 byte length and 8 bytes per asset
+    ##############################################
+    @subroutine
+    def collateral_count(self, loan_id: UInt64) -> UInt64:
+        if loan_id in self.bundles:
+            return (self.bundles.length(loan_id) - UInt64(2)) // UInt64(8)
+        return UInt64(1)
+
+    ##############################################
+    # function: lend_asset_opt_in (internal)
+    # arguments:
+    # - lend_asset_id, the asset lent against
+    # purpose: check and opt-in to the nft once
+    # post-conditions:
+    # - asset opt-in
+    # - asset vetted
+    # notes:
+    # - a cleared clawback or freeze address can
+    #   never be set again, so a vetted asset is
+    #   not checked again
+    # - assets are shared across loans, so the
+    #   pool never closes out of them
+    ##############################################
+    @subroutine
+    def lend_asset_opt_in(self, lend_asset_id: UInt64) -> None:
+        if lend_asset_id in self.vetted:
+            return
+        lend_asset = Asset(lend_asset_id)
+        assert lend_asset.clawback == Global.zero_address, "lend_asset not clawback"
+        assert lend_asset.freeze == Global.zero_address, "lend_asset not freeze"
+        app_asset_opt_in(lend_asset)
+        self.vetted[lend_asset_id] = arc4.Bool(True)
+
+    ##############################################
+    # function: lend_payment_asset_opt_in (internal)
+    # arguments:
+    # - lend_payment_asset_id, the asset to be lent
+    # purpose: check and opt-in to the asa once
+    # post-conditions:
+    # - asset opt-in
+    # - asset vetted
+    ##############################################
+    @subroutine
+    def lend_payment_asset_opt_in(self, lend_payment_asset_id: UInt64) -> None:
+        if lend_payment_asset_id in self.vetted:
+            return
+        lend_payment_asset = Asset(lend_payment_asset_id)
+        assert lend_payment_asset.clawback == Global.zero_address, "lend_payment_asset not clawback"
+        assert lend_payment_asset.freeze == Global.zero_address, "lend_payment_asset not freeze"
+        app_asset_opt_in(lend_payment_asset)
+        self.vetted[lend_payment_asset_id] = arc4.Bool(True)
+
+    ##############################################
+    # function: open_loan (internal)
+    # arguments:
+    # - lend_type, the type of lending
+    # - lend_payment_asset_id, the asset to be lent
+    # - lend_asset_id, the asset to be paid back
+    # purpose: check assets and create the loan
+    # post-conditions:
+    # - loan and creator boxes created
+    # - lend_status setup
+    # returns: loan id
+    ##############################################
+    @subroutine
+    def open_loan(
+        self,
+        lend_type: UInt64,
+        lend_payment_asset_id: UInt64,
+        lend_asset_id: UInt64,
+    ) -> UInt64:
+        ##########################################
+        assert lend_type >= UInt64(1), "lend_type accurate"
+        assert lend_type <= UInt64(3), "lend_type accurate"
+        ##########################################
+        self.lend_asset_opt_in(lend_asset_id)
+        if lend_type == UInt64(2):
+            assert lend_payment_asset_id != lend_asset_id, "lend_payment_asset_id not equal to lend_asset_id"
+            self.lend_payment_asset_opt_in(lend_payment_asset_id)
+        if lend_type == UInt64(1):
+            lend_payment_asset_id = UInt64(0)
+        ##########################################
+        loan_id = self.loan_count
+        self.loans[loan_id] = Loan(
+            lender=arc4.Address(),
+            borrower=arc4.Address(),
+            lend_type=arc4.UInt8(lend_type),
+            lend_status=arc4.UInt8(1),
+            lend_payment_asset_id=arc4.UInt64(lend_payment_asset_id),
+            lend_asset_id=arc4.UInt64(lend_asset_id),
+            lend_amount=arc4.UInt64(0),
+            lend_paid=arc4.UInt64(0),
+            lend_payback=arc4.UInt64(0),
+            lend_date=arc4.UInt64(0),
+            lend_time=arc4.UInt64(0),
+        )
+        self.creators[loan_id] = arc4.Address(Txn.sender)
+        arc4.emit(LoanSetup(
+            loan_id=arc4.UInt64(loan_id),
+            lend_type=arc4.UInt8(lend_type),
+            lend_payment_asset_id=arc4.UInt64(lend_payment_asset_id),
+            lend_asset_id=arc4.UInt64(lend_asset_id),
+        ))
+        self.loan_count = loan_id + UInt64(1)
+        return loan_id
+
+    ##############################################
+    # function: setup
+    # arguments:
+    # - payment, covering box and opt-in mbr
+    #   and OFFER_MBR
+    # - lend_type, the type of lending
+    # - lend_payment_asset_id, the asset to be lent
+    # - lend_asset_id, the asset to be paid back
+    # purpose: open a loan in the pool
+    # post-conditions:
+    # - loan box created
+    # - lend_status setup
+    # returns: loan id
+    ##############################################
+    @arc4.abimethod
+    def setup(
+        self,
+        payment: gtxn.PaymentTransaction,
+        lend_type: UInt64,
+        lend_payment_asset_id: UInt64,
+        lend_asset_id: UInt64,
+    ) -> UInt64:
+        min_balance = Global.current_application_address.min_balance
+        loan_id = self.open_loan(lend_type, lend_payment_asset_id, lend_asset_id)
+        if lend_asset_id not in self.offers:
+            self.offers[lend_asset_id] = arc4.DynamicArray[Offer]()
+        ##########################################
+        payment_amount = require_payment_txn(Txn.sender, payment)
+        mbr_increase = Global.current_application_address.min_balance - min_balance
+        assert payment_amount >= mbr_increase + UInt64(OFFER_MBR), "payment amount accurate"
+        ##########################################
+        return loan_id
+
+    ##############################################
+    # function: setup_bundle
+    # arguments:
+    # - payment, covering box and opt-in mbr
+    # - lend_type, the type of lending
+    # - lend_payment_asset_id, the asset to be lent
+    # - lend_asset_ids, the assets lent against
+    # purpose: open a loan against several nfts
+    # pre-conditions:
+    # - 2 to MAX_BUNDLE distinct assets
+    # post-conditions:
+    # - loan and bundle boxes created
+    # - lend_status setup
+    # returns: loan id
+    # notes:
+    # - lend_asset_id of the loan is the first
+    #   asset of the bundle
+    ##############################################
+    @arc4.abimethod
+    def setup_bundle(
+        self,
+        payment: gtxn.PaymentTransaction,
+        lend_type: UInt64,
+        lend_payment_asset_id: UInt64,
+        lend_asset_ids: arc4.DynamicArray[arc4.UInt64],
+    ) -> UInt64:
+        n = lend_asset_ids.length
+        assert n >= UInt64(2), "lend_asset_ids length accurate"
+        assert n <= UInt64(MAX_BUNDLE), "lend_asset_ids length accurate"
+        ##########################################
+        min_balance = Global.current_application_address.min_balance
+        loan_id = self.open_loan(lend_type, lend_payment_asset_id, lend_asset_ids[0].native)
+        for i in urange(1, n):
+            lend_asset_id = lend_asset_ids[i].native
+            for j in urange(i):
+                assert lend_asset_ids[j].native != lend_asset_id, "lend_asset_ids distinct"
+            if lend_type == UInt64(2):
+                assert lend_payment_asset_id != lend_asset_id, "lend_payment_asset_id not equal to lend_asset_id"
+            self.lend_asset_opt_in(lend_asset_id)
+        self.bundles[loan_id] = lend_asset_ids.copy()
+        ##########################################
+        payment_amount = require_payment_txn(Txn.sender, payment)
+        mbr_increase = Global.current_application_address.min_balance - min_balance
+        assert payment_amount >= mbr_increase, "payment amount accurate"
+        ##########################################
+        return loan_id
+
+    ##############################################
+    # function: add_offer (internal)
+    # arguments:
+    # - loan_id, the funded loan
+    # - loan, the funded loan record
+    # purpose: open the loan to borrowers
+    # post-conditions:
+    # - offer in the book of its lend_asset_id
+    # - offer index kept by loan id
+    # notes:
+    # - a loan funded while the book is full is
+    #   not listed, lend_nft still lends it
+    ##############################################
+    @subroutine
+    def add_offer(self, loan_id: UInt64, loan: Loan) -> None:
+        lend_asset_id = loan.lend_asset_id.native
+        offers = self.offers[lend_asset_id].copy()
+        if offers.length >= UInt64(MAX_OFFERS):
+            return
+        self.offer_slots[loan_id] = arc4.UInt64(offers.length)
+        offers.append(Offer(
+            loan_id=arc4.UInt64(loan_id),
+            lend_payment_asset_id=loan.lend_payment_asset_id,
+            lend_amount=loan.lend_amount,
+            lend_payback=loan.lend_payback,
+            lend_time=loan.lend_time,
+        ))
+        self.offers[lend_asset_id] = offers.copy()
+
+    ##############################################
+    # function: remove_offer (internal)
+    # arguments:
+    # - lend_asset_id, the book
+    # - loan_id, the listed loan
+    # purpose: close an offer
+    # post-conditions:
+    # - last offer moved to the offer's index
+    # - offer index box deleted
+    # notes:
+    # - the slot box of the last offer is
+    #   updated, so it must be referenced too
+    ##############################################
+    @subroutine
+    def remove_offer(self, lend_asset_id: UInt64, loan_id: UInt64) -> None:
+        index = self.offer_slots[loan_id].native
+        del self.offer_slots[loan_id]
+        offers = self.offers[lend_asset_id].copy()
+        last = offers.pop()
+        if index < offers.length:
+            offers[index] = last.copy()
+            self.offer_slots[last.loan_id.native] = arc4.UInt64(index)
+        self.offers[lend_asset_id] = offers.copy()
+
+    ##############################################
+    # function: fund_loan (internal)
+    # arguments:
+    # - loan_id, the loan to fund
+    # - lend_amount, the amount to lend
+    # - lend_payback, the amount to pay back
     # - lend_time, the time to pay back
-    # purpose: fund the contract
+    # - payment, pay or axfer of lend_amount, a
+    #   0 pay for arc200 loans
+    # purpose: fund the loan
+    # post-conditions:
+    # - lend_status funded
+    # - arc200 lend_amount escrowed by the pool
+    ##############################################
+    @subroutine
+    def fund_loan(
+        self,
+        loan_id: UInt64,
+        lend_amount: arc4.UInt64,
+        lend_payback: arc4.UInt64,
+        lend_time: arc4.UInt64,
+        payment: gtxn.Transaction,
+    ) -> None:
+        loan = self.loans[loan_id].copy()
+        ##########################################
+        assert loan.lend_status == arc4.UInt8(1), "lend_status not setup"
+        ##########################################
+        lend_type = loan.lend_type.native
+        lend_payment_asset = Asset(loan.lend_payment_asset_id.native)
+        payment_amount = require_lend_payment(Txn.sender, payment, lend_type, lend_payment_asset)
+        if lend_type == UInt64(3):
+            arc200_transfer_from(
+                loan.lend_payment_asset_id.native,
+                Txn.sender,
+                Global.current_application_address,
+                lend_amount.native
+            )
+            payment_amount = lend_amount.native
+        assert payment_amount == lend_amount, "payment amount accurate"
+        if lend_type == UInt64(3):
+            assert lend_payback > lend_amount, "lend_payback accurate"
+        else:
+            assert payment_amount > UInt64(2000000), "payment amount accurate"
+            assert lend_payback > payment_amount + UInt64(2000000), "lend_payback accurate"
+        assert lend_time > UInt64(0), "lend_time accurate"
+        ##########################################
+        loan.lender = arc4.Address(Txn.sender)
+        loan.lend_amount = arc4.UInt64(payment_amount)
+        loan.lend_payback = lend_payback
+        loan.lend_time = lend_time
+        loan.lend_status = arc4.UInt8(2)
+        self.loans[loan_id] = loan.copy()
+        if loan_id not in self.bundles:
+            self.add_offer(loan_id, loan.copy())
+        arc4.emit(LoanFunded(
+            loan_id=arc4.UInt64(loan_id),
+            lender=loan.lender,
+            lend_amount=loan.lend_amount,
+            lend_payback=loan.lend_payback,
+            lend_time=loan.lend_time,
+        ))
+
+    ##############################################
+    # function: fund
+    # arguments:
+    # - payment, pay or axfer of lend_amount, a
+    #   0 pay for arc200 loans
+    # - loan_id, the loan to fund
+    # - lend_amount, the amount to lend
+    # - lend_payback, the amount to pay back
+    # - lend_time, the time to pay back
+    # purpose: fund the loan
+    # pre-conditions:
+    # - arc200 lend_amount approved to the pool
     # post-conditions: lend_status funded
     ##############################################
     @arc4.abimethod
     def fund(
-        self, 
+        self,
+        payment: gtxn.Transaction,
+        loan_id: UInt64,
         lend_amount: arc4.UInt64,
         lend_payback: arc4.UInt64,
         lend_time: arc4.UInt64,
     ) -> None:
+        self.fund_loan(loan_id, lend_amount, lend_payback, lend_time, payment)
+
+    ##############################################
+    # function: fund_many
+    # arguments:
+    # - loan_ids, the loans to fund
+    # - lend_amounts, the amounts to lend
+    # - lend_paybacks, the amounts to pay back
+    # - lend_times, the times to pay back
+    # purpose: fund many loans in one call
+    # pre-conditions:
+    # - the n transactions before the call are
+    #   the payments, one per loan in loan_ids
+    #   order as fund would take them
+    # post-conditions: lend_status funded
+    # returns: budget used by each loan
+    # notes:
+    # - payments sit where n abi transaction
+    #   arguments would, so no two calls in a
+    #   group can share one
+    # - the budget of each loan is topped up
+    #   just before it, so opups are made only
+    #   once the pooled budget runs short
+    ##############################################
+    @arc4.abimethod
+    def fund_many(
+        self,
+        loan_ids: arc4.DynamicArray[arc4.UInt64],
+        lend_amounts: arc4.DynamicArray[arc4.UInt64],
+        lend_paybacks: arc4.DynamicArray[arc4.UInt64],
+        lend_times: arc4.DynamicArray[arc4.UInt64],
+    ) -> arc4.DynamicArray[arc4.UInt64]:
+        n = loan_ids.length
+        assert lend_amounts.length == n, "lend_amounts length accurate"
+        assert lend_paybacks.length == n, "lend_paybacks length accurate"
+        assert lend_times.length == n, "lend_times length accurate"
         ##########################################
-        assert self.lend_status == UInt64(1), "lend_status not setup"
+        assert Txn.group_index >= n, "group index accurate"
+        first = Txn.group_index - n
+        budgets = arc4.DynamicArray[arc4.UInt64]()
+        for i in urange(n):
+            ensure_budget(UInt64(FUND_BUDGET), OpUpFeeSource.GroupCredit)
+            budget = Global.opcode_budget()
+            self.fund_loan(
+                loan_ids[i].native,
+                lend_amounts[i],
+                lend_paybacks[i],
+                lend_times[i],
+                gtxn.Transaction(first + i),
+            )
+            budgets.append(arc4.UInt64(budget_used(budget)))
+        return budgets
+
+    ##############################################
+    # function: withdraw
+    # arguments:
+    # - loan_id, the funded loan
+    # purpose: take back a loan no borrower took
+    # pre-conditions:
+    # - lend_status funded
+    # - sender is the lender
+    # post-conditions:
+    # - lend_amount returned to the lender
+    # - offer removed
+    # - lend_status setup, open to be funded
+    #   again
+    ##############################################
+    @arc4.abimethod
+    def withdraw(
+        self,
+        loan_id: UInt64,
+    ) -> None:
+        loan = self.loans[loan_id].copy()
         ##########################################
-        lender = Txn.sender
-        arc200_balanceOf_call = itxn.ApplicationCall(
-            app_id=self.lend_payment_asset_id,
-            app_args=(
-                arc4.arc4_signature("arc200_balanceOf(address)uint256"),
-                Txn.sender
-            ),
-        ).submit()
-        arc200_balanceOf = arc4.UInt256.from_log(arc200_balanceOf_call.last_log)
-        assert arc200_balanceOf >= lend_amount, "arc200_balanceOf accurate"
-        arc200_allowance_call = itxn.ApplicationCall(
-            app_id=self.lend_payment_asset_id,
-            app_args=(
-                arc4.arc4_signature("arc200_allowance(address,address)uint256"),
-                Txn.sender,
-                Global.current_application_address
-            ),
-        ).submit()
-        arc200_allowance = arc4.UInt256.from_log(arc200_allowance_call.last_log)
-        assert arc200_allowance >= lend_amount, "arc200_allowance accurate"
-        assert lend_payback > lend_amount, "lend_payback accurate"
-        assert lend_time > UInt64(0), "lend_time accurate"
-        # #########################################
-        self.lender = lender
-        self.lend_amount = lend_amount.native
-        self.lend_payback = lend_payback.native
-        self.lend_time = lend_time.native
-        self.lend_status = UInt64(2)
+        assert loan.lend_status == arc4.UInt8(2), "lend_status not funded"
+        assert Txn.sender == loan.lender.native, "sender accurate"
+        ##########################################
+        lend_type = loan.lend_type.native
+        if lend_type == UInt64(3):
+            arc200_transfer(
+                loan.lend_payment_asset_id.native,
+                loan.lender.native,
+                loan.lend_amount.native
+            )
+        else:
+            self.send_payment(
+                lend_type,
+                loan.lend_payment_asset_id.native,
+                loan.lender.native,
+                loan.lend_amount.native
+            )
+        if loan_id in self.offer_slots:
+            self.remove_offer(loan.lend_asset_id.native, loan_id)
+        ##########################################
+        loan.lender = arc4.Address()
+        loan.lend_amount = arc4.UInt64(0)
+        loan.lend_payback = arc4.UInt64(0)
+        loan.lend_time = arc4.UInt64(0)
+        loan.lend_status = arc4.UInt8(1)
+        self.loans[loan_id] = loan.copy()
+        arc4.emit(LoanWithdrawn(loan_id=arc4.UInt64(loan_id)))
+
+    ##############################################
+    # function: lend_loan (internal)
+    # arguments:
+    # - loan_id, the loan to borrow from
+    # - loan, the loan with collateral received
+    # purpose: pay out the loan to the borrower
+    # post-conditions: lend_status lent
+    ##############################################
+    @subroutine
+    def lend_loan(self, loan_id: UInt64, loan: Loan) -> None:
+        borrower = Txn.sender
+        lend_type = loan.lend_type.native
+        if lend_type == UInt64(3):
+            arc200_transfer(
+                loan.lend_payment_asset_id.native,
+                borrower,
+                loan.lend_amount.native
+            )
+        else:
+            self.send_payment(
+                lend_type,
+                loan.lend_payment_asset_id.native,
+                borrower,
+                loan.lend_amount.native
+            )
+        ##########################################
+        loan.borrower = arc4.Address(borrower)
+        loan.lend_date = arc4.UInt64(Global.latest_timestamp)
+        loan.lend_status = arc4.UInt8(3)
+        self.loans[loan_id] = loan.copy()
+        arc4.emit(LoanLent(
+            loan_id=arc4.UInt64(loan_id),
+            borrower=loan.borrower,
+            lend_date=loan.lend_date,
+        ))
 
     ##############################################
     # function: lend_nft
-    # arguments: None
+    # arguments:
+    # - loan_id, the loan to borrow from
+    # - axfer, the transfer of the nft
     # purpose: lend the nft
     # post-conditions: lend_status lent
     ##############################################
     @arc4.abimethod
     def lend_nft(
         self,
+        loan_id: UInt64,
+        axfer: gtxn.AssetTransferTransaction,
     ) -> None:
+        loan = self.loans[loan_id].copy()
         ##########################################
-        assert self.lend_status == UInt64(2), "lend_status not funded"
+        assert loan.lend_status == arc4.UInt8(2), "lend_status not funded"
+        assert loan_id not in self.bundles, "loan not bundle"
         ##########################################
-        lend_asset = Asset(self.lend_asset_id)
-        axfer_amount = require_asset_transfer(Txn.sender, UInt64(1), lend_asset)
+        lend_asset = Asset(loan.lend_asset_id.native)
+        axfer_amount = require_asset_transfer_txn(Txn.sender, axfer, lend_asset)
         assert axfer_amount == UInt64(1), "axfer amount accurate"
         ##########################################
-        borrower = Txn.sender
-        itxn.ApplicationCall(
-            app_id=self.lend_payment_asset_id,
-            app_args=(
-                arc4.arc4_signature("arc200_transferFrom(address,address)bool"),
-                self.lender,
-                Txn.sender,
-            ),
-        ).submit()
+        if loan_id in self.offer_slots:
+            self.remove_offer(loan.lend_asset_id.native, loan_id)
+        self.lend_loan(loan_id, loan.copy())
+
+    ##############################################
+    # function: accept_offer
+    # arguments:
+    # - lend_asset_id, the asset lent against
+    # - lend_payment_asset_id, the asset to be
+    #   lent, 0 for network token
+    # - min_lend_amount, the least amount to
+    #   borrow
+    # - axfer, the transfer of the nft
+    # purpose: lend the nft against the best offer
+    # pre-conditions: offers for the asset
+    # post-conditions:
+    # - lend_status lent
+    # - offer removed
+    # returns: loan id
+    # notes:
+    # - best is the lowest lend_payback per
+    #   lend_amount, the earliest in book order
+    #   on a tie
+    # - the chosen loan box and the slot boxes
+    #   of it and of the last offer must be in
+    #   the box references, found off-chain from
+    #   the offer box with the same rule
+    # - the budget is topped up before each
+    #   offer scanned and before lending, so
+    #   opups are made only once the pooled
+    #   budget runs short
+    ##############################################
+    @arc4.abimethod
+    def accept_offer(
+        self,
+        lend_asset_id: UInt64,
+        lend_payment_asset_id: UInt64,
+        min_lend_amount: UInt64,
+        axfer: gtxn.AssetTransferTransaction,
+    ) -> UInt64:
+        offers = self.offers[lend_asset_id].copy()
+        n = offers.length
+        ##########################################
+        best = n
+        best_amount = BigUInt(0)
+        best_payback = BigUInt(0)
+        for i in urange(n):
+            ensure_budget(UInt64(OFFER_BUDGET), OpUpFeeSource.GroupCredit)
+            offer = offers[i].copy()
+            if offer.lend_payment_asset_id != arc4.UInt64(lend_payment_asset_id):
+                continue
+            if offer.lend_amount.native < min_lend_amount:
+                continue
+            lend_amount = BigUInt(offer.lend_amount.native)
+            lend_payback = BigUInt(offer.lend_payback.native)
+            if best == n or lend_payback * best_amount < best_payback * lend_amount:
+                best = i
+                best_amount = lend_amount
+                best_payback = lend_payback
+        assert best < n, "offer exists"
+        ensure_budget(UInt64(ACCEPT_BUDGET), OpUpFeeSource.GroupCredit)
         ##########################################
-        self.borrower = borrower
-        self.lend_date = Global.latest_timestamp
-        self.lend_status = UInt64(3)
+        loan_id = offers[best].loan_id.native
+        loan = self.loans[loan_id].copy()
+        lend_asset = Asset(lend_asset_id)
+        axfer_amount = require_asset_transfer_txn(Txn.sender, axfer, lend_asset)
+        assert axfer_amount == UInt64(1), "axfer amount accurate"
+        ##########################################
+        self.remove_offer(lend_asset_id, loan_id)
+        self.lend_loan(loan_id, loan.copy())
+        return loan_id
+
+    ##############################################
+    # function: lend_bundle
+    # arguments:
+    # - loan_id, the loan to borrow from
+    # purpose: lend every nft of the bundle
+    # pre-conditions:
+    # - the n transactions before the call are
+    #   the axfers, one per bundle asset in
+    #   bundle order
+    # post-conditions: lend_status lent
+    ##############################################
+    @arc4.abimethod
+    def lend_bundle(
+        self,
+        loan_id: UInt64,
+    ) -> None:
+        loan = self.loans[loan_id].copy()
+        ##########################################
+        assert loan.lend_status == arc4.UInt8(2), "lend_status not funded"
+        ##########################################
+        lend_asset_ids = self.bundles[loan_id].copy()
+        n = lend_asset_ids.length
+        assert Txn.group_index >= n, "group index accurate"
+        first = Txn.group_index - n
+        for i in urange(n):
+            lend_asset = Asset(lend_asset_ids[i].native)
+            axfer = gtxn.AssetTransferTransaction(first + i)
+            axfer_amount = require_asset_transfer_txn(Txn.sender, axfer, lend_asset)
+            assert axfer_amount == UInt64(1), "axfer amount accurate"
+        ##########################################
+        self.lend_loan(loan_id, loan.copy())
 
     ##############################################
     # function: pay_debt
-    # arguments: None
+    # arguments:
+    # - payment, pay or axfer of the remaining
+    #   debt, a 0 pay for arc200 loans
+    # - loan_id, the loan to pay
     # purpose: pay dept
-    # post-conditions: lend_status paid
+    # post-conditions:
+    # - lend_status paid
+    # - lend_status claimed for arc200 loans
     ##############################################
     @arc4.abimethod
     def pay_debt(
-        self
+        self,
+        payment: gtxn.Transaction,
+        loan_id: UInt64,
     ) -> None:
+        loan = self.loans[loan_id].copy()
         ##########################################
-        assert self.lend_status == UInt64(3), "lend_status not lent"
+        assert loan.lend_status == arc4.UInt8(3), "lend_status not lent"
+        ##########################################
+        assert Txn.sender == loan.borrower.native, "sender accurate"
+        payment_amount = self.receive_payment(loan.copy(), payment, loan.lend_payback.native - loan.lend_paid.native)
+        assert payment_amount == loan.lend_payback.native - loan.lend_paid.native, "payment amount accurate"
+        self.repay_loan(loan_id, loan.copy(), payment_amount)
+
+    ##############################################
+    # function: receive_payment (internal)
+    # arguments:
+    # - loan, the lent loan
+    # - payment, the borrower's transaction
+    #   argument
+    # - amount, the amount taken from arc200
+    #   borrowers
+    # purpose: take a borrower payment
+    # pre-conditions:
+    # - arc200 amount approved to the pool
+    # returns: amount paid
+    # notes:
+    # - arc200 payments go straight to the lender
+    ##############################################
+    @subroutine
+    def receive_payment(self, loan: Loan, payment: gtxn.Transaction, amount: UInt64) -> UInt64:
+        lend_type = loan.lend_type.native
+        lend_payment_asset = Asset(loan.lend_payment_asset_id.native)
+        payment_amount = require_lend_payment(loan.borrower.native, payment, lend_type, lend_payment_asset)
+        if lend_type != UInt64(3):
+            return payment_amount
+        arc200_transfer_from(
+            loan.lend_payment_asset_id.native,
+            loan.borrower.native,
+            loan.lender.native,
+            amount
+        )
+        return amount
+
+    ##############################################
+    # function: repay_loan (internal)
+    # arguments:
+    # - loan_id, the loan being paid
+    # - loan, the loan record
+    # - payment_amount, the amount paid
+    # purpose: add a payment to lend_paid and
+    #          return the collateral once paid in
+    #          full
+    # post-conditions:
+    # - lend_paid increased
+    # - lend_status paid when lend_paid reaches
+    #   lend_payback, claimed for arc200 loans
+    ##############################################
+    @subroutine
+    def repay_loan(self, loan_id: UInt64, loan: Loan, payment_amount: UInt64) -> None:
+        assert payment_amount > UInt64(0), "payment amount accurate"
+        lend_paid = loan.lend_paid.native + payment_amount
+        assert lend_paid <= loan.lend_payback.native, "payment amount accurate"
+        loan.lend_paid = arc4.UInt64(lend_paid)
         ##########################################
-        assert Txn.sender == self.borrower, "sender accurate"
+        if lend_paid == loan.lend_payback.native:
+            self.send_collateral(loan_id, loan.lend_asset_id.native, loan.borrower.native)
+            if loan.lend_type == arc4.UInt8(3):
+                loan.lend_status = arc4.UInt8(5)
+            else:
+                loan.lend_status = arc4.UInt8(4)
         ##########################################
-        itxn.ApplicationCall(
-            app_id=self.lend_payment_asset_id,
-            app_args=(
-                arc4.arc4_signature("arc200_transferFrom(address,address)bool"),
-                self.borrower,
-                self.lender,
-                self.lend_payback
-            ),
-        ).submit()
-        lend_asset = Asset(self.lend_asset_id)
-        itxn.AssetTransfer(
-            asset_amount=UInt64(1),
-            asset_receiver=self.borrower,
-            xfer_asset=lend_asset,
-            asset_close_to=lend_asset.creator
-        ).submit()
+        self.loans[loan_id] = loan.copy()
+        arc4.emit(LoanPaid(
+            loan_id=arc4.UInt64(loan_id),
+            lend_paid=loan.lend_paid,
+            lend_status=loan.lend_status,
+        ))
+
+    ##############################################
+    # function: pay_installment
+    # arguments:
+    # - payment, pay or axfer of amount, a 0 pay
+    #   for arc200 loans
+    # - loan_id, the loan to pay
+    # - amount, the part of lend_payback paid
+    # purpose: pay part of the debt
+    # pre-conditions:
+    # - arc200 amount approved to the pool
+    # post-conditions:
+    # - lend_paid increased
+    # - lend_status paid once paid in full
+    ##############################################
+    @arc4.abimethod
+    def pay_installment(
+        self,
+        payment: gtxn.Transaction,
+        loan_id: UInt64,
+        amount: arc4.UInt64,
+    ) -> None:
+        loan = self.loans[loan_id].copy()
+        ##########################################
+        assert loan.lend_status == arc4.UInt8(3), "lend_status not lent"
+        ##########################################
+        assert Txn.sender == loan.borrower.native, "sender accurate"
+        payment_amount = self.receive_payment(loan.copy(), payment, amount.native)
+        assert payment_amount == amount, "payment amount accurate"
+        self.repay_loan(loan_id, loan.copy(), payment_amount)
+
+    ##############################################
+    # function: rollover
+    # arguments:
+    # - payment, the borrower's pay or axfer of
+    #   the interest, lend_payback - lend_amount,
+    #   a 0 pay for arc200 loans
+    # - loan_id, the loan to extend
+    # - lend_time, the time added to the term
+    # purpose: extend the loan in place for the
+    #          interest of one term
+    # pre-conditions:
+    # - called by the lender
+    # - arc200 interest approved to the pool
+    # post-conditions:
+    # - interest paid to the lender
+    # - lend_time extended
+    ##############################################
+    @arc4.abimethod
+    def rollover(
+        self,
+        payment: gtxn.Transaction,
+        loan_id: UInt64,
+        lend_time: UInt64,
+    ) -> None:
+        loan = self.loans[loan_id].copy()
+        ##########################################
+        assert loan.lend_status == arc4.UInt8(3), "lend_status not lent"
         ##########################################
-        self.lend_paid = self.lend_payback
-        self.lend_status = UInt64(5)
+        assert Txn.sender == loan.lender.native, "sender accurate"
+        assert lend_time > UInt64(0), "lend_time accurate"
+        interest = loan.lend_payback.native - loan.lend_amount.native
+        payment_amount = self.receive_payment(loan.copy(), payment, interest)
+        assert payment_amount == interest, "payment amount accurate"
+        lend_type = loan.lend_type.native
+        if lend_type != UInt64(3):
+            self.send_payment(
+                lend_type,
+                loan.lend_payment_asset_id.native,
+                loan.lender.native,
+                interest
+            )
+        ##########################################
+        loan.lend_time = arc4.UInt64(loan.lend_time.native + lend_time)
+        self.loans[loan_id] = loan.copy()
+        arc4.emit(LoanRolledOver(loan_id=arc4.UInt64(loan_id), lend_time=loan.lend_time))
+
+    ##############################################
+    # function: claim_nft_loan (internal)
+    # arguments:
+    # - loan_id, the loan to claim
+    # purpose: claim the nft
+    # post-conditions:
+    # - lend_status claimed
+    # - installments already paid sent to the
+    #   lender
+    ##############################################
+    @subroutine
+    def claim_nft_loan(self, loan_id: UInt64) -> None:
+        loan = self.loans[loan_id].copy()
+        ##########################################
+        assert loan.lend_status == arc4.UInt8(3), "lend_status not lent"
+        ##########################################
+        lend_expiry = loan.lend_date.native + loan.lend_time.native
+        assert Global.latest_timestamp > lend_expiry, "lend_time expired"
+        ##########################################
+        self.send_collateral(loan_id, loan.lend_asset_id.native, loan.lender.native)
+        lend_type = loan.lend_type.native
+        if lend_type != UInt64(3) and loan.lend_paid.native > UInt64(0):
+            self.send_payment(
+                lend_type,
+                loan.lend_payment_asset_id.native,
+                loan.lender.native,
+                loan.lend_paid.native
+            )
+        ##########################################
+        loan.lend_status = arc4.UInt8(5)
+        self.loans[loan_id] = loan.copy()
+        arc4.emit(LoanNftClaimed(loan_id=arc4.UInt64(loan_id), lender=loan.lender))
 
     ##############################################
     # function: claim_nft
-    # arguments: None
+    # arguments:
+    # - loan_id, the loan to claim
     # purpose: claim the nft
     # post-conditions: lend_status claimed
     ##############################################
     @arc4.abimethod
     def claim_nft(
-        self
+        self,
+        loan_id: UInt64,
     ) -> None:
+        self.claim_nft_loan(loan_id)
+
+    ##############################################
+    # function: claim_nft_many
+    # arguments:
+    # - loan_ids, the loans to claim
+    # - max_opups, the most opups the fee covers
+    # purpose: claim the nft of as many loans, in
+    #          order, as the opcode budget allows
+    # pre-conditions:
+    # - fee covers the inner transactions of the
+    #   claims plus max_opups
+    # post-conditions:
+    # - lend_status claimed for the loans claimed
+    # returns: budget used by each loan claimed,
+    #          its length is the number claimed
+    # notes:
+    # - stops before a loan when the pooled budget
+    #   plus max_opups cannot cover, for each nft
+    #   the loan holds, the most any loan has
+    #   used per nft so far, so a bundle of
+    #   MAX_BUNDLE nfts is never started short
+    ##############################################
+    @arc4.abimethod
+    def claim_nft_many(
+        self,
+        loan_ids: arc4.DynamicArray[arc4.UInt64],
+        max_opups: UInt64,
+    ) -> arc4.DynamicArray[arc4.UInt64]:
+        budgets = arc4.DynamicArray[arc4.UInt64]()
+        nft_budget = UInt64(CLAIM_BUDGET)
+        for loan_id in loan_ids:
+            collateral = self.collateral_count(loan_id.native)
+            fits, opups = reserve_budget(nft_budget * collateral + UInt64(BATCH_RESERVE), max_opups)
+            max_opups -= opups
+            if not fits:
+                break
+            budget = Global.opcode_budget()
+            self.claim_nft_loan(loan_id.native)
+            used = budget_used(budget)
+            budgets.append(arc4.UInt64(used))
+            used_per_nft = (used + collateral - UInt64(1)) // collateral
+            if used_per_nft > nft_budget:
+                nft_budget = used_per_nft
+        return budgets
+
+    ##############################################
+    # function: claim_debt_loan (internal)
+    # arguments:
+    # - loan_id, the loan to claim
+    # purpose: claim the debt
+    # post-conditions: lend_status claimed
+    ##############################################
+    @subroutine
+    def claim_debt_loan(self, loan_id: UInt64) -> None:
+        loan = self.loans[loan_id].copy()
         ##########################################
-        assert self.lend_status == UInt64(3), "lend_status not lent"
-        ##########################################
-        assert Global.latest_timestamp > self.lend_date + self.lend_time, "lend_time expired"
+        assert loan.lend_status == arc4.UInt8(4), "lend_status not claimed"
+        assert loan.lend_paid.native > 0, "lend_paid accurate"
         ##########################################
-        lend_asset = Asset(self.lend_asset_id)
-        itxn.AssetTransfer(
-            asset_amount=UInt64(1),
-            asset_receiver=self.lender,
-            xfer_asset=lend_asset,
-            asset_close_to=lend_asset.creator
-        ).submit()
+        self.send_payment(
+            loan.lend_type.native,
+            loan.lend_payment_asset_id.native,
+            loan.lender.native,
+            loan.lend_payback.native
+        )
         ##########################################
-        self.lend_status = UInt64(5)
+        loan.lend_status = arc4.UInt8(5)
+        self.loans[loan_id] = loan.copy()
+        arc4.emit(LoanDebtClaimed(loan_id=arc4.UInt64(loan_id), lend_payback=loan.lend_payback))
 
     ##############################################
     # function: claim_debt
-    # arguments: None
+    # arguments:
+    # - loan_id, the loan to claim
     # purpose: claim the debt
     # post-conditions: lend_status claimed
     ##############################################
     @arc4.abimethod
     def claim_debt(
-        self
+        self,
+        loan_id: UInt64,
     ) -> None:
-        pass
-    
+        self.claim_debt_loan(loan_id)
 
+    ##############################################
+    # function: claim_debt_many
+    # arguments:
+    # - loan_ids, the loans to claim
+    # - max_opups, the most opups the fee covers
+    # purpose: claim the debt of as many loans, in
+    #          order, as the opcode budget allows
+    # pre-conditions:
+    # - fee covers the inner transactions of the
+    #   claims plus max_opups
+    # post-conditions:
+    # - lend_status claimed for the loans claimed
+    # returns: budget used by each loan claimed,
+    #          its length is the number claimed
+    # notes:
+    # - stops before a loan when the pooled budget
+    #   plus max_opups cannot cover the most any
+    #   loan has used so far
+    # - every debt claim makes one payment and
+    #   holds no collateral, so the same budget
+    #   covers each loan
+    ##############################################
+    @arc4.abimethod
+    def claim_debt_many(
+        self,
+        loan_ids: arc4.DynamicArray[arc4.UInt64],
+        max_opups: UInt64,
+    ) -> arc4.DynamicArray[arc4.UInt64]:
+        budgets = arc4.DynamicArray[arc4.UInt64]()
+        item_budget = UInt64(CLAIM_BUDGET)
+        for loan_id in loan_ids:
+            fits, opups = reserve_budget(item_budget + UInt64(BATCH_RESERVE), max_opups)
+            max_opups -= opups
+            if not fits:
+                break
+            budget = Global.opcode_budget()
+            self.claim_debt_loan(loan_id.native)
+            used = budget_used(budget)
+            budgets.append(arc4.UInt64(used))
+            if used > item_budget:
+                item_budget = used
+        return budgets
+
+    ##############################################
+    # function: pad_budget
+    # purpose: raise the group's pooled opcode
+    #          budget without an inner opup
+    # notes:
+    # - group with a batch call instead of paying
+    #   for max_opups
+    ##############################################
+    @arc4.abimethod
+    def pad_budget(self) -> None:
+        return
+
+    ##############################################
+    # function: get_loan
+    # arguments:
+    # - loan_id, the loan to read
+    # purpose: read a loan in one call
+    # returns: LoanSnapshot
+    # notes:
+    # - readonly, call through simulate
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def get_loan(
+        self,
+        loan_id: UInt64,
+    ) -> LoanSnapshot:
+        return loan_snapshot(loan_id, self.loans[loan_id].copy())
+
+    ##############################################
+    # function: get_loans
+    # arguments:
+    # - loan_ids, the loans to read
+    # purpose: read many loans in one call
+    # returns: LoanSnapshot per loan
+    # notes:
+    # - readonly, call through simulate
+    # - at most MAX_SNAPSHOTS loan ids per call
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def get_loans(
+        self,
+        loan_ids: arc4.DynamicArray[arc4.UInt64],
+    ) -> arc4.DynamicArray[LoanSnapshot]:
+        assert loan_ids.length <= UInt64(MAX_SNAPSHOTS), "loan_ids length accurate"
+        snapshots = arc4.DynamicArray[LoanSnapshot]()
+        for loan_id in loan_ids:
+            snapshots.append(loan_snapshot(loan_id.native, self.loans[loan_id.native].copy()))
+        return snapshots
+
+    ##############################################
+    # function: is_vetted
+    # arguments:
+    # - asset_id, the asset to look up
+    # purpose: whether the pool has checked and
+    #          opted in to an asset
+    # returns: true if vetted
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def is_vetted(
+        self,
+        asset_id: UInt64,
+    ) -> bool:
+        return asset_id in self.vetted
+
+    ##############################################
+    # function: get_bundle
+    # arguments:
+    # - loan_id, the loan to read
+    # purpose: read the assets of a bundle loan
+    # returns: asset ids, empty for single nft
+    #          loans
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def get_bundle(
+        self,
+        loan_id: UInt64,
+    ) -> arc4.DynamicArray[arc4.UInt64]:
+        lend_asset_ids, is_bundle = self.bundles.maybe(loan_id)
+        if is_bundle:
+            return lend_asset_ids.copy()
+        return arc4.DynamicArray[arc4.UInt64]()
+
+    ##############################################
+    # function: close
+    # arguments:
+    # - loan_id, the loan to close
+    # purpose: deletes loan
+    # pre-conditions:
+    # - lend_status claimed, or setup and sender
+    #   is the account that paid setup
+    # post-conditions:
+    # - loan, creator and bundle boxes deleted
+    # - box and offer mbr returned to the
+    #   account that paid setup
+    # notes:
+    # - closing at setup cancels a loan never
+    #   funded or withdrawn by its lender
+    ##############################################
+    @arc4.abimethod
+    def close(
+        self,
+        loan_id: UInt64,
+    ) -> None:
+        loan = self.loans[loan_id].copy()
+        creator = self.creators[loan_id]
+        ##########################################
+        if loan.lend_status == arc4.UInt8(1):
+            assert Txn.sender == creator.native, "sender accurate"
+        else:
+            assert loan.lend_status == arc4.UInt8(5), "lend_status not claimed"
+        ##########################################
+        min_balance = Global.current_application_address.min_balance
+        del self.loans[loan_id]
+        del self.creators[loan_id]
+        if loan_id in self.bundles:
+            del self.bundles[loan_id]
+        else:
+            min_balance += UInt64(OFFER_MBR)
+        arc4.emit(LoanClosed(loan_id=arc4.UInt64(loan_id)))
+        mbr_decrease = min_balance - Global.current_application_address.min_balance
+        itxn.Payment(
+            amount=mbr_decrease,
+            receiver=creator.native
+        ).submit()
+
+##############################################
+# struct: LoanInstance
+# purpose: registry entry of a factory loan
+##############################################
+class LoanInstance(arc4.Struct):
+    lend_type: arc4.UInt8
+    creator: arc4.Address
+    lend_payment_asset_id: arc4.UInt64
+    lend_asset_id: arc4.UInt64
+    mbr: arc4.UInt64
+
+class LendingFactory(ARC4Contract):
+    ##############################################
+    # function: __init__ (builtin)
+    # arguments: None
+    # purpose: construct initial state
+    # pre-conditions: None
+    # post-conditions: initial state set
+    # notes:
+    # - live loan apps are registered in boxes
+    #   keyed by app id
+    ##############################################
+    def __init__(self) -> None:
+        self.instance_count = UInt64()          # 0
+        self.instances = BoxMap(UInt64, LoanInstance, key_prefix="i")
+
+    ##############################################
+    # function: create_loan
+    # arguments:
+    # - payment, covers instance and registry mbr
+    # - lend_type, the type of lending
+    # - lend_payment_asset_id, the asset to be lent
+    # - lend_asset_id, the asset to be paid back
+    # purpose: deploy and setup a loan app
+    # post-conditions:
+    # - loan app created, funded and setup
+    # - loan app registered
+    # returns: loan app id
+    ##############################################
+    @arc4.abimethod
+    def create_loan(
+        self,
+        payment: gtxn.PaymentTransaction,
+        lend_type: UInt64,
+        lend_payment_asset_id: UInt64,
+        lend_asset_id: UInt64,
+    ) -> UInt64:
+        ##########################################
+        assert lend_type >= UInt64(1), "lend_type accurate"
+        assert lend_type <= UInt64(3), "lend_type accurate"
+        ##########################################
+        min_balance = Global.current_application_address.min_balance
+        compiled = compile_contract(AssetLending)
+        app = itxn.ApplicationCall(
+            approval_program=compiled.approval_program,
+            clear_state_program=compiled.clear_state_program,
+            global_num_uint=compiled.global_uints,
+            global_num_bytes=compiled.global_bytes,
+            extra_program_pages=compiled.extra_program_pages,
+        ).submit().created_app
+        ##########################################
+        # fund account and asset opt-in mbr, the
+        # opt-ins' fees are pooled in this call
+        ##########################################
+        opt_ins = UInt64(1)
+        if lend_type == UInt64(2):
+            opt_ins = UInt64(2)
+        funding = Global.min_balance + opt_ins * Global.asset_opt_in_min_balance
+        itxn.Payment(
+            amount=funding,
+            receiver=app.address
+        ).submit()
+        if lend_type == UInt64(2):
+            arc4.abi_call(
+                "setup(uint64,uint64,uint64)void",
+                lend_type,
+                lend_payment_asset_id,
+                lend_asset_id,
+                app_id=app,
+                assets=(Asset(lend_payment_asset_id), Asset(lend_asset_id)),
+            )
+        else:
+            arc4.abi_call(
+                "setup(uint64,uint64,uint64)void",
+                lend_type,
+                lend_payment_asset_id,
+                lend_asset_id,
+                app_id=app,
+                assets=(Asset(lend_asset_id),),
+            )
+        ##########################################
+        instance = LoanInstance(
+            lend_type=arc4.UInt8(lend_type),
+            creator=arc4.Address(Txn.sender),
+            lend_payment_asset_id=arc4.UInt64(lend_payment_asset_id),
+            lend_asset_id=arc4.UInt64(lend_asset_id),
+            mbr=arc4.UInt64(0),
+        )
+        self.instances[app.id] = instance.copy()
+        mbr = Global.current_application_address.min_balance - min_balance
+        instance.mbr = arc4.UInt64(mbr)
+        self.instances[app.id] = instance.copy()
+        ##########################################
+        payment_amount = require_payment_txn(Txn.sender, payment)
+        assert payment_amount >= mbr + funding, "payment amount accurate"
+        ##########################################
+        self.instance_count += UInt64(1)
+        return app.id
+
+    ##############################################
+    # function: remove_loan
+    # arguments:
+    # - app_id, the closed loan app
+    # purpose: unregister a deleted loan app
+    # pre-conditions:
+    # - loan app deleted with close
+    # post-conditions:
+    # - loan app unregistered
+    # - mbr returned to creator
+    ##############################################
+    @arc4.abimethod
+    def remove_loan(
+        self,
+        app_id: UInt64,
+    ) -> None:
+        instance = self.instances[app_id].copy()
+        ##########################################
+        _creator, exists = op.AppParamsGet.app_creator(app_id)
+        assert not exists, "loan app deleted"
+        ##########################################
+        del self.instances[app_id]
+        itxn.Payment(
+            amount=instance.mbr.native,
+            receiver=instance.creator.native
+        ).submit()
+        ##########################################
+        self.instance_count -= UInt64(1)
+
+    ##############################################
+    # function: get_instance
+    # arguments:
+    # - app_id, the loan app
+    # purpose: read a registry entry
+    # returns: LoanInstance
+    ##############################################
+    @arc4.abimethod(readonly=True)
+    def get_instance(
+        self,
+        app_id: UInt64,
+    ) -> LoanInstance:
+        return self.instances[app_id].copy()
@@ -0,0 +1,222 @@
+"""GroupSender and AsyncAlgod against an in-process algod stand-in.
+
+The stand-in keeps a round counter that advances whenever a caller waits for
+the next block. A sent group confirms confirm_rounds rounds after it was
+sent, unless it is given a pool error or is dropped, which leaves it
+pending until it expires.
+"""
+import asyncio
+import base64
+
+import pytest
+
+from client.aio import AlgodError, AsyncAlgod, GroupSender, LendingApp
+from client.loan import LEND_STATUS_INITIALIZED, LEND_STATUS_LENT, LOAN_KEY, ZERO_ADDRESS, Loan, encode_loan
+
+
+class FakeAlgod:
+    def __init__(self, confirm_rounds: int = 2) -> None:
+        self.round = 100
+        self.confirm_rounds = confirm_rounds
+        self.sent: dict[str, int] = {}
+        self.confirmed: set[str] = set()
+        self.pool_errors: dict[str, str] = {}
+        self.dropped: set[str] = set()
+        self.max_outstanding = 0
+        self.waits = 0
+        self.pending_calls = 0
+
+    async def status(self) -> dict:
+        return {"last-round": self.round}
+
+    async def wait_for_block_after(self, round_: int) -> dict:
+        self.waits += 1
+        await asyncio.sleep(0)
+        self.round = max(self.round, round_ + 1)
+        return {"last-round": self.round}
+
+    async def send(self, raw: bytes) -> str:
+        txid = raw.decode()
+        self.sent[txid] = self.round
+        outstanding = len(self.sent) - len(self.confirmed)
+        self.max_outstanding = max(self.max_outstanding, outstanding)
+        return txid
+
+    async def pending(self, txid: str) -> dict:
+        self.pending_calls += 1
+        if txid in self.dropped:
+            raise AlgodError(404, "txn not found")
+        if txid in self.pool_errors:
+            return {"pool-error": self.pool_errors[txid]}
+        if self.round >= self.sent[txid] + self.confirm_rounds:
+            self.confirmed.add(txid)
+            return {"confirmed-round": self.sent[txid] + self.confirm_rounds}
+        return {}
+
+
+async def _send(sender: GroupSender, txid: str, last_valid: int = 10_000) -> dict:
+    return await sender.send_raw(txid.encode(), txid, last_valid)
+
+
+def test_window_bounds_groups_in_flight():
+    algod = FakeAlgod()
+
+    async def main():
+        sender = GroupSender(algod, window=4)
+        return await asyncio.gather(*(_send(sender, f"t{i}") for i in range(20)))
+
+    results = asyncio.run(main())
+    assert len(results) == 20
+    assert all(result["confirmed-round"] for result in results)
+    assert algod.max_outstanding == 4
+
+
+def test_one_watcher_checks_all_pending_groups():
+    algod = FakeAlgod(confirm_rounds=3)
+
+    async def main():
+        sender = GroupSender(algod, window=32)
+        return await asyncio.gather(*(_send(sender, f"t{i}") for i in range(32)))
+
+    results = asyncio.run(main())
+    assert {result["confirmed-round"] for result in results} == {103}
+    # one wait per round, not per group
+    assert algod.waits == 3
+    assert algod.pending_calls == 32 * 4
+
+
+def test_dropped_group_expires():
+    algod = FakeAlgod()
+    algod.dropped.add("lost")
+
+    async def main():
+        sender = GroupSender(algod)
+        return await asyncio.gather(
+            _send(sender, "lost", last_valid=algod.round + 2),
+            _send(sender, "kept"),
+            return_exceptions=True,
+        )
+
+    lost, kept = asyncio.run(main())
+    assert isinstance(lost, TimeoutError)
+    assert kept["confirmed-round"] == 102
+    assert algod.round == 103
+
+
+def test_pool_error_fails_only_its_group():
+    algod = FakeAlgod()
+    algod.pool_errors["bad"] = "overspend"
+
+    async def main():
+        sender = GroupSender(algod)
+        return await asyncio.gather(_send(sender, "bad"), _send(sender, "good"), return_exceptions=True)
+
+    bad, good = asyncio.run(main())
+    assert isinstance(bad, AlgodError)
+    assert bad.message == "overspend"
+    assert good["confirmed-round"] == 102
+
+
+def test_rejected_send_frees_window():
+    algod = FakeAlgod()
+
+    async def reject(raw: bytes) -> str:
+        raise AlgodError(400, "rejected")
+
+    async def main():
+        sender = GroupSender(algod, window=1)
+        send = algod.send
+        algod.send = reject
+        with pytest.raises(AlgodError):
+            await _send(sender, "rejected")
+        algod.send = send
+        return await _send(sender, "accepted")
+
+    assert asyncio.run(main())["confirmed-round"] == 102
+
+
+class ParamsAlgod(AsyncAlgod):
+    def __init__(self, **kwargs) -> None:
+        super().__init__("http://algod", **kwargs)
+        self.requests = 0
+
+    async def _request(self, method: str, path: str, data=None, content_type: str = "") -> dict:
+        assert path == "/v2/transactions/params"
+        self.requests += 1
+        await asyncio.sleep(0)
+        return {
+            "fee": 0,
+            "last-round": self.last_round,
+            "genesis-hash": "SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI=",
+            "genesis-id": "testnet-v1.0",
+            "consensus-version": "future",
+            "min-fee": 1000,
+        }
+
+
+def test_params_fetched_once_per_round():
+    pytest.importorskip("algosdk")
+    algod = ParamsAlgod(params_ttl=3600)
+
+    async def main():
+        first = await asyncio.gather(*(algod.suggested_params() for _ in range(10)))
+        assert algod.requests == 1
+        first[0].fee = 5000
+        assert (await algod.suggested_params()).fee == 0
+        algod._seen({"last-round": 1})
+        params = await algod.suggested_params()
+        assert algod.requests == 2
+        assert params.first == 1
+
+    asyncio.run(main())
+
+
+def test_params_expire_after_ttl():
+    pytest.importorskip("algosdk")
+    algod = ParamsAlgod(params_ttl=0)
+
+    async def main():
+        await algod.suggested_params()
+        await asyncio.sleep(0.01)
+        await algod.suggested_params()
+
+    asyncio.run(main())
+    assert algod.requests == 2
+
+
+class AppAlgod(AsyncAlgod):
+    def __init__(self, loans: dict[int, Loan]) -> None:
+        super().__init__("http://algod")
+        self.loans = loans
+        self.requests = 0
+
+    async def _request(self, method: str, path: str, data=None, content_type: str = "") -> dict:
+        app_id = int(path.removeprefix("/v2/applications/"))
+        self.requests += 1
+        value = base64.b64encode(encode_loan(self.loans[app_id])).decode()
+        return {"id": app_id, "params": {"global-state": [
+            {"key": base64.b64encode(LOAN_KEY).decode(), "value": {"type": 1, "bytes": value}},
+        ]}}
+
+
+def _state(lend_type: int, lend_status: int) -> Loan:
+    return Loan(ZERO_ADDRESS, ZERO_ADDRESS, lend_type, lend_status, 0, 7, 0, 0, 0, 0, 0)
+
+
+def test_lend_type_is_read_from_loan_state():
+    algod = AppAlgod({1: _state(3, LEND_STATUS_LENT), 2: _state(0, LEND_STATUS_INITIALIZED)})
+    sender = GroupSender(algod)
+
+    async def main():
+        app = LendingApp(sender, None, 1, ZERO_ADDRESS, None)
+        assert await app.get_lend_type() == 3
+        assert await app.get_lend_type() == 3
+        assert algod.requests == 1
+        # given, it is not read
+        assert await LendingApp(sender, None, 1, ZERO_ADDRESS, None, lend_type=2).get_lend_type() == 2
+        assert algod.requests == 1
+        # without a lend_type no fee can be priced
+        with pytest.raises(ValueError):
+            await LendingApp(sender, None, 2, ZERO_ADDRESS, None).get_lend_type()
+
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+"""Inner transaction counts and fees of client.fees, table driven."""
+from types import SimpleNamespace
+
+import pytest
+
+from client.fees import (
+    LoanShape,
+    batch_budget,
+    call_fee,
+    ensure_opups,
+    fee_from_simulation,
+    group_fee,
+    inner_txns,
+    pool_inner_txns,
+    set_group_fees,
+)
+
+
+@pytest.mark.parametrize("contract, method, lend_type, expected", [
+    ("AssetLending", "setup", 1, 1),
+    ("AssetLending", "setup", 2, 2),
+    ("AssetLending", "fund", 1, 0),
+    ("AssetLending", "fund", 3, 1),
+    ("AssetLending", "lend_nft", 2, 1),
+    ("AssetLending", "pay_debt", 1, 1),
+    ("AssetLending", "pay_debt", 3, 2),
+    ("AssetLending", "pay_installment", 3, 2),
+    ("AssetLending", "rollover", 3, 1),
+    ("AssetLending", "claim_nft", 1, 2),
+    ("AssetLending", "claim_nft", 3, 1),
+    ("AssetLending", "claim_debt", 2, 1),
+    # arc200 loans cannot claim debt
+    ("AssetLending", "claim_debt", 3, 0),
+    ("AssetLending", "get_loan", 1, 0),
+    ("AssetLending", "close", 3, 1),
+    ("LendingFactory", "create_loan", 1, 4),
+    ("LendingFactory", "create_loan", 2, 5),
+    ("LendingFactory", "create_loan", 3, 4),
+    ("LendingFactory", "remove_loan", None, 1),
+    ("LendingFactory", "get_loans", None, 0),
+])
+def test_inner_txns(contract, method, lend_type, expected):
+    assert inner_txns(contract, method, lend_type) == expected
+
+
+@pytest.mark.parametrize("lend_type", [None, 0, 4])
+def test_inner_txns_needs_a_lend_type(lend_type):
+    with pytest.raises(ValueError):
+        inner_txns("AssetLending", "pay_debt", lend_type)
+
+
+NT, ASA, ARC200 = LoanShape(1), LoanShape(2), LoanShape(3)
+BUNDLE = LoanShape(1, collateral=4)
+
+
+@pytest.mark.parametrize("method, loans, kwargs, expected", [
+    ("setup", [NT], {}, 0),
+    ("setup", [ASA], {"opt_ins": 2}, 2),
+    ("setup_bundle", [BUNDLE], {"opt_ins": 4}, 4),
+    ("fund", [NT], {}, 0),
+    ("fund", [ARC200], {}, 1),
+    ("fund_many", [NT, ARC200, ARC200], {"opups": 2}, 4),
+    ("lend_nft", [ASA], {}, 1),
+    ("lend_bundle", [BUNDLE], {}, 1),
+    ("accept_offer", [NT], {"opups": 1}, 2),
+    ("withdraw", [ARC200], {}, 1),
+    ("pay_debt", [NT], {}, 1),
+    ("pay_debt", [ARC200], {}, 2),
+    ("pay_debt", [BUNDLE], {}, 4),
+    ("pay_installment", [ARC200], {}, 1),
+    ("pay_installment", [BUNDLE], {}, 0),
+    ("pay_installment", [BUNDLE], {"paid_in_full": True}, 4),
+    ("rollover", [ASA], {}, 1),
+    ("claim_nft", [NT], {}, 1),
+    ("claim_nft", [LoanShape(1, lend_paid=5)], {}, 2),
+    # arc200 installments were paid to the lender
+    ("claim_nft", [LoanShape(3, lend_paid=5)], {}, 1),
+    ("claim_nft_many", [BUNDLE, LoanShape(2, lend_paid=5)], {"opups": 1}, 7),
+    ("claim_debt_many", [NT, ASA], {}, 2),
+    ("close", [], {}, 1),
+    ("get_loans", [NT, ASA], {}, 0),
+])
+def test_pool_inner_txns(method, loans, kwargs, expected):
+    assert pool_inner_txns(method, loans, **kwargs) == expected
+
+
+@pytest.mark.parametrize("method, loans, expected", [
+    ("claim_nft_many", [NT], 500),
+    ("claim_nft_many", [NT, BUNDLE], 2100),
+    ("claim_debt_many", [NT, ASA, ARC200], 1300),
+    ("fund_many", [NT, ARC200], 1600),
+    ("accept_offer", [NT] * 3, 700),
+])
+def test_batch_budget(method, loans, expected):
+    assert batch_budget(method, loans) == expected
+
+
+def test_batch_budget_rejects_other_methods():
+    with pytest.raises(ValueError):
+        batch_budget("pay_debt", [NT])
+
+
+@pytest.mark.parametrize("required, available, expected", [
+    (0, 700, 0),
+    (690, 700, 0),
+    # the buffer tips it over
+    (691, 700, 1),
+    (1389, 700, 1),
+    (1390, 700, 2),
+    (3300, 1400, 3),
+])
+def test_ensure_opups(required, available, expected):
+    assert ensure_opups(required, available) == expected
+
+
+@pytest.mark.parametrize("inner, min_fee, expected", [
+    (0, 1000, 1000),
+    (2, 1000, 3000),
+    (3, 2000, 8000),
+])
+def test_call_fee(inner, min_fee, expected):
+    assert call_fee(inner, min_fee) == expected
+
+
+@pytest.mark.parametrize("inner, min_fee, expected", [
+    ([], 1000, 0),
+    ([0], 1000, 1000),
+    ([0, 2], 1000, 4000),
+    ([1, 0, 3], 2000, 14000),
+])
+def test_group_fee(inner, min_fee, expected):
+    assert group_fee(inner, min_fee) == expected
+
+
+@pytest.mark.parametrize("inner, payer, fees, total", [
+    ([0, 2], None, [1000, 3000], 4000),
+    ([0, 2], 1, [0, 4000], 4000),
+    ([1, 0, 0], 2, [0, 0, 4000], 4000),
+])
+def test_set_group_fees(inner, payer, fees, total):
+    txns = [SimpleNamespace(fee=None) for _ in inner]
+    assert set_group_fees(txns, inner, 1000, payer=payer) == total
+    assert [txn.fee for txn in txns] == fees
+
+
+def test_set_group_fees_needs_one_count_per_txn():
+    with pytest.raises(ValueError):
+        set_group_fees([SimpleNamespace(fee=None)], [0, 1])
+
+
+def _result(*inner: dict) -> dict:
+    return {"inner-txns": list(inner)} if inner else {}
+
+
+@pytest.mark.parametrize("results, min_fee, expected", [
+    ([_result()], 1000, 1000),
+    ([_result(), _result(_result(), _result())], 1000, 4000),
+    # inner app calls count their own inner transactions
+    ([_result(_result(_result(), _result()))], 1000, 4000),
+    ([_result(_result()), _result()], 2000, 6000),
+])
+def test_fee_from_simulation(results, min_fee, expected):
+    group = {"txn-results": [{"txn-result": result} for result in results]}
+    assert fee_from_simulation(group, min_fee) == expected
@@ -0,0 +1,126 @@
+"""HistoryWriter and History round trips over a JSON lines block file."""
+import base64
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from client.events import EVENTS, event_selector
+from client.history import COLUMNS, History, HistoryWriter
+from client.indexer import FileBlockSource
+from client.loan import LEND_STATUS_CLAIMED, LEND_STATUS_LENT
+
+POOL = 10
+FACTORY = 20
+LENDER = bytes(range(32))
+BORROWER = bytes(range(32, 64))
+
+
+def _log(name: str, loan_id: int, *values) -> str:
+    args, layout, _ = EVENTS[name]
+    return base64.b64encode(event_selector(name, args) + struct.pack(layout, loan_id, *values)).decode()
+
+
+def _call(app_id: int, *logs: str, inner: list[dict] = ()) -> dict:
+    return {"txn": {"type": "appl", "apid": app_id}, "dt": {"lg": list(logs), "itx": list(inner)}}
+
+
+def _create(app_id: int, *logs: str) -> dict:
+    # an inner app create, the new id is on the apply data
+    return {"txn": {"type": "appl"}, "apid": app_id, "dt": {"lg": list(logs)}}
+
+
+def _lifecycle(loan_id: int) -> list[list[str]]:
+    return [
+        [_log("LoanSetup", loan_id, 1, 0, 500 + loan_id)],
+        [_log("LoanFunded", loan_id, LENDER, 3_000_000, 6_000_000, 3600)],
+        [_log("LoanLent", loan_id, BORROWER, 1_000)],
+        [_log("LoanPaid", loan_id, 6_000_000, 4), _log("LoanDebtClaimed", loan_id, 6_000_000)],
+    ]
+
+
+def _write_blocks(path, blocks: list[list[dict]], first_round: int = 1) -> FileBlockSource:
+    source = FileBlockSource(path)
+    for i, txns in enumerate(blocks):
+        round_ = first_round + i
+        source.append({"rnd": round_, "ts": 1_000 * round_, "txns": txns})
+    return source
+
+
+def test_needs_app_ids_or_factory(tmp_path):
+    with pytest.raises(ValueError):
+        HistoryWriter(tmp_path / "history")
+
+
+def test_append_and_select(tmp_path):
+    blocks = [
+        [_call(POOL, *logs_a), _call(99, *logs_b)]
+        for logs_a, logs_b in zip(_lifecycle(1), _lifecycle(1))
+    ]
+    source = _write_blocks(tmp_path / "blocks.jsonl", blocks)
+    writer = HistoryWriter(tmp_path / "history", app_ids={POOL})
+    # untrusted app 99 logs the same events and is ignored
+    assert writer.sync(source) == 5
+    history = History(tmp_path / "history")
+    assert len(history) == 5
+    assert set(history["app_id"]) == {POOL}
+    assert history.event_names(history["event"]) == [
+        "LoanSetup", "LoanFunded", "LoanLent", "LoanPaid", "LoanDebtClaimed",
+    ]
+    last = {name: history[name][-1] for name in ("lend_status", "lend_amount", "lent_ts", "paid_ts", "claimed_ts")}
+    assert last == {
+        "lend_status": LEND_STATUS_CLAIMED, "lend_amount": 3_000_000,
+        "lent_ts": 3_000, "paid_ts": 4_000, "claimed_ts": 4_000,
+    }
+    assert history.addresses(history["lender"][-1:]) == history.addresses(history["lender"][1:2])
+    # by asset and [start, end) time
+    rows = history.select(lend_asset_id=501, start=2_000, end=4_000, columns=("ts", "lend_status"))
+    assert list(rows["ts"]) == [2_000, 3_000]
+    assert rows["lend_status"][-1] == LEND_STATUS_LENT
+    assert len(history.select(lend_asset_id=7)["ts"]) == 0
+
+
+def test_sync_resumes_and_recovers_a_half_write(tmp_path):
+    path = tmp_path / "history"
+    lifecycle = _lifecycle(1)
+    source = _write_blocks(tmp_path / "blocks.jsonl", [[_call(POOL, *logs)] for logs in lifecycle[:2]])
+    assert HistoryWriter(path, app_ids={POOL}).sync(source) == 2
+    # an append interrupted before its meta.json
+    # commit, one and a half rows long
+    for name, dtype in COLUMNS.items():
+        with (path / f"{name}.bin").open("ab") as f:
+            f.write(b"\xff" * (3 * np.dtype(dtype).itemsize // 2))
+    assert len(History(path)) == 2
+    writer = HistoryWriter(path, app_ids={POOL})
+    for name, dtype in COLUMNS.items():
+        assert (path / f"{name}.bin").stat().st_size == 2 * np.dtype(dtype).itemsize
+    # the state of loan 1 is rebuilt from the rows
+    assert writer.loans[(POOL, 1)]["lend_amount"] == 3_000_000
+    for logs in lifecycle[2:]:
+        source.append({"rnd": source.last_round() + 1, "ts": 1_000 * (source.last_round() + 1), "txns": [
+            _call(POOL, *logs),
+        ]})
+    assert writer.sync(source) == 3
+    history = History(path)
+    assert list(history["round"]) == [1, 2, 3, 4, 4]
+    assert history["funded_ts"][-1] == 2_000
+    assert writer.sync(source) == 0
+
+
+def test_factory_apps_are_exported_and_remembered(tmp_path):
+    path = tmp_path / "history"
+    setup = _log("LoanSetup", 0, 2, 7, 8)
+    blocks = [
+        [_call(FACTORY, inner=[_create(30, setup)])],
+        [_call(30, _log("LoanFunded", 0, LENDER, 3_000_000, 6_000_000, 60))],
+    ]
+    source = _write_blocks(tmp_path / "blocks.jsonl", blocks)
+    writer = HistoryWriter(path, factory_id=FACTORY)
+    assert writer.sync(source, until=1) == 1
+    assert json.loads((path / "meta.json").read_text())["apps"] == [30]
+    # a new writer trusts the app found before
+    assert HistoryWriter(path, factory_id=FACTORY).sync(source) == 1
+    history = History(path)
+    assert list(history["app_id"]) == [30, 30]
+    assert list(history["lend_type"]) == [2, 2]
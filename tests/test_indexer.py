@@ -0,0 +1,162 @@
+"""LoanIndexer over a JSON lines block file."""
+import base64
+import struct
+
+import pytest
+
+from client.events import EVENTS, event_selector
+from client.indexer import FileBlockSource, LoanIndexer
+from client.loan import (
+    LEND_STATUS_FUNDED,
+    LEND_STATUS_LENT,
+    LEND_STATUS_SETUP,
+    encode_address,
+)
+
+POOL = 10
+FACTORY = 20
+LENDER = bytes(range(32))
+BORROWER = bytes(range(32, 64))
+
+
+def _log(name: str, loan_id: int, *values) -> str:
+    args, layout, _ = EVENTS[name]
+    return base64.b64encode(event_selector(name, args) + struct.pack(layout, loan_id, *values)).decode()
+
+
+def _call(app_id: int, *logs: str, inner: list[dict] = ()) -> dict:
+    return {"txn": {"type": "appl", "apid": app_id}, "dt": {"lg": list(logs), "itx": list(inner)}}
+
+
+def _create(app_id: int, *logs: str) -> dict:
+    # an inner app create, the new id is on the apply data
+    return {"txn": {"type": "appl"}, "apid": app_id, "dt": {"lg": list(logs)}}
+
+
+def _write_blocks(path, blocks: list[list[dict]], first_round: int = 1) -> FileBlockSource:
+    source = FileBlockSource(path)
+    for i, txns in enumerate(blocks):
+        source.append({"rnd": first_round + i, "txns": txns})
+    return source
+
+
+def _setup(loan_id: int, lend_asset_id: int = 500) -> str:
+    return _log("LoanSetup", loan_id, 1, 0, lend_asset_id)
+
+
+def _funded(loan_id: int, lend_payback: int = 6_000_000, lend_time: int = 3600) -> str:
+    return _log("LoanFunded", loan_id, LENDER, 3_000_000, lend_payback, lend_time)
+
+
+def _loan(indexer: LoanIndexer, app_id: int, loan_id: int) -> dict:
+    row = indexer.db.execute(
+        "SELECT * FROM loans WHERE app_id = ? AND loan_id = ?", (app_id, loan_id)
+    ).fetchone()
+    return dict(row)
+
+
+def test_needs_app_ids_or_factory(tmp_path):
+    with pytest.raises(ValueError):
+        LoanIndexer(tmp_path / "loans.sqlite")
+
+
+def test_sync_resumes_from_the_stored_round(tmp_path):
+    path = tmp_path / "loans.sqlite"
+    source = _write_blocks(tmp_path / "blocks.jsonl", [
+        [_call(POOL, _setup(1))],
+        [_call(POOL, _funded(1))],
+    ])
+    indexer = LoanIndexer(path, app_ids={POOL})
+    assert indexer.sync(source, batch=1) == 2
+    assert indexer.round == 2
+    indexer.close()
+    source.append({"rnd": 3, "txns": [_call(POOL, _log("LoanLent", 1, BORROWER, 1_000))]})
+    indexer = LoanIndexer(path, app_ids={POOL})
+    assert indexer.sync(source) == 1
+    assert indexer.sync(source) == 0
+    loan = _loan(indexer, POOL, 1)
+    assert (loan["lend_status"], loan["lend_amount"], loan["lend_expiry"]) == (LEND_STATUS_LENT, 3_000_000, 4_600)
+    assert loan["lender"] == encode_address(LENDER)
+    assert loan["borrower"] == encode_address(BORROWER)
+    assert loan["updated_round"] == 3
+
+
+def test_start_skips_earlier_rounds(tmp_path):
+    source = _write_blocks(tmp_path / "blocks.jsonl", [
+        [_call(POOL, _setup(1))],
+        [_call(POOL, _setup(2))],
+        [_call(POOL, _funded(2))],
+    ], first_round=5)
+    indexer = LoanIndexer(tmp_path / "loans.sqlite", app_ids={POOL})
+    assert indexer.sync(source, start=6) == 2
+    assert [row["loan_id"] for row in indexer.db.execute("SELECT loan_id FROM loans")] == [2]
+    # stored rounds are not processed again
+    assert indexer.sync(source, start=0) == 0
+
+
+def test_untrusted_app_logs_are_ignored(tmp_path):
+    source = _write_blocks(tmp_path / "blocks.jsonl", [
+        [_call(99, _setup(1)), _call(POOL, _setup(1))],
+        # a trusted app calling another app
+        [_call(POOL, inner=[_call(99, _funded(1))])],
+    ])
+    indexer = LoanIndexer(tmp_path / "loans.sqlite", app_ids={POOL})
+    assert indexer.sync(source) == 1
+    assert [tuple(row) for row in indexer.db.execute("SELECT app_id, lend_status FROM loans")] == [
+        (POOL, LEND_STATUS_SETUP),
+    ]
+
+
+def test_factory_apps_are_found_and_remembered(tmp_path):
+    path = tmp_path / "loans.sqlite"
+    source = _write_blocks(tmp_path / "blocks.jsonl", [
+        # not the factory, so its app create is not trusted
+        [_call(99, inner=[_create(31, _setup(0))])],
+        [_call(FACTORY, inner=[_create(30, _setup(0))])],
+    ])
+    indexer = LoanIndexer(path, factory_id=FACTORY)
+    assert indexer.sync(source) == 1
+    assert 30 in indexer.app_ids and 31 not in indexer.app_ids
+    indexer.close()
+    source.append({"rnd": 3, "txns": [_call(30, _funded(0))]})
+    indexer = LoanIndexer(path, factory_id=FACTORY)
+    assert indexer.sync(source) == 1
+    assert _loan(indexer, 30, 0)["lend_status"] == LEND_STATUS_FUNDED
+    assert [tuple(row) for row in indexer.db.execute("SELECT * FROM apps")] == [(30, 2)]
+
+
+def test_withdrawn_loan_is_open_to_be_funded_again(tmp_path):
+    source = _write_blocks(tmp_path / "blocks.jsonl", [
+        [_call(POOL, _setup(1), _funded(1))],
+        [_call(POOL, _log("LoanWithdrawn", 1))],
+    ])
+    indexer = LoanIndexer(tmp_path / "loans.sqlite", app_ids={POOL})
+    indexer.sync(source, until=1)
+    assert len(indexer.open_offers(500)) == 1
+    indexer.sync(source)
+    loan = _loan(indexer, POOL, 1)
+    assert loan["lend_status"] == LEND_STATUS_SETUP
+    assert (loan["lender"], loan["lend_amount"], loan["lend_payback"], loan["lend_time"]) == (None, 0, 0, 0)
+    assert loan["lend_asset_id"] == 500
+    assert indexer.open_offers(500) == []
+    assert indexer.loans_by_lender(encode_address(LENDER)) == []
+
+
+def test_expiring_and_open_offers(tmp_path):
+    source = _write_blocks(tmp_path / "blocks.jsonl", [
+        [_call(POOL, *(_setup(loan_id) for loan_id in range(1, 6)), _setup(6, lend_asset_id=501))],
+        [_call(POOL, _funded(1, 7_000_000), _funded(2, 6_500_000), _funded(6), _funded(3, lend_time=100),
+               _funded(4, lend_time=50), _funded(5, lend_time=500))],
+        [_call(POOL, *(_log("LoanLent", loan_id, BORROWER, 1_000) for loan_id in (3, 4, 5)))],
+        # the lender extends loan 5 and loan 4 is repaid
+        [_call(POOL, _log("LoanRolledOver", 5, 900), _log("LoanPaid", 4, 6_000_000, 4))],
+    ])
+    indexer = LoanIndexer(tmp_path / "loans.sqlite", app_ids={POOL})
+    indexer.sync(source)
+    # cheapest lend_payback first
+    assert [row["loan_id"] for row in indexer.open_offers(500)] == [2, 1]
+    assert [row["loan_id"] for row in indexer.open_offers(501)] == [6]
+    assert [(row["loan_id"], row["lend_expiry"]) for row in indexer.expiring(2_000)] == [(3, 1_100), (5, 1_900)]
+    assert [row["loan_id"] for row in indexer.expiring(1_900)] == [3]
+    assert indexer.expiring(1_100) == []
+    assert len(indexer.loans_by_borrower(encode_address(BORROWER))) == 3
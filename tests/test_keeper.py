@@ -0,0 +1,213 @@
+"""Keeper scheduling against an in-process submitter and algod stand-in.
+
+The submitter stand-in records every group it is given. It fails groups that
+hold a loan listed in failing, and it returns the loans listed in over_budget
+unclaimed, as claim_nft_many does when its opcode budget runs out.
+"""
+import base64
+
+import pytest
+
+from client.keeper import AlgodSubmitter, Claim, ClaimCall, ExpiryHeap, Keeper
+from client.loan import bundle_box_name
+
+POOL = 10
+LENDER = "L" * 58
+
+
+def _claim(loan_id: int, expiry: int, app_id: int = POOL, lend_type: int = 1) -> Claim:
+    return Claim(app_id, loan_id, expiry, 1000 + loan_id, LENDER, lend_type)
+
+
+class FakeSubmitter:
+    def __init__(self) -> None:
+        self.groups: list[list[ClaimCall]] = []
+        self.failing: set[tuple[int, int]] = set()
+        self.over_budget: set[tuple[int, int]] = set()
+        self.bundles: dict[tuple[int, int], tuple[int, ...]] = {}
+
+    def submit(self, calls: list[ClaimCall]) -> list[Claim]:
+        self.groups.append(calls)
+        claims = [claim for call in calls for claim in call.claims]
+        if any(claim.key in self.failing for claim in claims):
+            raise RuntimeError("logic eval error")
+        return [claim for claim in claims if claim.key in self.over_budget]
+
+    def bundle(self, app_id: int, loan_id: int) -> tuple[int, ...]:
+        return self.bundles.get((app_id, loan_id), ())
+
+    def submitted(self) -> list[tuple[int, int]]:
+        return [claim.key for calls in self.groups for call in calls for claim in call.claims]
+
+
+class FakeIndexer:
+    def __init__(self, claims: list[Claim]) -> None:
+        self.claims = claims
+
+    def expiring(self, before: int) -> list[dict]:
+        return [
+            {
+                "app_id": claim.app_id,
+                "loan_id": claim.loan_id,
+                "lend_expiry": claim.expiry,
+                "lend_asset_id": claim.lend_asset_id,
+                "lender": claim.lender,
+                "lend_type": claim.lend_type,
+                "lend_payment_asset_id": claim.lend_payment_asset_id,
+                "lend_paid": claim.lend_paid,
+            }
+            for claim in self.claims
+            if claim.expiry < before
+        ]
+
+
+def test_expiry_heap_pops_in_expiry_order():
+    heap = ExpiryHeap()
+    for loan_id, expiry in ((1, 30), (2, 10), (3, 20), (4, 40)):
+        heap.push(_claim(loan_id, expiry))
+    # moving a loan leaves a stale entry that is skipped
+    heap.push(_claim(4, 5))
+    heap.remove((POOL, 3))
+    assert heap.next_expiry() == 5
+    assert [claim.loan_id for claim in heap.pop_expired(31)] == [4, 2, 1]
+    assert len(heap) == 0
+    assert heap.next_expiry() is None
+
+
+def test_tick_claims_only_expired_loans():
+    submitter = FakeSubmitter()
+    keeper = Keeper(submitter, [POOL], margin=0)
+    keeper.track(_claim(1, 100))
+    keeper.track(_claim(2, 200))
+    assert keeper.tick(150) == 1
+    assert submitter.submitted() == [(POOL, 1)]
+    assert keeper.next_wakeup(150) == 201
+
+
+def test_failing_claim_is_isolated_and_backed_off():
+    submitter = FakeSubmitter()
+    submitter.failing.add((POOL, 2))
+    keeper = Keeper(submitter, [POOL], margin=0, claims_per_call=4, backoff=2.0)
+    for loan_id in (1, 2, 3):
+        keeper.track(_claim(loan_id, 100))
+    assert keeper.tick(101) == 0
+    assert all(claim.isolate and claim.not_before == 103 for claim in keeper.ready)
+    # nothing is retried before the backoff
+    assert keeper.tick(102) == 0
+    assert len(submitter.groups) == 1
+    assert keeper.tick(103) == 2
+    assert [[claim.loan_id for call in calls for claim in call.claims] for calls in submitter.groups[1:]] == [
+        [1], [2], [3],
+    ]
+    assert [claim.not_before for claim in keeper.ready] == [103 + 4]
+
+
+def test_claim_dropped_after_max_attempts():
+    submitter = FakeSubmitter()
+    submitter.failing.add((POOL, 1))
+    keeper = Keeper(submitter, [POOL], margin=0, max_attempts=3, backoff=1.0)
+    keeper.track(_claim(1, 100))
+    now = 100
+    while keeper.ready or len(keeper.heap):
+        now = keeper.next_wakeup(now)
+        keeper.tick(now)
+    assert [claim.loan_id for claim in keeper.dropped] == [1]
+    assert len(submitter.groups) == 3
+    # not tracked again until pending_time has passed
+    keeper.track(_claim(1, 100))
+    assert len(keeper.heap) == 0
+    keeper.tick(now + keeper.pending_time)
+    keeper.track(_claim(1, 100))
+    assert len(keeper.heap) == 1
+
+
+def test_budget_requeue_is_not_an_attempt_but_is_bounded():
+    submitter = FakeSubmitter()
+    submitter.over_budget.add((POOL, 2))
+    keeper = Keeper(submitter, [POOL], margin=0, claims_per_call=2, max_requeues=3)
+    keeper.track(_claim(1, 100))
+    keeper.track(_claim(2, 100))
+    assert keeper.tick(101) == 1
+    [claim] = keeper.ready
+    assert (claim.loan_id, claim.attempts, claim.requeues) == (2, 0, 1)
+    # requeued claims go out again on the next tick
+    assert keeper.next_wakeup(101) == 101
+    keeper.tick(102)
+    keeper.tick(103)
+    assert keeper.ready == []
+    assert [claim.loan_id for claim in keeper.dropped] == [2]
+    assert submitter.submitted() == [(POOL, 1), (POOL, 2), (POOL, 2), (POOL, 2)]
+
+
+def test_max_groups_bounds_a_tick():
+    submitter = FakeSubmitter()
+    keeper = Keeper(submitter, margin=0, max_groups=2)
+    for loan_id in range(40):
+        keeper.track(_claim(loan_id, 100, app_id=100 + loan_id))
+    assert keeper.tick(101) == 32
+    assert len(keeper.ready) == 8
+    assert keeper.tick(102) == 8
+
+
+def test_pool_calls_are_sized_by_worst_case_budget():
+    submitter = FakeSubmitter()
+    keeper = Keeper(submitter, [POOL], margin=0, claims_per_call=4, max_opups=2)
+    single = [_claim(loan_id, 100) for loan_id in (1, 2, 3)]
+    bundle = _claim(4, 100)
+    bundle.bundle = tuple(range(500, 508))
+    for claim in (*single, bundle):
+        keeper.track(claim)
+    assert keeper.tick(101) == 4
+    [calls] = submitter.groups
+    # the bundle needs 8 * 400 + 100 of budget,
+    # more than 2 opups add to its 2 app calls
+    assert [[claim.loan_id for claim in call.claims] for call in calls] == [[1, 2, 3], [4]]
+    assert [call.opups for call in calls] == [0, 3]
+    assert calls[1].inner_txns() == 8 + 3
+
+
+def test_load_forgets_claims_no_longer_lent():
+    submitter = FakeSubmitter()
+    claim = _claim(1, 100)
+    indexer = FakeIndexer([claim])
+    keeper = Keeper(submitter, [POOL], margin=0)
+    keeper.load(indexer)
+    assert keeper.tick(101) == 1
+    # the index has not seen the claim yet
+    keeper.load(indexer)
+    assert len(keeper.heap) == 0
+    assert (POOL, 1) in keeper._submitted
+    indexer.claims = []
+    keeper.load(indexer)
+    assert keeper._submitted == {}
+
+
+def test_load_reads_bundles_and_skips_foreign_asa_loans():
+    submitter = FakeSubmitter()
+    submitter.bundles[(POOL, 1)] = (7, 8, 9)
+    foreign = _claim(2, 100, app_id=20, lend_type=2)
+    keeper = Keeper(submitter, [POOL], address="K" * 58)
+    keeper.load(FakeIndexer([_claim(1, 100), foreign]))
+    assert keeper.heap.get((POOL, 1)).lend_asset_ids == (7, 8, 9)
+    assert (20, 2) not in keeper.heap
+
+
+class FakeAlgod:
+    def __init__(self, boxes: dict[tuple[int, bytes], bytes]) -> None:
+        self.boxes = boxes
+
+    def application_box_by_name(self, app_id: int, name: bytes) -> dict:
+        from algosdk.error import AlgodHTTPError
+
+        if (app_id, name) not in self.boxes:
+            raise AlgodHTTPError("box not found", 404)
+        return {"value": base64.b64encode(self.boxes[app_id, name]).decode()}
+
+
+def test_algod_submitter_reads_bundle_box():
+    pytest.importorskip("algosdk")
+    value = b"".join(asset.to_bytes(8, "big") for asset in (7, 8))
+    algod = FakeAlgod({(POOL, bundle_box_name(1)): (2).to_bytes(2, "big") + value})
+    submitter = AlgodSubmitter(algod, LENDER, None, None, None)
+    assert submitter.bundle(POOL, 1) == (7, 8)
+    assert submitter.bundle(POOL, 2) == ()
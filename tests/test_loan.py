@@ -0,0 +1,26 @@
+"""lend_expiry of Loan, the packed record stream and LoanFrame."""
+import pytest
+
+from client.analytics import LoanFrame
+from client.loan import LEND_STATUS_FUNDED, LEND_STATUS_LENT, ZERO_ADDRESS, Loan, encode_loan
+from client.stream import iter_loans
+
+FUNDED = Loan(ZERO_ADDRESS, ZERO_ADDRESS, 1, LEND_STATUS_FUNDED, 0, 500, 3_000_000, 0, 6_000_000, 0, 3600)
+LENT = FUNDED._replace(lend_status=LEND_STATUS_LENT, lend_date=1_000)
+
+
+@pytest.mark.parametrize("loan, expected", [
+    # not lent yet, so there is no expiry
+    (FUNDED, 0),
+    (LENT, 4_600),
+])
+def test_lend_expiry(loan, expected):
+    assert loan.lend_expiry == expected
+    assert next(iter_loans(encode_loan(loan))).lend_expiry == expected
+    assert list(LoanFrame.from_loans([(1, 1, loan)]).lend_expiry()) == [expected]
+
+
+def test_lend_expiry_of_packed_frame():
+    frame = LoanFrame.from_records(encode_loan(FUNDED) + encode_loan(LENT))
+    assert list(frame.lend_expiry()) == [0, 4_600]
+    assert frame.lend_expiry().dtype == frame.lend_date.dtype
@@ -0,0 +1,155 @@
+"""Preflight caching against an in-process simulate endpoint.
+
+The stand-in answers status and simulate like algod. Every simulate is
+counted, and a group whose first app argument is b"fail" fails the way a
+failed assert does.
+"""
+import asyncio
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("algosdk")
+
+import msgpack  # noqa: E402
+from algosdk import account, transaction  # noqa: E402
+
+from client import preflight as preflight_module  # noqa: E402
+from client.preflight import Preflight, PreflightError, group_digest  # noqa: E402
+
+APP_ID = 1234
+SENDER = account.generate_account()[1]
+
+
+class FakeAlgod:
+    def __init__(self) -> None:
+        self.round = 100
+        self.last_round = 0
+        self.simulations = 0
+        self.status_calls = 0
+
+    async def status(self) -> dict:
+        self.status_calls += 1
+        self.last_round = max(self.last_round, self.round)
+        return {"last-round": self.round}
+
+    async def simulate(self, request: bytes) -> dict:
+        self.simulations += 1
+        decoded = msgpack.unpackb(request, raw=False, strict_map_key=False)
+        txn = decoded["txn-groups"][0]["txns"][0]["txn"]
+        group = {"app-budget-consumed": 42}
+        if txn.get("apaa", [b""])[0] == b"fail":
+            group["failure-message"] = "transaction rejected by ApprovalProgram: logic eval error: assert failed pc=12"
+            group["failed-at"] = [0]
+        return {"last-round": self.round, "txn-groups": [group]}
+
+
+def _sp(first: int = 100) -> transaction.SuggestedParams:
+    return transaction.SuggestedParams(
+        fee=1000,
+        first=first,
+        last=first + 1000,
+        gh=base64.b64encode(bytes(32)).decode(),
+        flat_fee=True,
+    )
+
+
+def _call(arg: bytes = b"claim", first: int = 100, note: bytes | None = None) -> transaction.ApplicationNoOpTxn:
+    return transaction.ApplicationNoOpTxn(SENDER, _sp(first), APP_ID, [arg], note=note)
+
+
+def _check(preflight: Preflight, *txns) -> object:
+    return asyncio.run(preflight.check(list(txns)))
+
+
+def test_repeated_check_is_a_cache_hit():
+    algod = FakeAlgod()
+    preflight = Preflight(algod)
+    first = _check(preflight, _call())
+    second = _check(preflight, _call())
+    assert (first.ok, first.cached, first.opcode_cost, first.round) == (True, False, 42, 100)
+    assert (second.ok, second.cached) == (True, True)
+    assert algod.simulations == 1
+    assert (preflight.hits, preflight.misses) == (1, 1)
+
+
+def test_new_app_version_is_a_miss():
+    algod = FakeAlgod()
+    preflight = Preflight(algod)
+    _check(preflight, _call())
+    preflight.invalidate(APP_ID)
+    assert not _check(preflight, _call()).cached
+    # other apps do not change the key
+    preflight.invalidate(APP_ID + 1)
+    assert _check(preflight, _call()).cached
+    assert algod.simulations == 2
+
+
+def test_new_round_expires_a_result():
+    algod = FakeAlgod()
+    preflight = Preflight(algod, round_ttl=0)
+    _check(preflight, _call())
+    algod.round += 1
+    assert not _check(preflight, _call()).cached
+    assert _check(preflight, _call()).round == 101
+    assert algod.simulations == 2
+
+
+def test_digest_ignores_validity_group_and_note():
+    txn = _call()
+    renewed = _call(first=150, note=b"retry")
+    grouped = [_call(), _call(b"pay")]
+    transaction.assign_group_id(grouped)
+    assert group_digest([txn]) == group_digest([renewed])
+    assert group_digest([txn, _call(b"pay")]) == group_digest(grouped)
+    assert group_digest([txn]) != group_digest([_call(b"pay")])
+    # a renewed group is answered from the cache
+    algod = FakeAlgod()
+    preflight = Preflight(algod)
+    _check(preflight, txn)
+    assert _check(preflight, renewed).cached
+    assert algod.simulations == 1
+
+
+def test_max_rounds_keeps_a_result_for_a_window():
+    algod = FakeAlgod()
+    preflight = Preflight(algod, max_rounds=2, round_ttl=0)
+    _check(preflight, _call())
+    for _ in range(2):
+        algod.round += 1
+        assert _check(preflight, _call()).cached
+    algod.round += 1
+    assert not _check(preflight, _call()).cached
+    assert algod.simulations == 2
+
+
+def test_round_is_read_again_after_round_ttl(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(preflight_module, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    algod = FakeAlgod()
+    preflight = Preflight(algod, round_ttl=5.0)
+    _check(preflight, _call())
+    # the first hit reads the round
+    assert _check(preflight, _call()).cached
+    algod.round += 1
+    # the known round is fresh, so the result holds
+    now[0] += 5.0
+    assert _check(preflight, _call()).cached
+    assert algod.status_calls == 1
+    now[0] += 0.5
+    assert not _check(preflight, _call()).cached
+    assert algod.status_calls == 2
+
+
+def test_failed_group_is_cached_and_raised():
+    algod = FakeAlgod()
+    preflight = Preflight(algod)
+    result = _check(preflight, _call(b"fail"))
+    assert (result.ok, result.failed_at, result.app_id, result.pc) == (False, (0,), APP_ID, 12)
+    # no approval teal was registered to name it
+    assert result.assertion is None
+    with pytest.raises(PreflightError) as e:
+        asyncio.run(preflight.require([_call(b"fail")]))
+    assert e.value.result.cached
+    assert algod.simulations == 1
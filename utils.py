@@ -1,15 +1,34 @@
 from algopy import (
     Account,
     Asset,
+    Bytes,
     Global,
+    OnCompleteAction,
     Txn,
     UInt64,
+    arc4,
     gtxn,
     itxn,
     op,
     subroutine,
 )
 
+##############################################
+# function: require_payment_txn (internal)
+# arguments:
+# - who, the expected sender
+# - payment, the payment transaction
+# purpose: check payment
+# pre-conditions: None
+# post-conditions: None
+# returns: payment amount
+##############################################
+@subroutine
+def require_payment_txn(who: Account, payment: gtxn.PaymentTransaction) -> UInt64:
+    assert payment.sender == who, "payment sender accurate"
+    assert payment.receiver == Global.current_application_address, "payment receiver accurate"
+    return payment.amount
+
 ##############################################
 # function: require_payment (internal)
 # arguments: None
@@ -22,9 +41,25 @@ def require_payment(who: Account, rel_group_index: UInt64) -> UInt64:
     ref_group_index = Txn.group_index
     assert ref_group_index > 0, "group index greater than zero"
     payment_group_index = ref_group_index - rel_group_index
-    assert gtxn.PaymentTransaction(payment_group_index).sender == who, "payment sender accurate"
-    assert gtxn.PaymentTransaction(payment_group_index).receiver == Global.current_application_address, "payment receiver accurate"
-    return gtxn.PaymentTransaction(payment_group_index).amount
+    return require_payment_txn(who, gtxn.PaymentTransaction(payment_group_index))
+
+##############################################
+# function: require_asset_transfer_txn (internal)
+# arguments:
+# - who, the expected sender
+# - axfer, the asset transfer transaction
+# - asset, the expected asset
+# purpose: check asset transfer
+# pre-conditions: None
+# post-conditions: None
+# returns: asset amount
+##############################################
+@subroutine
+def require_asset_transfer_txn(who: Account, axfer: gtxn.AssetTransferTransaction, asset: Asset) -> UInt64:
+    assert axfer.sender == who, "axfer sender accurate"
+    assert axfer.asset_receiver == Global.current_application_address, "axfer receiver accurate"
+    assert axfer.xfer_asset == asset, "axfer asset accurate"
+    return axfer.asset_amount
 
 ##############################################
 # function: require_payment (internal)
@@ -38,10 +73,32 @@ def require_asset_transfer(who: Account, rel_group_index: UInt64, asset: Asset)
     ref_group_index = Txn.group_index
     assert ref_group_index > 0, "group index greater than zero"
     payment_group_index = ref_group_index - rel_group_index
-    assert gtxn.AssetTransferTransaction(payment_group_index).sender == who, "axfer sender accurate"
-    assert gtxn.AssetTransferTransaction(payment_group_index).asset_receiver == Global.current_application_address, "axfer receiver accurate"
-    assert gtxn.AssetTransferTransaction(payment_group_index).xfer_asset == asset, "axfer asset accurate"
-    return gtxn.AssetTransferTransaction(payment_group_index).asset_amount
+    return require_asset_transfer_txn(who, gtxn.AssetTransferTransaction(payment_group_index), asset)
+
+##############################################
+# function: require_lend_payment (internal)
+# arguments:
+# - who, the expected sender
+# - payment, the transaction argument
+# - lend_type, 1 network, 2 asa, 3 arc200
+# - asset, the payment asset of asa loans
+# purpose: check a payment by lend_type
+# pre-conditions: None
+# post-conditions: None
+# returns: amount paid, 0 for arc200 loans
+# notes:
+# - arc200 loans take a 0 pay from who, so the
+#   payer signs the group, the tokens move by
+#   allowance
+##############################################
+@subroutine
+def require_lend_payment(who: Account, payment: gtxn.Transaction, lend_type: UInt64, asset: Asset) -> UInt64:
+    if lend_type == UInt64(2):
+        return require_asset_transfer_txn(who, gtxn.AssetTransferTransaction(payment.group_index), asset)
+    payment_amount = require_payment_txn(who, gtxn.PaymentTransaction(payment.group_index))
+    if lend_type == UInt64(3):
+        assert payment_amount == UInt64(0), "payment amount accurate"
+    return payment_amount
 
 ##############################################
 # function: get_available_balance (internal)
@@ -66,4 +123,111 @@ def app_asset_opt_in(asset: Asset) -> None:
     itxn.AssetTransfer(
         asset_receiver=Global.current_application_address,
         xfer_asset=asset,
-    ).submit()
\ No newline at end of file
+    ).submit()
+
+##############################################
+# function: opup (internal)
+# purpose: add one app call's opcode budget
+# pre-conditions:
+# - fee credit in the group covers one more
+#   inner transaction
+# post-conditions: opcode budget increased
+# notes:
+# - creates and deletes an app whose programs
+#   are pushint 1, paid from group fee credit
+##############################################
+@subroutine
+def opup() -> None:
+    itxn.ApplicationCall(
+        approval_program=Bytes.from_hex("068101"),
+        clear_state_program=Bytes.from_hex("068101"),
+        on_completion=OnCompleteAction.DeleteApplication,
+        fee=0,
+    ).submit()
+
+##############################################
+# function: reserve_budget (internal)
+# arguments:
+# - required, the opcode budget needed
+# - max_opups, the most opups allowed
+# purpose: top up the opcode budget only when
+#          the pooled budget falls short
+# returns:
+# - whether the budget is now available
+# - the number of opups made
+# notes:
+# - padding the group with more app calls
+#   raises the pooled budget and saves opups
+##############################################
+@subroutine
+def reserve_budget(required: UInt64, max_opups: UInt64) -> tuple[bool, UInt64]:
+    opups = UInt64(0)
+    while Global.opcode_budget() < required and opups < max_opups:
+        opup()
+        opups += 1
+    return Global.opcode_budget() >= required, opups
+
+##############################################
+# function: budget_used (internal)
+# arguments:
+# - budget, Global.opcode_budget() before
+# purpose: measure the budget spent since
+# returns: budget used, 0 if inner app calls
+#          added more than was spent
+##############################################
+@subroutine
+def budget_used(budget: UInt64) -> UInt64:
+    remaining = Global.opcode_budget()
+    if remaining >= budget:
+        return UInt64(0)
+    return budget - remaining
+
+##############################################
+# function: arc200_transfer_from (internal)
+# arguments:
+# - token_id, the arc200 application id
+# - sender, the account to transfer from
+# - receiver, the account to transfer to
+# - amount, the amount to transfer
+# purpose: transfer arc200 using allowance
+# post-conditions: amount transferred
+# notes:
+# - a token may return false instead of
+#   failing, so the return is checked
+##############################################
+@subroutine
+def arc200_transfer_from(token_id: UInt64, sender: Account, receiver: Account, amount: UInt64) -> None:
+    arc200_transferFrom_call = itxn.ApplicationCall(
+        app_id=token_id,
+        app_args=(
+            arc4.arc4_signature("arc200_transferFrom(address,address,uint256)bool"),
+            sender,
+            receiver,
+            arc4.UInt256(amount)
+        ),
+    ).submit()
+    assert arc4.Bool.from_log(arc200_transferFrom_call.last_log).native, "arc200_transferFrom accurate"
+
+##############################################
+# function: arc200_transfer (internal)
+# arguments:
+# - token_id, the arc200 application id
+# - receiver, the account to transfer to
+# - amount, the amount to transfer
+# purpose: transfer arc200 held by the app
+# post-conditions: amount transferred
+# notes:
+# - a token may return false instead of
+#   failing, so the return is checked
+##############################################
+@subroutine
+def arc200_transfer(token_id: UInt64, receiver: Account, amount: UInt64) -> None:
+    arc200_transfer_call = itxn.ApplicationCall(
+        app_id=token_id,
+        app_args=(
+            arc4.arc4_signature("arc200_transfer(address,uint256)bool"),
+            receiver,
+            arc4.UInt256(amount)
+        ),
+    ).submit()
+    assert arc4.Bool.from_log(arc200_transfer_call.last_log).native, "arc200_transfer accurate"